@@ -0,0 +1,457 @@
+import argparse
+import hashlib
+import itertools
+import math
+import time
+from dataclasses import dataclass, fields, replace
+
+import numpy as np
+
+from hologram import fft2
+from phase_slm_pattern import GRAY_LEVELS
+
+# *  Automatic alignment: coarse-to-fine search of the pattern state against a camera
+
+
+@dataclass(frozen=True)
+class Range:
+    """
+    A numeric state field searched on a grid that shrinks around the best values.
+    """
+
+    name: str
+    span: float  # Width of the first, coarsest grid, centred on the start value
+    resolution: float  # Refinement stops at this step; values are snapped to multiples of it
+    step: float = None  # Step of the coarsest grid; defaults to span / (points - 1)
+
+
+@dataclass(frozen=True)
+class Choice:
+    """
+    A state field with a few discrete values, all tried on the coarsest grid.
+
+    Screened choices (e.g. flips) are first compared on a sparser grid, and only the
+    best of their combinations is searched on the full coarsest grid.
+    """
+
+    name: str
+    values: tuple
+    screened: bool = False
+
+
+def _snap(value, start, resolution, integer):
+    value = start + round((value - start) / resolution) * resolution
+    return int(round(value)) if integer else round(value, 6)
+
+
+class _Evaluator:
+    # Renders candidate states, skips frames that were already measured, and sends
+    # the rest to the camera in batches of `batch_size`
+
+    def __init__(self, render, capture, score, batch_size):
+        self.render = render
+        self.capture = capture
+        self.score = score
+        self.batch_size = batch_size
+        self.batch = None
+        self.by_state = {}  # State -> score
+        self.by_frame = {}  # Frame digest -> score
+        self.rendered = 0
+        self.captured = 0
+
+    def __call__(self, states):
+        states = [state for state in dict.fromkeys(states) if state not in self.by_state]
+        waiting = []  # (digest, states with that frame) of the batch being filled
+        slots = {}
+        for state in states:
+            frame = self.render(state)
+            self.rendered += 1
+            if self.batch is None:
+                self.batch = np.empty((self.batch_size,) + frame.shape, dtype=np.uint8)
+            # Renderers reuse their output buffer (or return a strided view of one), so
+            # the frame is copied into the next free batch slot before hashing
+            slot = self.batch[len(waiting)]
+            slot[:] = frame
+            digest = hashlib.blake2b(slot, digest_size=16).digest()
+            if digest in self.by_frame:
+                self.by_state[state] = self.by_frame[digest]
+                continue
+            if digest in slots:
+                waiting[slots[digest]][1].append(state)
+                continue
+            slots[digest] = len(waiting)
+            waiting.append((digest, [state]))
+            if len(waiting) == self.batch_size:
+                self._measure(waiting)
+                waiting, slots = [], {}
+        if waiting:
+            self._measure(waiting)
+        return {state: self.by_state[state] for state in states}
+
+    def _measure(self, waiting):
+        images = self.capture(self.batch[: len(waiting)])
+        self.captured += len(waiting)
+        for (digest, states), image in zip(waiting, images):
+            score = float(self.score(image))
+            self.by_frame[digest] = score
+            for state in states:
+                self.by_state[state] = score
+
+
+def align(
+    state,
+    render,
+    capture,
+    score,
+    ranges,
+    choices=(),
+    points=5,
+    keep=3,
+    batch_size=8,
+    screen=2,
+    verbose=True,
+):
+    """
+    Finds the pattern state whose camera image scores highest, coarse to fine.
+
+    The first level tries every combination of the `choices` with a grid per range
+    spanning `Range.span` around the start state. Each further level puts a grid of
+    `points` values at half the previous step around each of the `keep` best states
+    so far, until every range is at its resolution. The coarse step has to be finer
+    than the features of the pattern, or the grid can step over the optimum. Keeping
+    several candidates guards against settling on a side lobe of the score.
+
+    When some choices are screened, a first level tries every combination of the
+    choices on a grid `screen` times sparser, and the coarsest level then only covers
+    the combination of screened values that scored best. With flips screened, this
+    keeps the cost of the coarsest level close to that of a search without flips. The
+    screening grid has to be finer than the features of the pattern as well.
+
+    Limitations: the discrete choices (scale, flips) are only compared on the coarsest
+    grid, and the finer levels refine the positions of the `keep` best candidates
+    without revisiting them. The search therefore needs a score that varies smoothly
+    over the coarse step, as it does for masks with smooth phase. For a mask with
+    pixel-scale features (e.g. random values) the score is flat away from the exact
+    state, the coarsest level can pick the wrong scale or flip, and no later level
+    recovers; use a smaller coarse step and a larger `keep` there. Offsets are only
+    found up to a period of the tiled cell: states a period apart render the same
+    frame and score the same.
+
+    A frame identical to one already measured (e.g. an offset one period further, or
+    a flip that does not change the pattern) is not captured again, and candidates are
+    captured in batches so that a camera or simulation can overlap its work.
+
+    Args:
+        state: Start state, a frozen dataclass such as `TiledMaskState`.
+        render (callable): render(state) -> 2-D uint8 frame. The frame may be a reused
+                           buffer; it is copied before the next render.
+        capture (callable): capture(frames) -> images, one camera image per frame of the
+                            (n, height, width) uint8 array, e.g. `SimulatedCamera.capture`
+                            or `display_capture`.
+        score (callable): score(image) -> float, higher is better, e.g. `correlation_score`.
+        ranges (list): `Range` per numeric field searched.
+        choices (list): `Choice` per discrete field searched.
+        points (int): Grid points per range on the coarsest level (unless the range
+                      sets its step) and on every finer one; odd, so the centre is kept.
+        keep (int): Candidates refined at each level.
+        batch_size (int): Frames passed to one `capture` call.
+        screen (int): Step factor of the screening grid of screened choices.
+        verbose (bool): Print the best state after each level.
+
+    Returns:
+        tuple: (best state, report dict with its score, the per-level best scores and
+               the number of rendered and captured frames).
+    """
+    if points < 3 or points % 2 == 0:
+        raise ValueError("points must be an odd number of at least 3")
+    start_time = time.perf_counter()
+    types = {field.name: field.type for field in fields(state)}
+    starts = {r.name: getattr(state, r.name) for r in ranges}
+    integer = {r.name: types[r.name] in (int, "int") for r in ranges}
+    evaluate = _Evaluator(render, capture, score, batch_size)
+
+    def grid(center, r, step, count):
+        if step <= 0:
+            return [getattr(center, r.name)]
+        values = getattr(center, r.name) + step * np.arange(-(count // 2), count // 2 + 1)
+        snapped = (_snap(v, starts[r.name], r.resolution, integer[r.name]) for v in values)
+        return list(dict.fromkeys(snapped))
+
+    def candidates(center, steps, counts):
+        axes = [grid(center, r, steps[r.name], counts[r.name]) for r in ranges]
+        for values in itertools.product(*axes):
+            yield replace(center, **dict(zip((r.name for r in ranges), values)))
+
+    steps = {r.name: r.step or r.span / (points - 1) for r in ranges}
+    counts = {r.name: 2 * math.ceil(r.span / 2 / steps[r.name]) + 1 for r in ranges}
+    centers = [
+        replace(state, **dict(zip((c.name for c in choices), values)))
+        for values in itertools.product(*(c.values for c in choices))
+    ]
+    scores = {}
+    levels = []
+    screened = [c.name for c in choices if c.screened]
+    if screened:
+        screen_steps = {name: step * screen for name, step in steps.items()}
+        screen_counts = {
+            r.name: 2 * math.ceil(r.span / 2 / screen_steps[r.name]) + 1 for r in ranges
+        }
+        level = [s for center in centers for s in candidates(center, screen_steps, screen_counts)]
+        scores.update(evaluate(level))
+        best = max(level, key=scores.get)
+        centers = [c for c in centers if all(getattr(c, n) == getattr(best, n) for n in screened)]
+        if verbose:
+            values = ", ".join(f"{n}={getattr(best, n)}" for n in screened)
+            print(f"Screening: kept {values}, {evaluate.captured} frames captured")
+    while True:
+        level = [s for center in centers for s in candidates(center, steps, counts)]
+        scores.update(evaluate(level))
+        centers = sorted(scores, key=scores.get, reverse=True)[:keep]
+        levels.append(scores[centers[0]])
+        if verbose:
+            print(
+                f"Level {len(levels)}: best {centers[0]} scores {scores[centers[0]]:.4f}, "
+                f"{evaluate.captured} frames captured"
+            )
+        if all(steps[r.name] <= r.resolution for r in ranges):
+            break
+        # Halve the step; a range at its resolution keeps only its current value
+        steps = {
+            r.name: 0 if steps[r.name] <= r.resolution else max(steps[r.name] / 2, r.resolution)
+            for r in ranges
+        }
+        counts = dict.fromkeys(counts, points)
+
+    best = centers[0]
+    return best, {
+        "score": scores[best],
+        "levels": levels,
+        "rendered": evaluate.rendered,
+        "captured": evaluate.captured,
+        "elapsed_s": time.perf_counter() - start_time,
+    }
+
+
+def correlation_score(reference):
+    """
+    Returns a score callback: the normalized correlation of an image with `reference`,
+    1.0 for an image matching it up to brightness and offset.
+    """
+    reference = np.asarray(reference, dtype=np.float32)
+    reference = reference - reference.mean()
+    reference /= np.linalg.norm(reference) or 1.0
+
+    def score(image):
+        image = np.asarray(image, dtype=np.float32)
+        image = image - image.mean()
+        norm = np.linalg.norm(image)
+        return 0.0 if norm == 0 else float(np.vdot(reference, image) / norm)
+
+    return score
+
+
+def region_score(top, bottom, left, right):
+    """
+    Returns a score callback: the fraction of an image's total intensity that falls
+    in rows [top, bottom) and columns [left, right), e.g. around a diffraction order.
+    """
+
+    def score(image):
+        total = float(np.sum(image, dtype=np.float64))
+        return 0.0 if total == 0 else float(image[top:bottom, left:right].sum()) / total
+
+    return score
+
+
+def display_capture(sink, grab, settle_s=0.05):
+    """
+    Returns a capture callback for real hardware: each frame is presented on the SLM,
+    and `grab()` reads the camera once the liquid crystal has settled.
+
+    Args:
+        sink: Output sink of the SLM screen, e.g. `OpenCVWindowSink`.
+        grab (callable): Returns one camera image as a 2-D array.
+        settle_s (float): Wait between presenting a frame and grabbing the image.
+    """
+
+    def capture(frames):
+        images = []
+        for frame in frames:
+            sink.present(frame)
+            sink.wait_key(1)  # Let the GUI paint the frame
+            time.sleep(settle_s)
+            images.append(grab())
+        return images
+
+    return capture
+
+
+def gaussian_beam(width, height, x_center, y_center, waist):
+    """
+    Returns the amplitude of a Gaussian beam on the SLM, shape (height, width).
+    """
+    y = ((np.arange(height, dtype=np.float32) - y_center) / waist) ** 2
+    x = ((np.arange(width, dtype=np.float32) - x_center) / waist) ** 2
+    return np.exp(-(y[:, None] + x[None, :]))
+
+
+def modulation_levels(modulation):
+    """
+    Returns the complex field of every gray level, as a lookup table of GRAY_LEVELS
+    entries: exp(2j*pi*g/256) for "phase" modulation, g/255 for "amplitude".
+    """
+    levels = np.arange(GRAY_LEVELS, dtype=np.float32)
+    if modulation == "phase":
+        return np.exp(2j * np.pi * levels / GRAY_LEVELS).astype(np.complex64)
+    if modulation == "amplitude":
+        return (levels / (GRAY_LEVELS - 1)).astype(np.complex64)
+    raise ValueError(f"Unknown modulation: {modulation}")
+
+
+class SimulatedCamera:
+    """
+    Stand-in for a camera in the Fourier plane of the SLM, for testing alignment.
+
+    A frame sets the phase (or amplitude) of the illuminating field pixel by pixel,
+    and the image is the intensity of its 2-D FFT, shifted so the zero order is in the
+    centre. Only the rectangle where the illumination is not negligible is transformed,
+    and frames are processed in batches through preallocated complex buffers.
+
+    Args:
+        illumination (numpy.ndarray): Field on the SLM, shape (height, width), e.g. a
+                                      `gaussian_beam` times an imaged object.
+        modulation (str): "phase" or "amplitude", see `modulation_levels`.
+        noise (float): Standard deviation of Gaussian noise, relative to the peak intensity.
+        seed (int, optional): Seed of the noise.
+        batch (int): Frames transformed together.
+        workers (int): FFT threads, see `hologram.HologramEngine`.
+        threshold (float): Illumination intensity, relative to its peak, below which
+                           the field is dropped.
+    """
+
+    def __init__(
+        self,
+        illumination,
+        modulation="phase",
+        noise=0.0,
+        seed=None,
+        batch=8,
+        workers=-1,
+        threshold=1e-6,
+    ):
+        illumination = np.asarray(illumination)
+        intensity = np.abs(illumination) ** 2
+        rows = np.flatnonzero(intensity.max(axis=1) > threshold * intensity.max())
+        cols = np.flatnonzero(intensity.max(axis=0) > threshold * intensity.max())
+        self.window = (slice(rows[0], rows[-1] + 1), slice(cols[0], cols[-1] + 1))
+        self.illumination = illumination[self.window].astype(np.complex64)
+
+        self.levels = modulation_levels(modulation)
+        self.noise = noise
+        self.rng = np.random.default_rng(seed)
+        self.workers = workers
+        self.field = np.empty((batch,) + self.illumination.shape, dtype=np.complex64)
+
+    @property
+    def shape(self):
+        """
+        Shape (height, width) of the captured images.
+        """
+        return self.illumination.shape
+
+    def capture(self, frames):
+        """
+        Returns the far-field intensity of each frame, as a (n, height, width) float32 array.
+        """
+        frames = np.asarray(frames)
+        if frames.ndim == 2:
+            frames = frames[None]
+        images = np.empty((len(frames),) + self.shape, dtype=np.float32)
+        for start in range(0, len(frames), len(self.field)):
+            chunk = frames[start : start + len(self.field)]
+            field = self.field[: len(chunk)]
+            np.take(self.levels, chunk[(slice(None),) + self.window], out=field)
+            field *= self.illumination
+            fft2(field, workers=self.workers)
+            out = images[start : start + len(chunk)]
+            np.abs(field, out=out)
+            np.square(out, out=out)
+        images[:] = np.fft.fftshift(images, axes=(-2, -1))
+        if self.noise:
+            peak = images.max(axis=(-2, -1), keepdims=True)
+            images += self.rng.normal(0, self.noise, images.shape).astype(np.float32) * peak
+            np.maximum(images, 0, out=images)  # A sensor reads no negative intensities
+        return images
+
+
+def tiled_mask_search(tiler, deltas, step=8):
+    """
+    Search space for `send_repeated_slm_pattern.TiledMaskState`: offsets over one
+    period of the largest tiled cell, from `step` pixels down to the sub-pixel step,
+    and every scale and flip. The flips are screened, see `align`.
+    """
+    from send_repeated_slm_pattern import SUBPIXEL_STEP
+
+    cell_height, cell_width = tiler.mask.shape
+    ranges = [
+        Range("x_offset", math.ceil(cell_width * max(deltas)), SUBPIXEL_STEP, step),
+        Range("y_offset", math.ceil(cell_height * max(deltas)), SUBPIXEL_STEP, step),
+    ]
+    choices = [
+        Choice("delta_index", tuple(range(len(deltas)))),
+        Choice("flip_horizontal", (False, True), screened=True),
+        Choice("flip_vertical", (False, True), screened=True),
+    ]
+    return ranges, choices
+
+
+if __name__ == "__main__":
+    # Demonstration on a simulated camera: the beam reaching the SLM carries the
+    # conjugate of the mask's phase at a hidden state, so only the right state flattens
+    # the wavefront and focuses the light into the zero order
+    from repeat_pattern import PatternTiler
+    from send_repeated_slm_pattern import DELTAS, TiledMaskState, render_tiled_mask
+
+    parser = argparse.ArgumentParser(description="Align a tiled mask on a simulated camera.")
+    parser.add_argument("image", help="Mask image")
+    parser.add_argument("--size", default="1920x1080", help="SLM resolution WxH")
+    parser.add_argument("--waist", type=float, default=150, help="Beam waist in pixels")
+    parser.add_argument("--noise", type=float, default=0.001)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    width, height = (int(v) for v in args.size.lower().split("x"))
+    tiler = PatternTiler(args.image, width, height)
+    rng = np.random.default_rng(args.seed)
+    hidden = TiledMaskState(
+        x_offset=width // 2 + int(rng.integers(-20, 20)) + 0.25,
+        y_offset=height // 2 + int(rng.integers(-20, 20)) + 0.5,
+        delta_index=int(rng.integers(len(DELTAS))),
+    )
+
+    def render(state):
+        return render_tiled_mask(state, tiler)
+
+    beam = gaussian_beam(width, height, width / 2, height / 2, args.waist)
+    aberration = np.exp(-2j * np.pi * render(hidden) / GRAY_LEVELS)
+    camera = SimulatedCamera(beam * aberration, noise=args.noise, seed=args.seed)
+    rows, cols = camera.shape
+    score = region_score(rows // 2 - 2, rows // 2 + 3, cols // 2 - 2, cols // 2 + 3)
+
+    ranges, choices = tiled_mask_search(tiler, DELTAS)
+    start = TiledMaskState(x_offset=width // 2, y_offset=height // 2)
+    best, report = align(start, render, camera.capture, score, ranges, choices)
+    print(f"Hidden state: {hidden}")
+    print(
+        f"Found {best} in {report['elapsed_s']:.1f} s "
+        f"({report['captured']} of {report['rendered']} rendered frames captured)"
+    )
+    # Offsets are found modulo one period of the cell, so compare the frames
+    if np.array_equal(render(best).copy(), render(hidden)):
+        print("The found state renders the same frame as the hidden one")
+    else:
+        print(
+            "The found state renders a different frame: the search relies on a score that "
+            "varies smoothly with the offset, which masks with pixel-scale features do "
+            "not give (see align)"
+        )
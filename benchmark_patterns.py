@@ -0,0 +1,296 @@
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import replace
+
+import numpy as np
+from PIL import Image
+
+from circular_slm_pattern import CircleRenderer, CircleState, circle_key_bindings
+from compositor import (
+    CircleLayer,
+    Compositor,
+    DoubleSlitLayer,
+    MaskLayer,
+    SceneState,
+    UniformLayer,
+    scene_key_bindings,
+)
+from display_sinks import FileSink, MemorySink
+from double_slit_slm_pattern import (
+    DoubleSlitRenderer,
+    DoubleSlitState,
+    double_slit_key_bindings,
+)
+from grayscale_slm_pattern import GrayscaleRenderer, GrayscaleState, grayscale_key_bindings
+from repeat_pattern import PatternTiler, repeat_image
+from send_repeated_slm_pattern import (
+    DELTAS,
+    TiledMaskState,
+    render_tiled_mask,
+    tiled_mask_key_bindings,
+)
+
+# * Measures frames/s and per-stage latency of the pattern generators without a display
+
+RESOLUTIONS = {"1080p": (1920, 1080), "4k": (3840, 2160)}
+
+# Launching `slm.py <command> --help` must stay within this budget and must not
+# import any of these modules, which are only needed once a pattern is displayed
+STARTUP_BUDGET_MS = 250
+HEAVY_MODULES = ("numpy", "cv2", "PIL", "screeninfo")
+
+
+def key_walk(state, bindings, keys, frames):
+    """
+    Returns the states visited by pressing `keys` cyclically, one key per frame.
+    """
+    states = []
+    for i in range(frames):
+        state = bindings[ord(keys[i % len(keys)])](state)
+        states.append(state)
+    return states
+
+
+def time_stages(render, states, sink):
+    """
+    Renders and presents every state, timing each stage.
+
+    Returns:
+        dict: Per-frame durations in milliseconds for "render", "present" and "total".
+    """
+    render_ms = np.empty(len(states))
+    present_ms = np.empty(len(states))
+    for i, state in enumerate(states):
+        start = time.perf_counter()
+        frame = render(state)
+        rendered = time.perf_counter()
+        sink.present(frame)
+        presented = time.perf_counter()
+        render_ms[i] = (rendered - start) * 1e3
+        present_ms[i] = (presented - rendered) * 1e3
+    return {"render": render_ms, "present": present_ms, "total": render_ms + present_ms}
+
+
+def summarize(samples_ms):
+    return {
+        "mean": float(np.mean(samples_ms)),
+        "p50": float(np.percentile(samples_ms, 50)),
+        "p95": float(np.percentile(samples_ms, 95)),
+        "max": float(np.max(samples_ms)),
+    }
+
+
+def generator_cases(width, height, mask_path, frames):
+    """
+    Builds (name, render, states) triples for every generator at one resolution.
+
+    Each case walks its own key bindings so that every frame is a real state change.
+    """
+    x, y = width // 2, height // 2
+
+    tiled_states = key_walk(
+        TiledMaskState(x_offset=x, y_offset=y),
+        tiled_mask_key_bindings(width, height),
+        "ljik=",
+        frames,
+    )
+    tiler = PatternTiler(mask_path, width, height)
+
+    # Tiled mask seen through an aperture, with added slits; one case moves the
+    # aperture, the other the mask
+    scene = SceneState(
+        (
+            UniformLayer(180),
+            MaskLayer(mask_path, x, y),
+            DoubleSlitLayer(x, y, 5, 40, slit_height=height // 2, value=64, blend="add"),
+            CircleLayer(x, y, height // 3, value=180, mask="outside"),
+        )
+    )
+    aperture_compositor = Compositor(width, height)
+    mask_compositor = Compositor(width, height)
+
+    return [
+        (
+            "repeat_image",
+            lambda s: repeat_image(
+                mask_path,
+                width,
+                height,
+                x_offset=s.x_offset,
+                y_offset=s.y_offset,
+                scale=DELTAS[s.delta_index],
+            ),
+            tiled_states,
+        ),
+        ("tiler", lambda s: render_tiled_mask(s, tiler), tiled_states),
+        (
+            "circle",
+            CircleRenderer(width, height).render,
+            key_walk(CircleState(x, y), circle_key_bindings(width, height), "lkjiw", frames),
+        ),
+        (
+            "double_slit",
+            DoubleSlitRenderer(width, height).render,
+            key_walk(
+                DoubleSlitState(x, y), double_slit_key_bindings(width, height), "ljop", frames
+            ),
+        ),
+        (
+            "scene",
+            lambda s: aperture_compositor.render(s.layers),
+            key_walk(replace(scene, selected=3), scene_key_bindings(), "ljik", frames),
+        ),
+        (
+            "scene_mask",
+            lambda s: mask_compositor.render(s.layers),
+            key_walk(replace(scene, selected=1), scene_key_bindings(), "ljik", frames),
+        ),
+        (
+            "grayscale",
+            GrayscaleRenderer(width, height).render,
+            key_walk(
+                GrayscaleState(x, y), grayscale_key_bindings(width, height), "lkjit", frames
+            ),
+        ),
+    ]
+
+
+def run_benchmarks(resolutions, mask_path, frames=100, sink_factory=MemorySink, output=None):
+    """
+    Benchmarks every generator at every resolution.
+
+    Args:
+        resolutions (dict): Mapping of labels to (width, height).
+        mask_path (str): Mask image used by the tiled generators.
+        frames (int): Number of frames rendered per generator.
+        sink_factory (callable): Returns a fresh output sink for each case.
+        output (str, optional): Directory the presented frames of each case are written
+                                to instead, as `<generator>_<resolution>.npy`.
+
+    Returns:
+        list: One dict per (generator, resolution) with frames/s and stage summaries.
+    """
+    if output is not None:
+        os.makedirs(output, exist_ok=True)
+    results = []
+    for label, (width, height) in resolutions.items():
+        for name, render, states in generator_cases(width, height, mask_path, frames):
+            render(states[0])  # Warm up caches outside the measurement
+            if output is None:
+                sink = sink_factory()
+            else:
+                sink = FileSink(os.path.join(output, f"{name}_{label}.npy"))
+            stages = time_stages(render, states, sink)
+            sink.close()
+            results.append(
+                {
+                    "generator": name,
+                    "resolution": label,
+                    "fps": 1e3 / float(np.mean(stages["total"])),
+                    **{stage: summarize(ms) for stage, ms in stages.items()},
+                }
+            )
+    return results
+
+
+def cli_startup(runs=5):
+    """
+    Times launches of the slm command up to argument parsing, in fresh interpreters.
+
+    Returns:
+        dict: Median and maximum wall time in milliseconds, and the heavy modules
+              imported by loading slm and building its parser (should be empty).
+    """
+    root = os.path.dirname(os.path.abspath(__file__))
+    command = [sys.executable, os.path.join(root, "slm.py"), "tile", "--help"]
+    times_ms = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+        times_ms.append((time.perf_counter() - start) * 1e3)
+
+    probe = (
+        "import sys, slm; slm.build_parser(); "
+        f"print(' '.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+    imported = subprocess.run(
+        [sys.executable, "-c", probe], cwd=root, check=True, capture_output=True, text=True
+    ).stdout.split()
+    return {
+        "median_ms": float(np.median(times_ms)),
+        "max_ms": float(np.max(times_ms)),
+        "heavy_imports": imported,
+    }
+
+
+def print_results(results):
+    print(
+        f"{'generator':<14}{'resolution':<12}{'frames/s':>10}"
+        f"{'render p50':>12}{'render p95':>12}{'present p50':>13}{'present p95':>13}"
+    )
+    for r in results:
+        print(
+            f"{r['generator']:<14}{r['resolution']:<12}{r['fps']:>10.1f}"
+            f"{r['render']['p50']:>12.3f}{r['render']['p95']:>12.3f}"
+            f"{r['present']['p50']:>13.3f}{r['present']['p95']:>13.3f}"
+        )
+    print("Latencies in milliseconds.")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark the SLM pattern generators without a display."
+    )
+    parser.add_argument("--frames", type=int, default=100, help="Frames per generator")
+    parser.add_argument(
+        "--resolution",
+        choices=sorted(RESOLUTIONS),
+        nargs="+",
+        default=sorted(RESOLUTIONS),
+        help="Resolutions to benchmark",
+    )
+    parser.add_argument("--mask", help="Mask image to tile (defaults to a random 64x64 mask)")
+    parser.add_argument(
+        "--output",
+        help="Write the presented frames of each case to <generator>_<resolution>.npy "
+        "in this directory instead of memory",
+    )
+    parser.add_argument(
+        "--startup",
+        action="store_true",
+        help=f"Only check the slm command's startup time against {STARTUP_BUDGET_MS} ms",
+    )
+    args = parser.parse_args(argv)
+
+    if args.startup:
+        startup = cli_startup()
+        print(
+            f"slm startup: median {startup['median_ms']:.1f} ms, max {startup['max_ms']:.1f} ms "
+            f"(budget {STARTUP_BUDGET_MS} ms)"
+        )
+        if startup["heavy_imports"]:
+            parser.exit(1, f"slm imports {', '.join(startup['heavy_imports'])} at startup\n")
+        if startup["median_ms"] > STARTUP_BUDGET_MS:
+            parser.exit(1, "slm startup is over budget\n")
+        return startup
+
+    with tempfile.TemporaryDirectory() as tmp:
+        mask_path = args.mask
+        if mask_path is None:
+            mask_path = os.path.join(tmp, "mask.png")
+            rng = np.random.default_rng(0)
+            Image.fromarray(rng.integers(0, 256, (64, 64), dtype=np.uint8)).save(mask_path)
+
+        resolutions = {label: RESOLUTIONS[label] for label in args.resolution}
+        results = run_benchmarks(resolutions, mask_path, args.frames, output=args.output)
+
+    print_results(results)
+    return results
+
+
+if __name__ == "__main__":
+    main()
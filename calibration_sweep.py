@@ -0,0 +1,215 @@
+import argparse
+import os
+
+import numpy as np
+
+from circular_slm_pattern import BACKGROUND as CIRCLE_BACKGROUND
+from circular_slm_pattern import CIRCLE_COLOR
+from double_slit_slm_pattern import BACKGROUND as SLIT_BACKGROUND
+from double_slit_slm_pattern import SLIT_COLOR
+
+# *  Batch generation of calibration sweeps, streamed into memory-mapped .npy files
+
+# Upper bound on the temporary mask allocated per chunk
+DEFAULT_CHUNK_BYTES = 256 * 1024 * 1024
+
+# Rows of a circle's bounding box drawn at a time, to bound the distance temporaries
+_CIRCLE_BAND_ROWS = 256
+
+
+def sweep_grid(**axes):
+    """
+    Builds the Cartesian product of parameter axes as flat, equally long arrays.
+
+    Example:
+        sweep_grid(x_center=[100, 200], half_side=[5, 10, 20]) yields 6 combinations.
+
+    Returns:
+        dict: Mapping of parameter names to 1-D int64 arrays.
+    """
+    names = list(axes)
+    grids = np.meshgrid(*(np.asarray(axes[name]) for name in names), indexing="ij")
+    return {name: grid.ravel().astype(np.int64) for name, grid in zip(names, grids)}
+
+
+def _column(params, name, n, default):
+    value = params.get(name, default)
+    return np.broadcast_to(np.asarray(value, dtype=np.int64), (n,))
+
+
+def _gray(params, name, n, default):
+    # Per-frame gray value shaped to broadcast over a (N, H, W) stack
+    return np.clip(_column(params, name, n, default), 0, 255).astype(np.uint8)[:, None, None]
+
+
+def render_gray_batch(params, out):
+    """
+    Fills each frame with a uniform gray level.
+
+    Args:
+        params (dict): "gray_value" array with one entry per frame.
+        out (numpy.ndarray): Output stack of shape (N, height, width).
+    """
+    n = out.shape[0]
+    out[...] = _gray(params, "gray_value", n, 0)
+
+
+def render_square_batch(params, out):
+    """
+    Draws one filled square per frame, matching `GrayscaleRenderer` without the label.
+
+    Like the renderer, the background defaults to the square's own gray value; pass a
+    "background" to make the square visible.
+
+    Args:
+        params (dict): "x_center", "y_center", "half_side", "gray_value" and
+                       optionally "background" arrays, one entry per frame.
+        out (numpy.ndarray): Output stack of shape (N, height, width).
+    """
+    n, height, width = out.shape
+    x = _column(params, "x_center", n, width // 2)[:, None]
+    y = _column(params, "y_center", n, height // 2)[:, None]
+    half = _column(params, "half_side", n, 200)[:, None]
+    gray_value = _gray(params, "gray_value", n, 0)
+    rows = np.abs(np.arange(height)[None, :] - y) <= half  # (N, H)
+    cols = np.abs(np.arange(width)[None, :] - x) <= half  # (N, W)
+
+    out[...] = _gray(params, "background", n, gray_value[:, 0, 0])
+    inside = rows[:, :, None] & cols[:, None, :]
+    np.copyto(out, gray_value, where=inside)
+
+
+def render_circle_batch(params, out):
+    """
+    Draws one filled circle per frame on the circle pattern's background.
+
+    Each circle is drawn in bands of its bounding box, so the int32 distance
+    temporaries stay a few MB whatever the chunk and frame size.
+
+    Args:
+        params (dict): "x_offset", "y_offset", "radius" and optionally "color" and
+                       "background" arrays, one entry per frame.
+        out (numpy.ndarray): Output stack of shape (N, height, width).
+    """
+    n, height, width = out.shape
+    x = _column(params, "x_offset", n, width // 2)
+    y = _column(params, "y_offset", n, height // 2)
+    radius = _column(params, "radius", n, 50)
+    color = _gray(params, "color", n, CIRCLE_COLOR)
+
+    out[...] = _gray(params, "background", n, CIRCLE_BACKGROUND)
+    for i in range(n):
+        top, bottom = max(0, y[i] - radius[i]), min(height, y[i] + radius[i] + 1)
+        left, right = max(0, x[i] - radius[i]), min(width, x[i] + radius[i] + 1)
+        if top >= bottom or left >= right:
+            continue
+        dx2 = (np.arange(left, right, dtype=np.int32) - np.int32(x[i])) ** 2
+        for band in range(top, bottom, _CIRCLE_BAND_ROWS):
+            rows = np.arange(band, min(band + _CIRCLE_BAND_ROWS, bottom), dtype=np.int32)
+            inside = (rows[:, None] - np.int32(y[i])) ** 2 + dx2[None, :] <= radius[i] ** 2
+            np.copyto(out[i, rows[0] : rows[-1] + 1, left:right], color[i, 0, 0], where=inside)
+
+
+def render_double_slit_batch(params, out):
+    """
+    Draws two full-height slits per frame, matching `DoubleSlitRenderer`.
+
+    Args:
+        params (dict): "x_offset", "slit_width", "separation" and optionally "color"
+                       and "background" arrays, one entry per frame.
+        out (numpy.ndarray): Output stack of shape (N, height, width).
+    """
+    n, height, width = out.shape
+    x = _column(params, "x_offset", n, width // 2)[:, None]
+    half_width = _column(params, "slit_width", n, 5)[:, None] // 2
+    half_separation = _column(params, "separation", n, 20)[:, None] // 2
+    columns = np.arange(width)[None, :]
+    cols = (np.abs(columns - (x - half_separation)) <= half_width) | (
+        np.abs(columns - (x + half_separation)) <= half_width
+    )  # (N, W)
+
+    out[...] = _gray(params, "background", n, SLIT_BACKGROUND)
+    np.copyto(
+        out,
+        _gray(params, "color", n, SLIT_COLOR),
+        where=cols[:, None, :],
+    )
+
+
+SWEEP_RENDERERS = {
+    "gray": render_gray_batch,
+    "square": render_square_batch,
+    "circle": render_circle_batch,
+    "double_slit": render_double_slit_batch,
+}
+
+
+def write_sweep(path, kind, params, width, height, chunk_bytes=DEFAULT_CHUNK_BYTES):
+    """
+    Renders a sweep into a memory-mapped (N, height, width) uint8 .npy file.
+
+    Frames are produced a chunk at a time directly into the mapped file, so the full
+    sweep never has to fit in RAM. The parameters are saved next to it as
+    `<path stem>_params.npz`, one entry per frame.
+
+    Args:
+        path (str): Output .npy path.
+        kind (str): One of "gray", "square", "circle" or "double_slit".
+        params (dict): Per-frame parameter arrays, see the `render_*_batch` functions
+                       and `sweep_grid`.
+        width (int): Frame width in pixels.
+        height (int): Frame height in pixels.
+        chunk_bytes (int): Approximate memory budget for one chunk of frames.
+
+    Returns:
+        numpy.memmap: The written stack, opened read-only.
+    """
+    if kind not in SWEEP_RENDERERS:
+        raise ValueError(f"Unknown sweep kind: {kind}")
+    render = SWEEP_RENDERERS[kind]
+    n = max((np.size(v) for v in params.values()), default=0)
+    params = {name: _column(params, name, n, 0) for name in params}
+
+    frames = np.lib.format.open_memmap(
+        path, mode="w+", dtype=np.uint8, shape=(n, height, width)
+    )
+    chunk = max(1, chunk_bytes // (height * width))
+    for start in range(0, n, chunk):
+        stop = min(n, start + chunk)
+        chunk_params = {name: value[start:stop] for name, value in params.items()}
+        render(chunk_params, frames[start:stop])
+    frames.flush()
+    del frames
+
+    np.savez(os.path.splitext(path)[0] + "_params.npz", kind=kind, **params)
+    return np.load(path, mmap_mode="r")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Write an SLM calibration sweep to a .npy file."
+    )
+    parser.add_argument("output", help="Output .npy path")
+    parser.add_argument("--kind", choices=sorted(SWEEP_RENDERERS), default="gray")
+    parser.add_argument("--width", type=int, default=3840)
+    parser.add_argument("--height", type=int, default=2160)
+    args = parser.parse_args()
+
+    # Default sweeps: all 256 gray levels, or a small position/size grid for the shapes
+    if args.kind == "gray":
+        params = {"gray_value": np.arange(256)}
+    elif args.kind == "square":
+        params = sweep_grid(
+            gray_value=np.arange(0, 256, 16),
+            half_side=[50, 100, 200],
+        )
+    elif args.kind == "circle":
+        params = sweep_grid(
+            x_offset=np.arange(args.width // 4, 3 * args.width // 4 + 1, args.width // 8),
+            radius=[25, 50, 100],
+        )
+    else:
+        params = sweep_grid(separation=np.arange(10, 101, 10), slit_width=[3, 5, 9])
+
+    stack = write_sweep(args.output, args.kind, params, args.width, args.height)
+    print(f"Wrote {stack.shape[0]} frames of {args.width}x{args.height} to {args.output}")
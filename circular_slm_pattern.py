@@ -1,61 +1,117 @@
+from dataclasses import dataclass, replace
+
 import cv2
-import numpy as np
-import screeninfo
 
+from dirty_canvas import DirtyCanvas
+from display_control import key_bindings, run_keyboard_loop, with_stages
+from display_sinks import OpenCVWindowSink, get_monitors
+from phase_lut import load_lut
+
+BACKGROUND = 180
+CIRCLE_COLOR = 255
+
+
+@dataclass(frozen=True)
+class CircleState:
+    x_offset: int
+    y_offset: int
+    radius: int = 50
+
+    def __post_init__(self):
+        if self.radius < 0:
+            raise ValueError(f"radius must be >= 0, got {self.radius}")
 
-def display_image_with_keyboard_control(screen_id):
+
+class CircleRenderer:
+    """
+    Draws the circle on a persistent canvas, only touching its previous and new bounding box.
+    """
+
+    def __init__(self, width, height):
+        self.canvas = DirtyCanvas(width, height, background=BACKGROUND)
+
+    def render(self, state):
+        # Erase the previous circle
+        self.canvas.erase()
+
+        # Draw the circle at the current position
+        x, y, radius = state.x_offset, state.y_offset, state.radius
+        cv2.circle(self.canvas.canvas, (x, y), radius, CIRCLE_COLOR, -1)
+        self.canvas.mark(x - radius, y - radius, x + radius, y + radius)
+        return self.canvas.canvas
+
+
+def render_circle(state, width, height):
+    # One-off render on a fresh canvas
+    return CircleRenderer(width, height).render(state)
+
+
+def circle_key_bindings(width, height):
+    def move(dx, dy):
+        return lambda state: replace(
+            state,
+            x_offset=min(width, max(0, state.x_offset + dx)),
+            y_offset=min(height, max(0, state.y_offset + dy)),
+        )
+
+    # Move circle or change radius based on key press
+    return key_bindings(
+        {
+            "w": move(0, -10),  # Up
+            "s": move(0, 10),  # Down
+            "a": move(-10, 0),  # Left
+            "d": move(10, 0),  # Right
+            "i": move(0, -1),  # Up
+            "k": move(0, 1),  # Down
+            "j": move(-1, 0),  # Left
+            "l": move(1, 0),  # Right
+            "=": lambda state: replace(state, radius=state.radius + 5),
+            "-": lambda state: replace(state, radius=max(5, state.radius - 2)),
+        }
+    )
+
+
+def display_image_with_keyboard_control(
+    screen_id,
+    sink=None,
+    lut_path=None,
+    timing_csv=None,
+    state=None,
+    control=None,
+    journal_path=None,
+):
     # Get the size of the screen
-    screen = screeninfo.get_monitors()[screen_id]
+    screen = get_monitors()[screen_id]
     width, height = screen.width, screen.height
 
     # Initial position and radius of the circle
-    x_offset, y_offset = 812, 512  # Start at the center of the screen
-    radius = 50  # Initial radius of the circle
+    if state is None:
+        state = CircleState(x_offset=812, y_offset=512)  # Start at the center of the screen
 
-    window_name = "projector"
-    cv2.namedWindow(window_name, cv2.WINDOW_NORMAL)
-    cv2.moveWindow(window_name, screen.x - 1, screen.y - 1)
-    cv2.setWindowProperty(window_name, cv2.WND_PROP_FULLSCREEN, cv2.WINDOW_FULLSCREEN)
+    # Optional gray-level correction from an SLM calibration file
+    lut = load_lut(lut_path) if lut_path else None
 
-    while True:
-        # Create a blank canvas
-        canvas = np.ones((height, width, 3), dtype=np.uint8) * 180
+    if sink is None:
+        sink = OpenCVWindowSink(screen, "projector", offset=(-1, -1))
 
-        # Draw the circle at the current position
-        cv2.circle(canvas, (x_offset, y_offset), radius, (255, 255, 255), -1)
-        print("x_offset, y_offset: ", x_offset, y_offset)
-
-        # Show the canvas
-        cv2.imshow(window_name, canvas)
-
-        # Wait for a key press
-        key = cv2.waitKey(10)
-
-        # Move circle or change radius based on key press
-        if key == ord("w"):  # Up
-            y_offset = max(0, y_offset - 10)
-        elif key == ord("s"):  # Down
-            y_offset = min(height, y_offset + 10)
-        elif key == ord("a"):  # Left
-            x_offset = max(0, x_offset - 10)
-        elif key == ord("d"):  # Right
-            x_offset = min(width, x_offset + 10)
-        elif key == ord("i"):  # Up
-            y_offset = max(0, y_offset - 1)
-        elif key == ord("k"):  # Down
-            y_offset = min(height, y_offset + 1)
-        elif key == ord("j"):  # Left
-            x_offset = max(0, x_offset - 1)
-        elif key == ord("l"):  # Right
-            x_offset = min(width, x_offset + 1)
-        elif key == ord("="):  # Increase radius
-            radius += 5
-        elif key == ord("-"):  # Decrease radius
-            radius = max(5, radius - 2)
-        elif key == 27:  # Escape key
-            break
-
-    cv2.destroyAllWindows()
+    run_keyboard_loop(
+        sink,
+        state,
+        with_stages(CircleRenderer(width, height).render, lut and lut.apply),
+        circle_key_bindings(width, height),
+        status=lambda state: f"x_offset, y_offset:  {state.x_offset} {state.y_offset}",
+        timing_csv=timing_csv,
+        control=control,
+        journal_path=journal_path,
+        journal_context={
+            "pattern": "circle",
+            "width": width,
+            "height": height,
+            "lut_path": lut_path,
+        },
+    )
+
+    sink.close()
 
 
 if __name__ == "__main__":
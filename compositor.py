@@ -0,0 +1,544 @@
+import json
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass, field, fields, replace
+
+import cv2
+import numpy as np
+
+from display_control import key_bindings, run_keyboard_loop, with_stages
+from display_sinks import OpenCVWindowSink, get_monitors
+from pattern_pack import PACK_EXTENSION, PackedMaskTiler, PatternPack
+from phase_lut import load_lut
+from repeat_pattern import PatternTiler
+from send_repeated_slm_pattern import DELTAS
+
+# *  Layered scenes: shapes, tiled masks and uniform fields composited into one frame
+#
+# Each layer is rasterized on its own and cached, keyed by its geometry, so changing
+# one layer re-rasterizes only that layer. Every frame is then one composite pass over
+# the cached rasters, bottom to top.
+
+# How a layer combines with the layers below it. "add" and "subtract" wrap modulo 256,
+# i.e. they add phase patterns
+BLENDS = {
+    "over": None,
+    "add": np.add,
+    "subtract": np.subtract,
+    "max": np.maximum,
+    "min": np.minimum,
+}
+
+# Where a layer applies: inside its shape, or everywhere else (e.g. an aperture)
+MASKS = ("inside", "outside")
+
+# Movement steps of the selected layer, as in the single-pattern scripts
+LARGE_STEP = 10
+SMALL_STEP = 1
+
+
+@dataclass(frozen=True)
+class Raster:
+    """
+    A rasterized layer.
+
+    Attributes:
+        rect (tuple or None): (x0, y0, x1, y1) bounding box on the screen, with exclusive
+                              ends; None if the layer is off screen.
+        values (int or numpy.ndarray): Gray value of the layer, or its uint8 pixels
+                                       inside `rect`.
+        coverage (numpy.ndarray or None): Boolean shape inside `rect`; None if the
+                                          layer fills its whole rectangle.
+        uncovered (numpy.ndarray or None): ~coverage, kept for the "outside" mask.
+    """
+
+    rect: tuple
+    values: object
+    coverage: object = None
+    uncovered: object = None
+
+
+def _shape_raster(width, height, x0, y0, x1, y1, value, draw=None):
+    # Raster of a shape drawn inside the inclusive box [x0, x1] x [y0, y1]; `draw`
+    # paints the shape onto a box-sized uint8 mask whose origin is (x0, y0)
+    left, top = max(0, x0), max(0, y0)
+    right, bottom = min(width, x1 + 1), min(height, y1 + 1)
+    if left >= right or top >= bottom:
+        return Raster(None, value)
+    if draw is None:
+        return Raster((left, top, right, bottom), value)
+    coverage = np.zeros((bottom - top, right - left), dtype=np.uint8)
+    draw(coverage, left, top)
+    coverage = coverage.astype(bool)
+    return Raster((left, top, right, bottom), value, coverage, ~coverage)
+
+
+@dataclass(frozen=True)
+class Layer(ABC):
+    """
+    Base of the layer types: how a layer is composited onto the layers below it.
+
+    Subclasses are frozen dataclasses that implement `rasterize`, and set `position`
+    and override `resized` if the keyboard can move and resize them.
+
+    Args:
+        blend (str): A key of `BLENDS`.
+        mask (str): "inside" applies the layer inside its shape, "outside" everywhere
+                    else, with its value.
+        visible (bool): Hidden layers are skipped.
+    """
+
+    blend: str = field(default="over", kw_only=True)
+    mask: str = field(default="inside", kw_only=True)
+    visible: bool = field(default=True, kw_only=True)
+
+    # (x field, y field) moved by the keyboard; None for layers without a position
+    position = None
+
+    def __post_init__(self):
+        if self.blend not in BLENDS:
+            raise ValueError(f"Unknown blend {self.blend!r}, expected one of {list(BLENDS)}")
+        if self.mask not in MASKS:
+            raise ValueError(f"Unknown mask {self.mask!r}, expected one of {MASKS}")
+
+    def raster_key(self):
+        """
+        Returns what the raster depends on: the layer without its compositing fields.
+        """
+        return (type(self),) + tuple(
+            getattr(self, f.name) for f in fields(self) if f.name not in _COMPOSITING
+        )
+
+    def moved(self, dx, dy):
+        if self.position is None:
+            return self
+        x, y = self.position
+        return replace(self, **{x: getattr(self, x) + dx, y: getattr(self, y) + dy})
+
+    def resized(self, grow):
+        return self
+
+    @abstractmethod
+    def rasterize(self, compositor):
+        """
+        Draws the layer for the compositor's screen size.
+
+        Args:
+            compositor (Compositor): Gives the screen size and shared mask tilers.
+
+        Returns:
+            Raster: The layer's pixels or value, with its bounding box and shape.
+        """
+
+
+_COMPOSITING = {f.name for f in fields(Layer)}
+
+
+@dataclass(frozen=True)
+class UniformLayer(Layer):
+    value: int = 180
+
+    def rasterize(self, compositor):
+        return Raster((0, 0, compositor.width, compositor.height), self.value)
+
+
+@dataclass(frozen=True)
+class CircleLayer(Layer):
+    x_offset: int
+    y_offset: int
+    radius: int = 50
+    value: int = 255
+
+    position = ("x_offset", "y_offset")
+
+    def resized(self, grow):
+        return replace(self, radius=self.radius + 5 if grow else max(5, self.radius - 2))
+
+    def rasterize(self, compositor):
+        x, y, radius = self.x_offset, self.y_offset, self.radius
+        return _shape_raster(
+            compositor.width,
+            compositor.height,
+            x - radius,
+            y - radius,
+            x + radius,
+            y + radius,
+            self.value,
+            lambda mask, left, top: cv2.circle(mask, (x - left, y - top), radius, 1, -1),
+        )
+
+
+@dataclass(frozen=True)
+class DoubleSlitLayer(Layer):
+    x_offset: int  # Center between the two slits
+    y_offset: int
+    slit_width: int = 5
+    separation: int = 20
+    slit_height: int = None  # Defaults to the screen height
+    value: int = 180
+
+    position = ("x_offset", "y_offset")
+
+    def resized(self, grow):
+        return replace(self, separation=max(0, self.separation + (2 if grow else -2)))
+
+    def rasterize(self, compositor):
+        # Same slit rectangles as DoubleSlitRenderer
+        slit_height = compositor.height if self.slit_height is None else self.slit_height
+        half_separation = self.separation // 2
+        half_width = self.slit_width // 2
+        top = self.y_offset - slit_height // 2
+        bottom = self.y_offset + slit_height // 2
+        left = self.x_offset - half_separation - half_width
+        right = self.x_offset + half_separation + half_width
+
+        def draw(mask, x0, y0):
+            for center in (self.x_offset - half_separation, self.x_offset + half_separation):
+                top_left = (center - half_width - x0, top - y0)
+                bottom_right = (center + half_width - x0, bottom - y0)
+                cv2.rectangle(mask, top_left, bottom_right, 1, -1)
+
+        return _shape_raster(
+            compositor.width, compositor.height, left, top, right, bottom, self.value, draw
+        )
+
+
+@dataclass(frozen=True)
+class SquareLayer(Layer):
+    x_center: int
+    y_center: int
+    half_side: int = 200
+    value: int = 255
+
+    position = ("x_center", "y_center")
+
+    def resized(self, grow):
+        return replace(self, half_side=max(1, self.half_side + (10 if grow else -10)))
+
+    def rasterize(self, compositor):
+        x, y, half_side = self.x_center, self.y_center, self.half_side
+        return _shape_raster(
+            compositor.width,
+            compositor.height,
+            x - half_side,
+            y - half_side,
+            x + half_side,
+            y + half_side,
+            self.value,
+        )
+
+
+@dataclass(frozen=True)
+class MaskLayer(Layer):
+    path: str  # Mask image, or pattern pack together with `name`
+    x_offset: float
+    y_offset: float
+    scale: float = DELTAS[2]
+    name: str = None
+    flip_horizontal: bool = False
+    flip_vertical: bool = False
+
+    position = ("x_offset", "y_offset")
+
+    def resized(self, grow):
+        # Steps through the scale factors of send_repeated_slm_pattern
+        index = min(range(len(DELTAS)), key=lambda i: abs(DELTAS[i] - self.scale))
+        index = min(len(DELTAS) - 1, index + 1) if grow else max(0, index - 1)
+        return replace(self, scale=DELTAS[index])
+
+    def rasterize(self, compositor):
+        frame = compositor.tiler(self.path, self.name).render(
+            x_offset=self.x_offset,
+            y_offset=self.y_offset,
+            scale=self.scale,
+            flip_horizontal=self.flip_horizontal,
+            flip_vertical=self.flip_vertical,
+        )
+        # Copied, since the tiler's buffer is shared by every mask layer
+        values = frame.copy()
+        return Raster((0, 0, compositor.width, compositor.height), values)
+
+
+# Entry "type" -> layer class; the names match frame_sequence.render_pattern
+LAYER_TYPES = {
+    "gray": UniformLayer,
+    "circle": CircleLayer,
+    "double_slit": DoubleSlitLayer,
+    "square": SquareLayer,
+    "mask": MaskLayer,
+}
+
+
+def layer_from_spec(spec):
+    """
+    Builds a layer from a dict such as {"type": "circle", "x_offset": 960,
+    "y_offset": 540, "radius": 300, "value": 180, "mask": "outside"}.
+
+    Pattern pack masks may be given as {"type": "mask", "pack": ..., "name": ...}, as
+    in a frame sequence.
+    """
+    params = dict(spec)
+    kind = params.pop("type")
+    if kind not in LAYER_TYPES:
+        raise ValueError(f"Unknown layer type: {kind}")
+    if "pack" in params:
+        params["path"] = params.pop("pack")
+    return LAYER_TYPES[kind](**params)
+
+
+def load_scene(path):
+    """
+    Loads a scene: a JSON list of layer entries, bottom layer first, see `layer_from_spec`.
+    """
+    with open(path) as f:
+        specs = json.load(f)
+    if not isinstance(specs, list):
+        raise ValueError(f"{path} must contain a list of layers")
+    return tuple(layer_from_spec(spec) for spec in specs)
+
+
+def _blend(region, values, blend, where=None):
+    # Combines `values` into `region` in place, only where `where` is True if given
+    if blend == "over":
+        if where is None:
+            region[...] = values
+        else:
+            np.copyto(region, values, where=where)
+    else:
+        BLENDS[blend](region, values, out=region, where=True if where is None else where)
+
+
+class Compositor:
+    """
+    Composites a stack of layers into one frame, caching each layer's raster.
+
+    Rasters are kept in an LRU cache keyed by `Layer.raster_key`, so a frame in which
+    one layer moved re-rasterizes just that layer, and changing only how a layer is
+    blended re-rasterizes nothing. The composite is one pass over the cached rasters:
+    layers below the topmost one that covers the whole screen are skipped, shapes only
+    touch their bounding boxes, and an unchanged stack returns the previous frame as
+    it is. Frames are composited into a buffer that is overwritten by the next
+    `render`.
+
+    Args:
+        width (int): Frame width.
+        height (int): Frame height.
+        background (int): Gray value under the bottom layer.
+        cache_size (int): Number of layer rasters kept; a tiled mask raster takes a
+                          full frame.
+    """
+
+    def __init__(self, width, height, background=0, cache_size=8):
+        self.width = width
+        self.height = height
+        self.background = background
+        self.cache_size = cache_size
+        self.buffer = np.empty((height, width), dtype=np.uint8)
+        self._rasters = OrderedDict()
+        self._tilers = {}
+        # Output of every mask tiler; mask rasters are copied out of it
+        self._tiled = np.empty((height, width), dtype=np.uint8)
+        self._composited = None  # Layers of the frame in `buffer`
+        self.rasterized = 0
+
+    def tiler(self, path, name=None):
+        """
+        Returns the tiler of a mask image, or of mask `name` of a pattern pack.
+        """
+        key = (path, name)
+        if key not in self._tilers:
+            if path.endswith(PACK_EXTENSION):
+                if (path, None) not in self._tilers:
+                    self._tilers[(path, None)] = PatternPack(path)
+                pack = self._tilers[(path, None)]
+                self._tilers[key] = PackedMaskTiler(
+                    pack, name or pack.names[0], self.width, self.height, buffer=self._tiled
+                )
+            else:
+                self._tilers[key] = PatternTiler(path, self.width, self.height, buffer=self._tiled)
+        return self._tilers[key]
+
+    def raster(self, layer):
+        """
+        Returns the raster of `layer`, rasterizing it only on a cache miss.
+        """
+        key = layer.raster_key()
+        raster = self._rasters.get(key)
+        if raster is not None:
+            self._rasters.move_to_end(key)
+            return raster
+        raster = layer.rasterize(self)
+        self.rasterized += 1
+        self._rasters[key] = raster
+        if len(self._rasters) > self.cache_size:
+            self._rasters.popitem(last=False)
+        return raster
+
+    def _covers_screen(self, layer, raster):
+        return (
+            layer.blend == "over"
+            and layer.mask == "inside"
+            and raster.coverage is None
+            and raster.rect == (0, 0, self.width, self.height)
+        )
+
+    def _apply(self, layer, raster):
+        out = self.buffer
+        if raster.rect is None:
+            if layer.mask == "outside":
+                _blend(out, raster.values, layer.blend)
+            return
+        x0, y0, x1, y1 = raster.rect
+        if layer.mask == "inside":
+            _blend(out[y0:y1, x0:x1], raster.values, layer.blend, raster.coverage)
+            return
+        # Outside: the strips around the bounding box, then the box outside the shape.
+        # Pixel layers (masks) cover the whole screen, so they have no outside
+        if isinstance(raster.values, np.ndarray):
+            return
+        for region in (out[:y0], out[y1:], out[y0:y1, :x0], out[y0:y1, x1:]):
+            _blend(region, raster.values, layer.blend)
+        if raster.uncovered is not None:
+            _blend(out[y0:y1, x0:x1], raster.values, layer.blend, raster.uncovered)
+
+    def render(self, layers):
+        """
+        Returns the composite of `layers`, bottom layer first.
+
+        Args:
+            layers (sequence): `Layer` instances.
+
+        Returns:
+            numpy.ndarray: The shared output buffer with shape (height, width).
+        """
+        layers = tuple(layer for layer in layers if layer.visible)
+        if layers == self._composited:
+            return self.buffer
+
+        # Rasterize from the top down to the first layer hiding everything below it
+        stack = []
+        for layer in reversed(layers):
+            raster = self.raster(layer)
+            stack.append((layer, raster))
+            if self._covers_screen(layer, raster):
+                break
+        else:
+            self.buffer.fill(self.background)
+
+        for layer, raster in reversed(stack):
+            self._apply(layer, raster)
+        self._composited = layers
+        return self.buffer
+
+
+@dataclass(frozen=True)
+class SceneState:
+    layers: tuple  # Bottom layer first
+    selected: int = 0  # Layer moved and resized by the keyboard
+
+    def __post_init__(self):
+        if not self.layers:
+            raise ValueError("A scene needs at least one layer")
+        if not 0 <= self.selected < len(self.layers):
+            raise ValueError(
+                f"selected must be in 0-{len(self.layers) - 1}, got {self.selected}"
+            )
+
+
+def scene_key_bindings():
+    """
+    Builds the keyboard bindings that select, move, resize and restyle scene layers.
+    """
+
+    def update_selected(change):
+        def action(state):
+            layers = list(state.layers)
+            layers[state.selected] = change(layers[state.selected])
+            return replace(state, layers=tuple(layers))
+
+        return action
+
+    def move(dx, dy):
+        return update_selected(lambda layer: layer.moved(dx, dy))
+
+    def select(step):
+        return lambda state: replace(state, selected=(state.selected + step) % len(state.layers))
+
+    def next_blend(layer):
+        names = list(BLENDS)
+        return replace(layer, blend=names[(names.index(layer.blend) + 1) % len(names)])
+
+    def toggle_mask(layer):
+        return replace(layer, mask="outside" if layer.mask == "inside" else "inside")
+
+    return key_bindings(
+        {
+            "w": move(0, -LARGE_STEP),  # Up
+            "s": move(0, LARGE_STEP),  # Down
+            "a": move(-LARGE_STEP, 0),  # Left
+            "d": move(LARGE_STEP, 0),  # Right
+            "i": move(0, -SMALL_STEP),  # Up
+            "k": move(0, SMALL_STEP),  # Down
+            "j": move(-SMALL_STEP, 0),  # Left
+            "l": move(SMALL_STEP, 0),  # Right
+            "=": update_selected(lambda layer: layer.resized(True)),
+            "-": update_selected(lambda layer: layer.resized(False)),
+            "]": select(1),  # Next layer
+            "[": select(-1),  # Previous layer
+            "v": update_selected(lambda layer: replace(layer, visible=not layer.visible)),
+            "b": update_selected(next_blend),
+            "m": update_selected(toggle_mask),
+        }
+    )
+
+
+def display_scene_with_keyboard_control(
+    screen_id,
+    layers,
+    sink=None,
+    lut_path=None,
+    timing_csv=None,
+    selected=0,
+    control=None,
+):
+    """
+    Displays a layered scene with keyboard controls for one layer at a time.
+
+    '[' / ']' select the layer; 'wasd' / 'ijkl' move it, '=' / '-' resize it, 'v' hides
+    or shows it, 'b' cycles its blend mode and 'm' toggles its mask between inside and
+    outside. Sessions of scenes cannot be recorded to a journal, whose states have
+    flat fields.
+
+    Args:
+        screen_id (int): Monitor index.
+        layers (sequence or str): Layers, bottom first, or a scene file (see `load_scene`).
+        sink (optional): Output sink; defaults to a full-screen window on the monitor.
+        lut_path (str, optional): SLM calibration file applied to every frame.
+        timing_csv (str, optional): Write per-frame timings to this CSV on exit.
+        selected (int): Initially selected layer.
+        control (ControlServer, optional): Accept commands (e.g. "keys", or "set" of
+                                           "selected") from other programs.
+    """
+    screen = get_monitors()[screen_id]
+    width, height = screen.width, screen.height
+    if isinstance(layers, str):
+        layers = load_scene(layers)
+    state = SceneState(tuple(layers), selected)
+
+    lut = load_lut(lut_path) if lut_path else None
+    compositor = Compositor(width, height)
+
+    if sink is None:
+        sink = OpenCVWindowSink(screen, "projector")
+
+    run_keyboard_loop(
+        sink,
+        state,
+        with_stages(lambda state: compositor.render(state.layers), lut and lut.apply),
+        scene_key_bindings(),
+        status=lambda state: f"Layer {state.selected}: {state.layers[state.selected]}",
+        timing_csv=timing_csv,
+        control=control,
+    )
+
+    sink.close()
@@ -0,0 +1,338 @@
+import asyncio
+import json
+import os
+import socket
+import threading
+import time
+from collections import deque
+from dataclasses import asdict, fields, replace
+
+# *  Local socket server for driving the pattern state from other programs
+#
+# The protocol is newline-delimited JSON. Each line is one command or a list of
+# commands (a batch); every command gets one reply line echoing its "id":
+#
+#   {"id": 1, "op": "set", "state": {"x_offset": 812, "radius": 60}}
+#   {"id": 2, "op": "keys", "keys": "ddw"}
+#   {"id": 3, "op": "select", "name": "imagenet_nn/remapped_mask"}
+#   {"id": 4, "op": "get"}
+#
+# "get" is answered at once. Commands that change the state are answered only once
+# a frame containing their effect has been presented, with the presented state and
+# the time.perf_counter() of the presentation. "set" values are checked against the
+# types of the state's fields and its valid ranges; a rejected command is answered
+# with "ok": false and leaves the state unchanged.
+
+DEFAULT_ADDRESS = "127.0.0.1:8765"
+
+# State field types that "set" accepts
+_SETTABLE = (bool, int, float, str)
+
+
+def parse_address(address):
+    """
+    Splits "host:port", "tcp:host:port" or "unix:/path/to/socket" into (kind, target).
+    """
+    if address.startswith("unix:"):
+        return "unix", address[len("unix:") :]
+    if address.startswith("tcp:"):
+        address = address[len("tcp:") :]
+    host, _, port = address.rpartition(":")
+    return "tcp", (host or "127.0.0.1", int(port))
+
+
+def coerce_fields(state, values):
+    """
+    Checks "set" values against the field types of a dataclass state.
+
+    Integral floats are accepted for int fields and ints for float fields; anything
+    else of the wrong type, unknown fields and fields of other types are refused.
+
+    Returns:
+        dict: The values, converted to the field types.
+
+    Raises:
+        ValueError: A value does not fit its field.
+    """
+    if not isinstance(values, dict):
+        raise ValueError("'state' must be an object")
+    types = {f.name: f.type for f in fields(state)}
+    coerced = {}
+    for name, value in values.items():
+        kind = types.get(name)
+        if kind is None:
+            raise ValueError(f"Unknown field: {name}")
+        if kind not in _SETTABLE:
+            raise ValueError(f"{name} cannot be set remotely")
+        if kind is bool:
+            valid = isinstance(value, bool)
+        elif kind is int:
+            valid = isinstance(value, int) or (isinstance(value, float) and value.is_integer())
+            valid = valid and not isinstance(value, bool)
+        elif kind is float:
+            valid = isinstance(value, (int, float)) and not isinstance(value, bool)
+        else:
+            valid = isinstance(value, str)
+        if not valid:
+            raise ValueError(f"{name} must be {kind.__name__}, got {value!r}")
+        coerced[name] = kind(value)
+    return coerced
+
+
+class ControlServer:
+    """
+    Accepts state updates over a local TCP or Unix socket for a keyboard loop.
+
+    The asyncio server runs on its own thread and only queues incoming commands.
+    `run_keyboard_loop` applies everything queued between two frames in one go, so a
+    burst of updates costs a single render and superseded values are never drawn,
+    and acknowledges commands after the resulting frame is presented.
+
+    Args:
+        address (str): "host:port", "tcp:host:port" or "unix:/path/to/socket".
+        select (callable, optional): select(state, name) -> state, used by the
+                                     "select" command, e.g. to pick a pack mask.
+        validate (callable, optional): Raises ValueError for a state the display
+                                       cannot show, e.g. a mask index past the end
+                                       of the pack. Ranges that do not depend on the
+                                       display are checked by the state dataclasses.
+    """
+
+    def __init__(self, address=DEFAULT_ADDRESS, select=None, validate=None):
+        self.address = address
+        self.select = select
+        self.validate = validate
+        self.inbox = deque()  # (commands, writer), appended by the server thread
+        self.wakeup = threading.Event()
+        self.applied = 0  # Number of commands applied so far
+        self.pending = []  # (command number, writer, reply) awaiting a frame
+        self.loop = None
+        self.thread = None
+        self._server = None
+        self._started = threading.Event()
+        self._error = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    # Server thread
+
+    def start(self):
+        """
+        Starts listening on a background thread; returns once the socket is bound.
+        """
+        self.thread = threading.Thread(target=self._run, name="control-server", daemon=True)
+        self.thread.start()
+        self._started.wait()
+        if self._error is not None:
+            raise self._error
+        return self
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        try:
+            self.loop.run_until_complete(self._listen())
+        except OSError as error:
+            self._error = error
+            self._started.set()
+            return
+        self._started.set()
+        self.loop.run_forever()
+        self.loop.run_until_complete(self.loop.shutdown_asyncgens())
+        self.loop.close()
+
+    async def _listen(self):
+        kind, target = parse_address(self.address)
+        if kind == "unix":
+            if os.path.exists(target):
+                os.unlink(target)
+            self._server = await asyncio.start_unix_server(self._serve, path=target)
+        else:
+            self._server = await asyncio.start_server(self._serve, *target)
+
+    async def _serve(self, reader, writer):
+        sock = writer.get_extra_info("socket")
+        if sock is not None and sock.family in (socket.AF_INET, socket.AF_INET6):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    message = json.loads(line)
+                except ValueError as error:
+                    self._write(writer, {"ok": False, "error": f"Invalid JSON: {error}"})
+                    continue
+                self.inbox.append((message if isinstance(message, list) else [message], writer))
+                self.wakeup.set()
+        finally:
+            writer.close()
+
+    def _write(self, writer, reply):
+        if not writer.is_closing():
+            writer.write(json.dumps(reply).encode() + b"\n")
+
+    def _reply(self, writer, reply):
+        # Called from the GUI thread; the write itself happens on the server thread
+        self.loop.call_soon_threadsafe(self._write, writer, reply)
+
+    def stop(self):
+        if self.loop is None or self.loop.is_closed():
+            return
+
+        async def close():
+            self._server.close()
+            await self._server.wait_closed()
+
+        asyncio.run_coroutine_threadsafe(close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        kind, target = parse_address(self.address)
+        if kind == "unix" and os.path.exists(target):
+            os.unlink(target)
+
+    # GUI thread
+
+    def apply(self, state, bindings=None, wait_s=0.0):
+        """
+        Applies all queued commands to `state`, first waiting up to `wait_s` for one.
+
+        Returns:
+            The updated state.
+        """
+        if not self.inbox and wait_s > 0:
+            self.wakeup.wait(wait_s)
+        self.wakeup.clear()
+        while self.inbox:
+            commands, writer = self.inbox.popleft()
+            for command in commands:
+                state = self._execute(command, state, bindings or {}, writer)
+        return state
+
+    def _execute(self, command, state, bindings, writer):
+        reply = {"id": command.get("id")} if isinstance(command, dict) else {}
+        try:
+            op = command["op"]
+            if op == "get":
+                self._reply(writer, {**reply, "ok": True, "state": asdict(state)})
+                return state
+            if op == "set":
+                # The state dataclasses check their ranges on construction
+                updated = replace(state, **coerce_fields(state, command["state"]))
+            elif op == "keys":
+                updated = state
+                for key in command["keys"]:
+                    action = bindings.get(ord(key))
+                    if action is not None:
+                        updated = action(updated)
+            elif op == "select":
+                if self.select is None:
+                    raise ValueError("This pattern has nothing to select")
+                updated = self.select(state, command["name"])
+            else:
+                raise ValueError(f"Unknown op: {op}")
+            if self.validate is not None:
+                self.validate(updated)
+        except (KeyError, TypeError, ValueError, IndexError) as error:
+            self._reply(writer, {**reply, "ok": False, "error": str(error)})
+            return state
+        self.applied += 1
+        self.pending.append((self.applied, writer, reply))
+        return updated
+
+    def presented(self, state, applied):
+        """
+        Acknowledges the commands included in the presented frame.
+
+        Args:
+            state: The presented state.
+            applied (int): `self.applied` when that state was handed to the renderer;
+                           every command up to it is part of the frame, even if later
+                           key presses changed the state before it was rendered.
+        """
+        count = 0
+        while count < len(self.pending) and self.pending[count][0] <= applied:
+            count += 1
+        if count == 0:
+            return
+        now = time.perf_counter()
+        shown = asdict(state)
+        for _, writer, reply in self.pending[:count]:
+            self._reply(writer, {**reply, "ok": True, "state": shown, "presented_s": now})
+        del self.pending[:count]
+
+    def reject(self, error):
+        """
+        Answers every command awaiting a frame with an error, after rendering their
+        result failed and the loop went back to the last presented state.
+        """
+        for _, writer, reply in self.pending:
+            self._reply(
+                writer, {**reply, "ok": False, "error": f"Cannot render the state: {error}"}
+            )
+        self.pending.clear()
+
+
+class ControlClient:
+    """
+    Blocking client for a `ControlServer`, for use in experiment scripts.
+
+    Args:
+        address (str): Server address, see `parse_address`.
+        timeout_s (float): Socket timeout.
+    """
+
+    def __init__(self, address=DEFAULT_ADDRESS, timeout_s=5.0):
+        kind, target = parse_address(address)
+        if kind == "unix":
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.socket.settimeout(timeout_s)
+        self.socket.connect(target)
+        self.stream = self.socket.makefile("rb")
+        self.next_id = 0
+
+    def request(self, *commands):
+        """
+        Sends commands as one batch and waits for all of their replies.
+
+        Returns:
+            list: One reply dict per command, in order.
+        """
+        ids = []
+        for command in commands:
+            self.next_id += 1
+            command["id"] = self.next_id
+            ids.append(self.next_id)
+        message = commands[0] if len(commands) == 1 else list(commands)
+        self.socket.sendall(json.dumps(message).encode() + b"\n")
+        replies = {}
+        while len(replies) < len(ids):
+            line = self.stream.readline()
+            if not line:
+                raise ConnectionError("Control server closed the connection")
+            reply = json.loads(line)
+            replies[reply.get("id")] = reply
+        return [replies[i] for i in ids]
+
+    def set(self, **fields):
+        return self.request({"op": "set", "state": fields})[0]
+
+    def keys(self, keys):
+        return self.request({"op": "keys", "keys": keys})[0]
+
+    def select(self, name):
+        return self.request({"op": "select", "name": name})[0]
+
+    def get(self):
+        return self.request({"op": "get"})[0]["state"]
+
+    def close(self):
+        self.stream.close()
+        self.socket.close()
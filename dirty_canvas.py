@@ -0,0 +1,65 @@
+import numpy as np
+
+
+class DirtyCanvas:
+    """
+    Persistent single-channel canvas that tracks the regions drawn since the last erase.
+
+    Shape generators draw onto the same buffer every frame: `erase` restores only the
+    rectangles marked with `mark`, so moving a small shape costs work proportional to
+    the shape rather than to the screen. The canvas is returned to callers as-is, so
+    it is overwritten by the next frame; copy it if it has to be kept.
+
+    Args:
+        width (int): Width of the canvas in pixels.
+        height (int): Height of the canvas in pixels.
+        background (int): Gray value of the background.
+    """
+
+    def __init__(self, width, height, background=0):
+        self.width = width
+        self.height = height
+        self.background = background
+        self.canvas = np.full((height, width), background, dtype=np.uint8)
+        self.dirty = []
+
+    def fill(self, background):
+        """
+        Repaints the whole canvas with a new background value.
+        """
+        self.background = background
+        self.canvas.fill(background)
+        self.dirty.clear()
+
+    def mark(self, x0, y0, x1, y1):
+        """
+        Records the inclusive rectangle [x0, x1] x [y0, y1] as drawn, clipped to the canvas.
+
+        Returns:
+            tuple or None: The clipped rectangle as (x0, y0, x1, y1) with exclusive
+                           end coordinates, or None if it lies outside the canvas.
+        """
+        x0, y0 = max(0, x0), max(0, y0)
+        x1, y1 = min(self.width, x1 + 1), min(self.height, y1 + 1)
+        if x0 >= x1 or y0 >= y1:
+            return None
+        rect = (x0, y0, x1, y1)
+        self.dirty.append(rect)
+        return rect
+
+    def erase(self):
+        """
+        Restores the background inside every marked rectangle.
+        """
+        for x0, y0, x1, y1 in self.dirty:
+            self.canvas[y0:y1, x0:x1] = self.background
+        self.dirty.clear()
+
+
+def rects_overlap(a, b):
+    """
+    Returns True when two (x0, y0, x1, y1) rectangles with exclusive ends intersect.
+    """
+    if a is None or b is None:
+        return False
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
@@ -0,0 +1,456 @@
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from display_sinks import ESCAPE_KEY
+from frame_timing import FrameTimer, StatusPrinter
+from session_journal import JournalWriter
+
+SUMMARY_KEY = 9  # Tab prints the frame timing summary
+
+
+def key_bindings(table):
+    """
+    Expands a declarative key table into a lookup from key code to action.
+
+    Keys may be given as a string, in which case every character is bound to the
+    same action (e.g. "=+"), or directly as an integer key code (e.g. 27).
+
+    Args:
+        table (dict): Mapping of key(s) to an action. An action takes the current
+                      state and returns the new state.
+
+    Returns:
+        dict: Mapping of integer key codes to actions.
+    """
+    bindings = {}
+    for keys, action in table.items():
+        if isinstance(keys, int):
+            bindings[keys] = action
+        else:
+            for key in keys:
+                bindings[ord(key)] = action
+    return bindings
+
+
+def with_stages(render, *stages):
+    """
+    Appends output stages (e.g. `PhaseLUT.apply`) to a render function.
+
+    Args:
+        render (callable): Returns the frame for a given state.
+        *stages (callable or None): Frame-to-frame transforms applied in order;
+                                    None entries are skipped.
+
+    Returns:
+        callable: A render function producing the transformed frame.
+    """
+    stages = [stage for stage in stages if stage is not None]
+    if not stages:
+        return render
+
+    def render_with_stages(state):
+        frame = render(state)
+        for stage in stages:
+            frame = stage(frame)
+        return frame
+
+    return render_with_stages
+
+
+class RenderError(RuntimeError):
+    """
+    Raised by `BackgroundRenderer.present_ready` when rendering `state` failed; the
+    render function's exception is the cause.
+    """
+
+    def __init__(self, state):
+        super().__init__("Background rendering failed")
+        self.state = state
+
+
+class BackgroundRenderer:
+    """
+    Renders frames on a worker thread into two preallocated buffers.
+
+    The GUI thread submits states and presents whichever buffer was completed last,
+    while the worker renders the next state into the other buffer. Only the most
+    recently submitted state is rendered: states submitted while the worker is busy
+    replace each other, so input that outruns rendering never queues up stale frames.
+
+    Args:
+        render (callable): Returns the frame for a given state. It is only ever
+                           called from the worker thread.
+    """
+
+    def __init__(self, render):
+        self.render = render
+        self.buffers = None
+        self._condition = threading.Condition()
+        self._pending = None
+        self._has_pending = False
+        # (state, buffer index, render seconds) of the newest unpresented frame
+        self._ready = None
+        self._presenting = None  # Buffer index the GUI thread is presenting
+        self._rendering = False
+        self._last_written = 1
+        self._stopped = False
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name="slm-render", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+        self._thread.join()
+
+    def submit(self, state):
+        """
+        Requests a frame for `state`, superseding any state not yet picked up.
+        """
+        with self._condition:
+            self._pending = state
+            self._has_pending = True
+            self._condition.notify_all()
+
+    @property
+    def busy(self):
+        """
+        True while a submitted frame has not been presented yet.
+        """
+        with self._condition:
+            return self._has_pending or self._rendering or self._ready is not None
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._has_pending and not self._stopped:
+                    self._condition.wait()
+                if self._stopped:
+                    return
+                state = self._pending
+                self._has_pending = False
+                self._rendering = True
+
+                # Write into whichever buffer is not on screen; an unpresented frame
+                # in that buffer is stale now and is dropped
+                target = 1 - self._last_written
+                if target == self._presenting:
+                    target = 1 - target
+                if self._ready is not None and self._ready[1] == target:
+                    self._ready = None
+
+            try:
+                start = time.perf_counter()
+                frame = self.render(state)
+                if self.buffers is None:
+                    self.buffers = np.empty((2,) + frame.shape, dtype=frame.dtype)
+                np.copyto(self.buffers[target], frame)
+                render_s = time.perf_counter() - start
+            except Exception as error:
+                # Reported by the next `present_ready`; the worker keeps serving states
+                with self._condition:
+                    self._error = (error, state)
+                    self._rendering = False
+                continue
+
+            with self._condition:
+                self._ready = (state, target, render_s)
+                self._last_written = target
+                self._rendering = False
+                self._condition.notify_all()
+
+    def present_ready(self, sink):
+        """
+        Presents the newest completed frame, if there is one not yet presented.
+
+        Returns:
+            tuple or None: (state, render seconds) of the presented frame, or None
+                           when nothing new was ready.
+
+        Raises:
+            RenderError: Rendering a submitted state failed.
+        """
+        with self._condition:
+            if self._error is not None:
+                (error, state), self._error = self._error, None
+                raise RenderError(state) from error
+            if self._ready is None:
+                return None
+            state, index, render_s = self._ready
+            self._ready = None
+            self._presenting = index
+        try:
+            sink.present(self.buffers[index])
+        finally:
+            with self._condition:
+                self._presenting = None
+        return state, render_s
+
+
+class _LoopTelemetry:
+    # Records frame timings and prints throttled status lines for the keyboard loops
+
+    def __init__(self, timer, status, status_rate_hz, report_interval_s, journal=None):
+        self.timer = timer
+        self.journal = journal
+        self.status = status
+        self.printer = StatusPrinter(status_rate_hz)
+        self.report_interval_s = report_interval_s
+        self.waited = 0.0
+        self.last_report = time.perf_counter()
+        self.reported_count = 0
+
+    def frame(self, state, render_s, present_s):
+        # The frame is already on the SLM: a failing journal or status line must not
+        # end the loop, so both report the error and carry on
+        if self.journal is not None:
+            try:
+                self.journal.record(state)
+            except Exception as error:
+                print(f"Journal recording stopped: {error!r}")
+                self.journal.close()
+                self.journal = None
+        self.timer.record(time.perf_counter(), render_s, present_s, self.waited)
+        self.waited = 0.0
+        if self.status is not None:
+            try:
+                line = self.status(state)
+            except Exception as error:
+                line = f"Status unavailable: {error!r}"
+            self.printer.update(line)
+
+    def wait(self, sink, state, bindings, exit_keys, delay_ms):
+        start = time.perf_counter()
+        result = _apply_keys(sink, state, bindings, exit_keys, delay_ms, self.timer)
+        now = time.perf_counter()
+        self.waited += now - start
+
+        self.printer.flush()
+        if (
+            self.report_interval_s
+            and now - self.last_report >= self.report_interval_s
+            and self.timer.count != self.reported_count
+        ):
+            print(self.timer.format_summary())
+            self.last_report = now
+            self.reported_count = self.timer.count
+        return result
+
+    def close(self, timing_csv):
+        self.printer.flush(force=True)
+        if self.journal is not None:
+            self.journal.close()
+        if timing_csv:
+            self.timer.dump_csv(timing_csv)
+
+
+def _apply_keys(sink, state, bindings, exit_keys, delay_ms, timer=None):
+    # Block until a key arrives, then drain whatever else is already queued
+    key = sink.wait_key(delay_ms)
+    while key != -1:
+        key &= 0xFF  # Mask to get the last 8 bits
+        if key in exit_keys:
+            return state, True
+        if key == SUMMARY_KEY and timer is not None:
+            print(timer.format_summary())
+        action = bindings.get(key)
+        if action is not None:
+            state = action(state)
+        key = sink.wait_key(1)
+    return state, False
+
+
+def run_keyboard_loop(
+    sink,
+    state,
+    render,
+    bindings,
+    status=None,
+    poll_ms=50,
+    exit_keys=(ESCAPE_KEY,),
+    render_thread=False,
+    timer=None,
+    status_rate_hz=10.0,
+    report_interval_s=None,
+    timing_csv=None,
+    control=None,
+    journal_path=None,
+    journal_context=None,
+):
+    """
+    Presents `render(state)` and updates the state from keyboard input.
+
+    The frame is only rendered and shown again when a key press actually changes
+    the state. Keys that are already queued when a press arrives (e.g. a held key
+    auto-repeating) are applied together, so a burst costs a single render.
+
+    With `render_thread`, rendering runs on a `BackgroundRenderer` so the loop keeps
+    reading keys and presenting while a slow frame is being produced.
+
+    Render, present and input-wait durations of every presented frame are recorded
+    in a `FrameTimer`. Tab prints a summary of them at any time.
+
+    With a `ControlServer`, commands from its clients are applied alongside the keys
+    and acknowledged once their frame has been presented. Keys are then polled every
+    millisecond and the rest of `poll_ms` is spent waiting for commands.
+
+    Args:
+        sink: Output sink that presents frames and reads keys, e.g. `OpenCVWindowSink`.
+        state: Initial state. Must support `==` (e.g. a frozen dataclass).
+        render (callable): Returns the frame to show for a given state.
+        bindings (dict): Mapping of key codes to actions, see `key_bindings`.
+        status (callable, optional): Returns a status line to print for a state.
+        poll_ms (int): How long to block waiting for input on each iteration.
+        exit_keys (tuple): Key codes that end the loop.
+        render_thread (bool): Render on a background thread.
+        timer (FrameTimer, optional): Where frame timings are recorded. A new one is
+                                      created if not given.
+        status_rate_hz (float): Maximum status lines printed per second.
+        report_interval_s (float, optional): Print a timing summary this often.
+        timing_csv (str, optional): Write the recorded frame timings here on exit.
+        control (ControlServer, optional): Started server to take commands from.
+        journal_path (str, optional): Record every presented state to this session
+                                      journal, see `session_journal.replay_session`.
+        journal_context (dict, optional): How `render` can be rebuilt for replay, stored
+                                          in the journal, see `session_journal.session_render`.
+
+    Returns:
+        The last state, when an exit key is pressed.
+    """
+    if timer is None:
+        timer = FrameTimer()
+    journal = None
+    if journal_path:
+        journal = JournalWriter(journal_path, type(state), journal_context)
+    telemetry = _LoopTelemetry(timer, status, status_rate_hz, report_interval_s, journal)
+    try:
+        if render_thread:
+            return _run_threaded_loop(
+                sink, state, render, bindings, poll_ms, exit_keys, telemetry, control
+            )
+
+        presented = None
+        included = 0  # Control commands included in the presented frame
+        remote = None  # (state made by the last control commands, state before them)
+        while True:
+            if state != presented:
+                start = time.perf_counter()
+                try:
+                    frame = render(state)
+                except Exception as error:
+                    if not _can_reject(control, remote, state):
+                        raise
+                    # A remote command must not end the loop: undo it and report why
+                    control.reject(error)
+                    state, remote = remote[1], None
+                    continue
+                rendered = time.perf_counter()
+                sink.present(frame)
+                telemetry.frame(state, rendered - start, time.perf_counter() - rendered)
+                presented = state
+            if control is not None:
+                # Everything applied so far is reflected in the presented state
+                included = control.applied
+
+            key_ms = poll_ms if control is None else 1
+            state, done = telemetry.wait(sink, state, bindings, exit_keys, key_ms)
+            if done:
+                return state
+            if control is not None:
+                # The key wait above has painted the frame, so it can be acknowledged
+                state, remote = _poll_control(
+                    control,
+                    telemetry,
+                    presented,
+                    included,
+                    state,
+                    bindings,
+                    (poll_ms - 1) / 1e3,
+                    remote,
+                )
+    finally:
+        telemetry.close(timing_csv)
+
+
+def _can_reject(control, remote, failed):
+    # Whether a failed render is of a state made by pending remote commands, which can
+    # be undone; failures of states made by key presses end the loop as before
+    return (
+        control is not None and control.pending and remote is not None and failed == remote[0]
+    )
+
+
+def _poll_control(control, telemetry, shown, included, state, bindings, wait_s, remote):
+    # Returns the new state and the (remote state, state before it) pair of `_can_reject`
+    start = time.perf_counter()
+    if shown is not None:
+        control.presented(shown, included)
+    earlier = bool(control.pending)  # Commands still waiting for their frame
+    updated = control.apply(state, bindings, wait_s)
+    telemetry.waited += time.perf_counter() - start
+    if updated != state:
+        # Undoing reverts every pending command, back to before the first of them
+        remote = (updated, remote[1] if remote is not None and earlier else state)
+    return updated, remote
+
+
+def _run_threaded_loop(
+    sink, state, render, bindings, poll_ms, exit_keys, telemetry, control=None
+):
+    renderer = BackgroundRenderer(render).start()
+    submitted = None
+    shown = None
+    remote = None  # See `_can_reject`
+    included = 0  # Control commands included in the shown frame
+    # (state, control commands applied when it was submitted), oldest first
+    in_flight = deque()
+    try:
+        while True:
+            if state != submitted:
+                renderer.submit(state)
+                submitted = state
+                in_flight.append((state, control.applied if control is not None else 0))
+
+            start = time.perf_counter()
+            try:
+                presented = renderer.present_ready(sink)
+            except RenderError as error:
+                if not _can_reject(control, remote, error.state):
+                    raise
+                control.reject(error.__cause__)
+                state, remote = remote[1], None
+                in_flight.clear()
+                continue
+            if presented is not None:
+                shown, render_s = presented
+                telemetry.frame(shown, render_s, time.perf_counter() - start)
+                # The frame includes the commands of its submission and of every
+                # earlier one, which it superseded
+                matches = [i for i, (submission, _) in enumerate(in_flight) if submission == shown]
+                if matches:
+                    included = in_flight[matches[-1]][1]
+                    for _ in range(matches[-1] + 1):
+                        in_flight.popleft()
+            if control is not None and state == shown and not renderer.busy:
+                # Commands that left the state as shown need no new frame
+                included = control.applied
+
+            # Poll quickly while a frame is in flight so it is shown as soon as it is ready
+            delay_ms = 1 if renderer.busy or control is not None else poll_ms
+            state, done = telemetry.wait(sink, state, bindings, exit_keys, delay_ms)
+            if done:
+                return state
+            if control is not None:
+                wait_s = 0.0 if renderer.busy else (poll_ms - 1) / 1e3
+                state, remote = _poll_control(
+                    control, telemetry, shown, included, state, bindings, wait_s, remote
+                )
+    finally:
+        renderer.stop()
@@ -0,0 +1,241 @@
+import json
+import os
+from dataclasses import asdict, dataclass
+
+import numpy as np
+
+ESCAPE_KEY = 27
+
+# Set SLM_FAKE_MONITORS="1920x1080,3840x2160" to run the scripts without physical displays
+FAKE_MONITORS_ENV = "SLM_FAKE_MONITORS"
+
+# Set SLM_MONITOR_CACHE=/path/to/monitors.json to reuse one enumeration across runs
+MONITOR_CACHE_ENV = "SLM_MONITOR_CACHE"
+
+_fake_monitors = None
+_monitors = None
+
+
+@dataclass(frozen=True)
+class FakeMonitor:
+    """
+    Stand-in for a screeninfo monitor, for running without a physical display or
+    when monitors are read back from the monitor cache.
+    """
+
+    width: int
+    height: int
+    x: int = 0
+    y: int = 0
+    name: str = "fake"
+
+
+def use_fake_monitors(monitors):
+    """
+    Makes `get_monitors` return the given monitors instead of querying the system.
+
+    Args:
+        monitors (list or None): Monitors to report, or None to restore screeninfo.
+    """
+    global _fake_monitors
+    _fake_monitors = None if monitors is None else list(monitors)
+
+
+def _monitors_from_env(spec):
+    monitors = []
+    x = 0
+    for i, size in enumerate(spec.split(",")):
+        width, height = (int(v) for v in size.lower().split("x"))
+        monitors.append(FakeMonitor(width, height, x=x, name=f"fake{i}"))
+        x += width
+    return monitors
+
+
+def _enumerate_monitors(cache_path, refresh):
+    if cache_path and not refresh:
+        try:
+            with open(cache_path) as f:
+                return [FakeMonitor(**record) for record in json.load(f)]
+        except (OSError, ValueError, TypeError):
+            pass  # Missing or unreadable cache: enumerate and rewrite it
+
+    import screeninfo
+
+    monitors = screeninfo.get_monitors()
+    if cache_path:
+        records = [
+            asdict(FakeMonitor(m.width, m.height, m.x, m.y, m.name or f"monitor{i}"))
+            for i, m in enumerate(monitors)
+        ]
+        with open(cache_path, "w") as f:
+            json.dump(records, f)
+    return monitors
+
+
+def get_monitors(refresh=False):
+    """
+    Returns the available monitors: fake ones if configured, otherwise from screeninfo.
+
+    screeninfo is queried once per process. With SLM_MONITOR_CACHE set, the result is
+    also saved to that file and read back by later processes instead of querying.
+
+    Args:
+        refresh (bool): Query screeninfo again, replacing the cached monitors.
+    """
+    global _monitors
+    if _fake_monitors is not None:
+        return list(_fake_monitors)
+    spec = os.environ.get(FAKE_MONITORS_ENV)
+    if spec:
+        return _monitors_from_env(spec)
+
+    if _monitors is None or refresh:
+        _monitors = _enumerate_monitors(os.environ.get(MONITOR_CACHE_ENV), refresh)
+    return list(_monitors)
+
+
+def open_projector_window(screen, window_name="projector", offset=(0, 0)):
+    """
+    Opens a borderless full-screen window on the given monitor.
+
+    Args:
+        screen: Monitor description with `x` and `y` attributes (e.g. from screeninfo).
+        window_name (str): Name of the OpenCV window.
+        offset (tuple): Extra (x, y) shift applied when moving the window.
+    """
+    import cv2
+
+    cv2.namedWindow(window_name, cv2.WINDOW_NORMAL)
+    cv2.moveWindow(window_name, screen.x + offset[0], screen.y + offset[1])
+    cv2.setWindowProperty(window_name, cv2.WND_PROP_FULLSCREEN, cv2.WINDOW_FULLSCREEN)
+
+
+class OpenCVWindowSink:
+    """
+    Presents frames in a full-screen OpenCV window and reads keys from it.
+
+    Args:
+        screen: Monitor to open the window on.
+        window_name (str): Name of the OpenCV window.
+        offset (tuple): Extra (x, y) shift applied when moving the window.
+        fullscreen (bool): If False, opens an ordinary resizable window instead and
+                           `screen` may be None.
+    """
+
+    def __init__(self, screen, window_name="projector", offset=(0, 0), fullscreen=True):
+        import cv2
+
+        self._cv2 = cv2
+        self.window_name = window_name
+        if fullscreen:
+            open_projector_window(screen, window_name, offset)
+        else:
+            cv2.namedWindow(window_name, cv2.WINDOW_NORMAL)
+
+    def present(self, frame):
+        self._cv2.imshow(self.window_name, frame)
+
+    def wait_key(self, delay_ms):
+        return self._cv2.waitKey(delay_ms)
+
+    def close(self):
+        self._cv2.destroyWindow(self.window_name)
+
+
+class MemorySink:
+    """
+    Keeps presented frames in memory, for tests and benchmarks without a display.
+
+    Frames are copied into a ring of `capacity` preallocated slots, allocated on the
+    first `present`. Without `keys`, `wait_key` never reports a key press. With
+    `keys`, successive `wait_key` calls return them in order and then Escape, so a
+    keyboard loop driven by a script terminates on its own.
+
+    Args:
+        capacity (int): Number of most recent frames to keep.
+        keys (iterable, optional): Key codes returned by successive `wait_key` calls.
+    """
+
+    def __init__(self, capacity=1, keys=None):
+        self.capacity = capacity
+        self.frames = None
+        self.presented = 0
+        self._keys = None if keys is None else iter(keys)
+
+    def present(self, frame):
+        if self.frames is None:
+            self.frames = np.empty((self.capacity,) + frame.shape, dtype=frame.dtype)
+        self.frames[self.presented % self.capacity] = frame
+        self.presented += 1
+
+    @property
+    def last_frame(self):
+        if self.presented == 0:
+            return None
+        return self.frames[(self.presented - 1) % self.capacity]
+
+    def wait_key(self, delay_ms):
+        if self._keys is None:
+            return -1
+        return next(self._keys, ESCAPE_KEY)
+
+    def close(self):
+        pass
+
+
+def _npy_header(shape, dtype, length=None):
+    # Version 1.0 .npy header, padded with spaces to `length` bytes when given
+    header = "{'descr': %r, 'fortran_order': False, 'shape': %r, }" % (
+        np.lib.format.dtype_to_descr(np.dtype(dtype)),
+        tuple(shape),
+    )
+    if length is None:
+        length = -(-(10 + len(header) + 1) // 64) * 64
+    header = header.ljust(length - 10 - 1) + "\n"
+    return b"\x93NUMPY\x01\x00" + np.uint16(len(header)).tobytes() + header.encode("latin1")
+
+
+class FileSink:
+    """
+    Streams presented frames to disk.
+
+    A path ending in `.npy` produces a (N, height, width) array loadable with
+    `numpy.load`; the header is rewritten with the final frame count on `close`.
+    Any other path receives the raw frame bytes back to back.
+
+    Args:
+        path (str): Output file path.
+    """
+
+    # Header space reserved up front, large enough for any frame count and shape
+    HEADER_LENGTH = 128
+
+    def __init__(self, path):
+        self.path = path
+        self.is_npy = path.endswith(".npy")
+        self.file = open(path, "wb")
+        self.shape = None
+        self.dtype = None
+        self.presented = 0
+        if self.is_npy:
+            self.file.write(b"\0" * self.HEADER_LENGTH)
+
+    def present(self, frame):
+        if self.shape is None:
+            self.shape, self.dtype = frame.shape, frame.dtype
+        elif frame.shape != self.shape:
+            raise ValueError(f"Frame shape {frame.shape} does not match {self.shape}")
+        self.file.write(np.ascontiguousarray(frame, dtype=self.dtype).data)
+        self.presented += 1
+
+    def wait_key(self, delay_ms):
+        return -1
+
+    def close(self):
+        if self.file.closed:
+            return
+        if self.is_npy:
+            shape = (self.presented,) + (self.shape or (0, 0))
+            self.file.seek(0)
+            self.file.write(_npy_header(shape, self.dtype or np.uint8, self.HEADER_LENGTH))
+        self.file.close()
@@ -1,105 +1,176 @@
+from dataclasses import dataclass, replace
+
 import cv2
-import numpy as np
-import screeninfo
 
+from dirty_canvas import DirtyCanvas
+from display_control import key_bindings, run_keyboard_loop, with_stages
+from display_sinks import OpenCVWindowSink, get_monitors
+from phase_lut import load_lut
 
-def display_double_slit_with_keyboard_control(screen_id):
-    # Get the size and position of the specified screen
-    screen = screeninfo.get_monitors()[screen_id]
-    width, height = screen.width, screen.height
+BACKGROUND = 0
+SLIT_COLOR = 180
 
-    # Initial position: center between the two slits
-    x_offset, y_offset = 852, height // 2  # You may adjust these values as needed
 
-    # Slit properties
-    slit_width = 5  # Width of each slit in pixels
-    slit_height = height  # Height of each slit in pixels
-    separation = 20  # Separation between the two slits in pixels
+@dataclass(frozen=True)
+class DoubleSlitState:
+    x_offset: int  # Center between the two slits
+    y_offset: int
+    slit_width: int = 5  # Width of each slit in pixels
+    separation: int = 20  # Separation between the two slits in pixels
 
-    window_name = "projector"
-    cv2.namedWindow(window_name, cv2.WINDOW_NORMAL)
-    cv2.moveWindow(window_name, screen.x - 1, screen.y - 1)
-    cv2.setWindowProperty(window_name, cv2.WND_PROP_FULLSCREEN, cv2.WINDOW_FULLSCREEN)
+    def __post_init__(self):
+        if self.slit_width < 0 or self.separation < 0:
+            raise ValueError("slit_width and separation must be >= 0")
 
-    while True:
-        # Create a blank canvas with a gray background
-        canvas = np.ones((height, width, 3), dtype=np.uint8) * 0
 
-        # Calculate half of the separation for positioning the slits
-        half_separation = separation // 2
+class DoubleSlitRenderer:
+    """
+    Draws the two slits on a persistent canvas, only touching the previous and new slit rectangles.
+    """
 
-        # Define top-left and bottom-right coordinates for the first slit
-        top_left1 = (
-            x_offset - half_separation - slit_width // 2,
-            y_offset - slit_height // 2,
-        )
-        bottom_right1 = (
-            x_offset - half_separation + slit_width // 2,
-            y_offset + slit_height // 2,
-        )
+    def __init__(self, width, height, slit_height=None):
+        if slit_height is None:
+            slit_height = height  # Height of each slit in pixels
+        self.slit_height = slit_height
+        self.canvas = DirtyCanvas(width, height, background=BACKGROUND)
 
-        # Define top-left and bottom-right coordinates for the second slit
-        top_left2 = (
-            x_offset + half_separation - slit_width // 2,
-            y_offset - slit_height // 2,
-        )
-        bottom_right2 = (
-            x_offset + half_separation + slit_width // 2,
-            y_offset + slit_height // 2,
-        )
-
-        # Draw the two slits as filled white rectangles
-        cv2.rectangle(canvas, top_left1, bottom_right1, (180, 180, 180), -1)
-        cv2.rectangle(canvas, top_left2, bottom_right2, (180, 180, 180), -1)
+    def render(self, state):
+        # Erase the previous slits
+        self.canvas.erase()
 
-        # Optional: Print the current center position and separation for debugging
-        print(
-            f"Center position (x_offset, y_offset): ({x_offset}, {y_offset}), Separation: {separation}"
+        # Calculate half of the separation for positioning the slits
+        half_separation = state.separation // 2
+        top = state.y_offset - self.slit_height // 2
+        bottom = state.y_offset + self.slit_height // 2
+
+        # Draw the two slits as filled gray rectangles, left slit first
+        for center in (
+            state.x_offset - half_separation,
+            state.x_offset + half_separation,
+        ):
+            top_left = (center - state.slit_width // 2, top)
+            bottom_right = (center + state.slit_width // 2, bottom)
+            cv2.rectangle(self.canvas.canvas, top_left, bottom_right, SLIT_COLOR, -1)
+            self.canvas.mark(*top_left, *bottom_right)
+        return self.canvas.canvas
+
+
+def render_double_slit(state, width, height, slit_height=None):
+    # One-off render on a fresh canvas
+    return DoubleSlitRenderer(width, height, slit_height).render(state)
+
+
+def double_slit_key_bindings(width, height, slit_height=None):
+    if slit_height is None:
+        slit_height = height
+
+    def move_vertical(dy):
+        return lambda state: replace(
+            state,
+            y_offset=min(
+                height - slit_height // 2, max(slit_height // 2, state.y_offset + dy)
+            ),
         )
 
-        # Display the canvas in the window
-        cv2.imshow(window_name, canvas)
-
-        # Wait for a key press for 10 ms
-        key = cv2.waitKey(10)
-
-        # Handle keyboard inputs to move the slits or adjust their properties
-        if key == ord("w"):  # Move up
-            y_offset = max(slit_height // 2, y_offset - 10)
-        elif key == ord("s"):  # Move down
-            y_offset = min(height - slit_height // 2, y_offset + 10)
-        elif key == ord("a"):  # Move left
-            x_offset = max(half_separation + slit_width // 2, x_offset - 10)
-        elif key == ord("d"):  # Move right
-            x_offset = min(width - half_separation - slit_width // 2, x_offset + 10)
-        elif key == ord("i"):  # Smaller move up
-            y_offset = max(slit_height // 2, y_offset - 2)
-        elif key == ord("k"):  # Smaller move down
-            y_offset = min(height - slit_height // 2, y_offset + 2)
-        elif key == ord("j"):  # Smaller move left
-            x_offset = max(half_separation + slit_width // 2, x_offset - 2)
-        elif key == ord("l"):  # Smaller move right
-            x_offset = min(width - half_separation - slit_width // 2, x_offset + 2)
-        elif key == ord("="):  # Increase slit width
-            slit_width += 1
-            # Ensure the slits remain visible within the screen
-            if slit_width > separation:
-                slit_width = separation
-        elif key == ord("-"):  # Decrease slit width
-            slit_width = max(1, slit_width - 1)
-        elif key == ord("o"):  # Increase separation
-            # Check if increasing separation keeps slits within screen bounds
-            if (x_offset + (half_separation + 1) + slit_width // 2) <= width:
-                separation += 1
-            else:
-                print("Maximum separation reached.")
-        elif key == ord("p"):  # Decrease separation
-            separation = max(2, separation - 1)  # Minimum separation of 2 pixels
-        elif key == 27:  # Escape key to exit
-            break
+    def move_horizontal(dx):
+        def action(state):
+            margin = state.separation // 2 + state.slit_width // 2
+            return replace(
+                state, x_offset=min(width - margin, max(margin, state.x_offset + dx))
+            )
+
+        return action
+
+    def widen(state):
+        # Ensure the slits remain visible within the screen
+        return replace(state, slit_width=min(state.slit_width + 1, state.separation))
+
+    def increase_separation(state):
+        # Check if increasing separation keeps slits within screen bounds
+        if (state.x_offset + (state.separation // 2 + 1) + state.slit_width // 2) <= width:
+            return replace(state, separation=state.separation + 1)
+        print("Maximum separation reached.")
+        return state
+
+    # Handle keyboard inputs to move the slits or adjust their properties
+    return key_bindings(
+        {
+            "w": move_vertical(-10),  # Move up
+            "s": move_vertical(10),  # Move down
+            "a": move_horizontal(-10),  # Move left
+            "d": move_horizontal(10),  # Move right
+            "i": move_vertical(-2),  # Smaller move up
+            "k": move_vertical(2),  # Smaller move down
+            "j": move_horizontal(-2),  # Smaller move left
+            "l": move_horizontal(2),  # Smaller move right
+            "=": widen,  # Increase slit width
+            "-": lambda state: replace(state, slit_width=max(1, state.slit_width - 1)),
+            "o": increase_separation,  # Increase separation
+            # Decrease separation, minimum separation of 2 pixels
+            "p": lambda state: replace(state, separation=max(2, state.separation - 1)),
+        }
+    )
+
+
+def display_double_slit_with_keyboard_control(
+    screen_id,
+    sink=None,
+    lut_path=None,
+    timing_csv=None,
+    state=None,
+    control=None,
+    preview=False,
+    journal_path=None,
+):
+    # Get the size and position of the specified screen
+    screen = get_monitors()[screen_id]
+    width, height = screen.width, screen.height
+
+    # Initial position: center between the two slits
+    if state is None:
+        state = DoubleSlitState(x_offset=852, y_offset=height // 2)  # You may adjust these values as needed
+
+    # Optional gray-level correction from an SLM calibration file
+    lut = load_lut(lut_path) if lut_path else None
+
+    if sink is None:
+        sink = OpenCVWindowSink(screen, "projector", offset=(-1, -1))
+
+    # Simulated diffraction pattern in a second window, fed before the LUT
+    if preview:
+        from far_field_preview import FarFieldPreview
+
+        preview = FarFieldPreview((height, width))
+
+    # Print the current center position and separation whenever they change
+    run_keyboard_loop(
+        sink,
+        state,
+        with_stages(
+            DoubleSlitRenderer(width, height).render,
+            preview.observe if preview else None,
+            lut and lut.apply,
+        ),
+        double_slit_key_bindings(width, height),
+        status=lambda state: (
+            f"Center position (x_offset, y_offset): ({state.x_offset}, {state.y_offset}), "
+            f"Separation: {state.separation}"
+        ),
+        timing_csv=timing_csv,
+        control=control,
+        journal_path=journal_path,
+        journal_context={
+            "pattern": "double_slit",
+            "width": width,
+            "height": height,
+            "lut_path": lut_path,
+        },
+    )
 
     # Clean up and close the window
-    cv2.destroyAllWindows()
+    sink.close()
+    if preview:
+        preview.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,250 @@
+import argparse
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from frame_timing import StatusPrinter
+
+# *  Batch export of pattern sequences and recorded sessions to files
+
+VIDEO_EXTENSIONS = (".mkv", ".avi")
+VIDEO_CODEC = "FFV1"  # Lossless
+
+# Per-process cache of renderers, LUTs and journals, shared by the chunks a worker renders
+_worker_cache = {}
+
+
+def export_format(output):
+    """
+    Returns the format written to `output`: "npy" for a .npy file, "video" for .mkv or
+    .avi, "npy-chunks" for a directory (one .npy file per chunk), otherwise "raw"
+    (frames back to back as uint8).
+    """
+    extension = os.path.splitext(output)[1].lower()
+    if output.endswith(os.sep) or os.path.isdir(output) or not extension:
+        return "npy-chunks"
+    if extension == ".npy":
+        return "npy"
+    if extension in VIDEO_EXTENSIONS:
+        return "video"
+    return "raw"
+
+
+def _cached(key, compute):
+    if key not in _worker_cache:
+        _worker_cache[key] = compute()
+    return _worker_cache[key]
+
+
+def _render_frames(source, start, stop, width, height, lut_path):
+    # Yields frames [start, stop) of a list of sequence entries or of a journal file
+    if isinstance(source, str):
+        from session_journal import SessionJournal, session_render
+
+        journal = _cached(("journal", source), lambda: SessionJournal(source))
+        render = _cached(("render", source), lambda: session_render(journal.context))
+        for state in journal.states[start:stop]:
+            yield render(state)
+        return
+
+    from frame_sequence import render_pattern
+    from phase_lut import load_lut
+
+    renderers = _cached(("renderers", width, height), dict)
+    lut = _cached(("lut", lut_path), lambda: load_lut(lut_path)) if lut_path else None
+    for spec in source:
+        frame = render_pattern(spec, width, height, renderers)
+        yield frame if lut is None else lut.apply(frame)
+
+
+def _export_chunk(source, start, stop, width, height, lut_path, output, kind):
+    # Runs in a worker process: renders one chunk straight into its place in the output,
+    # or returns it for the parent to encode when writing video
+    shape = (stop - start, height, width)
+    if kind == "raw":
+        offset = start * height * width
+        out = np.memmap(output, dtype=np.uint8, mode="r+", offset=offset, shape=shape)
+    elif kind == "npy":
+        out = np.load(output, mmap_mode="r+")[start:stop]
+    elif kind == "npy-chunks":
+        path = os.path.join(output, f"frames_{start:08d}.npy")
+        out = np.lib.format.open_memmap(path, mode="w+", dtype=np.uint8, shape=shape)
+    else:
+        out = np.empty(shape, dtype=np.uint8)
+    for i, frame in enumerate(_render_frames(source, start, stop, width, height, lut_path)):
+        out[i] = frame
+    if kind == "video":
+        return out
+    out.flush()
+    del out
+    return None
+
+
+class _VideoWriter:
+    # Lossless grayscale video; backends that cannot write gray frames get BGR ones
+
+    def __init__(self, path, width, height, fps):
+        import cv2
+
+        self.cv2 = cv2
+        fourcc = cv2.VideoWriter_fourcc(*VIDEO_CODEC)
+        self.writer = cv2.VideoWriter(path, fourcc, fps, (width, height), isColor=False)
+        self.gray = self.writer.isOpened()
+        if not self.gray:
+            self.writer = cv2.VideoWriter(path, fourcc, fps, (width, height), isColor=True)
+        if not self.writer.isOpened():
+            raise RuntimeError(f"Cannot write {VIDEO_CODEC} video to {path}")
+
+    def write(self, frame):
+        if not self.gray:
+            frame = self.cv2.cvtColor(frame, self.cv2.COLOR_GRAY2BGR)
+        self.writer.write(frame)
+
+    def close(self):
+        self.writer.release()
+
+
+def export_frames(
+    source,
+    output,
+    width=None,
+    height=None,
+    lut_path=None,
+    workers=None,
+    chunk_frames=32,
+    fps=30.0,
+    verbose=True,
+):
+    """
+    Renders a pattern sequence or a recorded session to a file, in parallel.
+
+    The frames are split into chunks of `chunk_frames` that worker processes render.
+    For raw and .npy outputs each worker writes its chunk straight into its place in
+    the memory-mapped output, so frame data never passes through the parent. For video
+    the parent encodes the chunks in order. At most two chunks per worker are in flight
+    at any time, so memory stays bounded however long the sequence is.
+
+    Args:
+        source (list or str): Pattern entries (see `frame_sequence.render_pattern`), a
+                              JSON sequence file, or a session journal file, which is
+                              rendered with its recorded size and LUT.
+        output (str): Output path; the format follows from it, see `export_format`.
+        width (int): Frame width, for sequences.
+        height (int): Frame height, for sequences.
+        lut_path (str, optional): Calibration applied to sequence frames.
+        workers (int, optional): Worker processes; defaults to the CPU count.
+        chunk_frames (int): Frames rendered per task.
+        fps (float): Frame rate stored in a video.
+        verbose (bool): Print progress about once a second.
+
+    Returns:
+        dict: Number of frames, elapsed seconds, frames per second and MB per second.
+    """
+    from session_journal import JOURNAL_EXTENSION, SessionJournal
+
+    if isinstance(source, str) and source.endswith(JOURNAL_EXTENSION):
+        journal = SessionJournal(source)
+        width, height = journal.context["width"], journal.context["height"]
+        count = len(journal)
+    else:
+        if isinstance(source, str):
+            from frame_sequence import load_sequence
+
+            source = load_sequence(source)
+        count = len(source)
+    if width is None or height is None:
+        raise ValueError("width and height are needed to export a sequence")
+
+    kind = export_format(output)
+    if kind == "raw":
+        with open(output, "wb") as f:
+            f.truncate(count * height * width)
+    elif kind == "npy":
+        # Writes the header and sizes the file; workers map it and fill their chunks
+        np.lib.format.open_memmap(output, mode="w+", dtype=np.uint8, shape=(count, height, width))
+    elif kind == "npy-chunks":
+        os.makedirs(output, exist_ok=True)
+    video = _VideoWriter(output, width, height, fps) if kind == "video" else None
+
+    workers = workers or os.cpu_count()
+    printer = StatusPrinter(1.0)
+    start_time = time.perf_counter()
+    done = 0
+
+    def report():
+        elapsed = time.perf_counter() - start_time
+        rate = done / elapsed if elapsed > 0 else 0.0
+        return {
+            "frames": done,
+            "elapsed_s": elapsed,
+            "fps": rate,
+            "mb_per_s": rate * width * height / 1e6,
+        }
+
+    def task(start):
+        stop = min(start + chunk_frames, count)
+        chunk = source if isinstance(source, str) else source[start:stop]
+        return executor.submit(
+            _export_chunk, chunk, start, stop, width, height, lut_path, output, kind
+        )
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            starts = iter(range(0, count, chunk_frames))
+            in_flight = deque(task(start) for _, start in zip(range(2 * workers), starts))
+            while in_flight:
+                frames = in_flight.popleft().result()
+                next_start = next(starts, None)
+                if next_start is not None:
+                    in_flight.append(task(next_start))
+                if video is not None:
+                    for frame in frames:
+                        video.write(frame)
+                done = min(done + chunk_frames, count)
+                if verbose:
+                    summary = report()
+                    printer.update(
+                        f"Exported {done}/{count} frames, {summary['fps']:.1f} fps, "
+                        f"{summary['mb_per_s']:.1f} MB/s"
+                    )
+    finally:
+        if video is not None:
+            video.close()
+    if verbose:
+        printer.flush(force=True)
+    return report()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Render a pattern sequence or session journal to raw, .npy or video."
+    )
+    parser.add_argument("source", help="JSON sequence or .slmjournal file")
+    parser.add_argument(
+        "output", help="frames.npy, frames.raw, frames.mkv (lossless) or a directory of chunks"
+    )
+    parser.add_argument("--size", default="1920x1080", help="Frame size WxH of a sequence")
+    parser.add_argument("--lut", help="SLM calibration file applied to sequence frames")
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--chunk-frames", type=int, default=32)
+    parser.add_argument("--fps", type=float, default=30.0, help="Frame rate of a video")
+    args = parser.parse_args()
+
+    width, height = (int(v) for v in args.size.lower().split("x"))
+    summary = export_frames(
+        args.source,
+        args.output,
+        width,
+        height,
+        lut_path=args.lut,
+        workers=args.workers,
+        chunk_frames=args.chunk_frames,
+        fps=args.fps,
+    )
+    print(
+        f"Wrote {summary['frames']} frames to {args.output} in {summary['elapsed_s']:.2f} s "
+        f"({summary['fps']:.1f} fps, {summary['mb_per_s']:.1f} MB/s)"
+    )
@@ -0,0 +1,230 @@
+import multiprocessing
+import queue
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from alignment import modulation_levels
+from display_sinks import OpenCVWindowSink
+from hologram import fft2
+
+# *  Live preview of the far field of the displayed pattern, computed in its own process
+
+# How often an idle preview checks for a new frame and keeps its window responsive
+IDLE_POLL_S = 0.01
+
+# Intensities this many decibels below the peak are shown black
+DYNAMIC_RANGE_DB = 40.0
+
+
+def open_preview_window():
+    """
+    Default sink factory of the preview: an ordinary resizable OpenCV window.
+    """
+    return OpenCVWindowSink(None, "far field", fullscreen=False)
+
+
+class FarFieldCalculator:
+    """
+    Far-field intensity of a square region of a gray-level frame, as a uint8 image.
+
+    Gray levels are turned into the complex field with a lookup table, the field is
+    averaged over `downsample` x `downsample` blocks (a low-pass, so decimating it
+    does not alias higher orders into the image), transformed and log-scaled. The
+    FFT size never changes, so its plan is computed once, and all arrays are
+    allocated up front.
+
+    Args:
+        size (int): Side of the computed far field; the region is size * downsample.
+        downsample (int): Block size the field is averaged over.
+        modulation (str): "phase" or "amplitude", see `alignment.modulation_levels`.
+        workers (int): FFT threads, see `hologram.HologramEngine`.
+    """
+
+    def __init__(self, size, downsample=1, modulation="phase", workers=1):
+        self.size = size
+        self.downsample = downsample
+        self.workers = workers
+        self.levels = modulation_levels(modulation)
+        extent = size * downsample
+        self.values = np.empty((extent, extent), dtype=np.complex64)
+        self.field = np.empty((size, size), dtype=np.complex64)
+        self.intensity = np.empty((size, size), dtype=np.float32)
+        self.image = np.empty((size, size), dtype=np.uint8)
+
+    def __call__(self, region):
+        """
+        Returns the log-scaled far field of `region`, with the zero order in the centre.
+        The image is a reused buffer.
+        """
+        n, d = self.size, self.downsample
+        if d == 1:
+            np.take(self.levels, region, out=self.field)
+        else:
+            np.take(self.levels, region, out=self.values)
+            np.mean(self.values.reshape(n, d, n, d), axis=(1, 3), out=self.field)
+        fft2(self.field[None], workers=self.workers)
+
+        intensity = self.intensity
+        np.abs(self.field, out=intensity)
+        np.square(intensity, out=intensity)
+        intensity /= max(float(intensity.max()), 1e-30)
+        np.maximum(intensity, 10 ** (-DYNAMIC_RANGE_DB / 10), out=intensity)
+        np.log10(intensity, out=intensity)
+        intensity *= 10 * 255 / DYNAMIC_RANGE_DB
+        intensity += 255
+        self.image[:] = np.fft.fftshift(intensity)
+        return self.image
+
+
+def _preview_far_field(
+    memory_name,
+    extent,
+    size,
+    downsample,
+    modulation,
+    sink_factory,
+    lock,
+    sequence,
+    updated,
+    closing,
+    results,
+):
+    # Preview process: computes the newest handed-over region whenever it is idle, so
+    # frames arriving faster than it computes are skipped rather than queued
+    memory = shared_memory.SharedMemory(name=memory_name)
+    slot = np.ndarray((extent, extent), dtype=np.uint8, buffer=memory.buf)
+    region = np.empty_like(slot)
+    calculator = FarFieldCalculator(size, downsample, modulation)
+    sink = sink_factory()
+    computed = skipped = last = 0
+    try:
+        while not closing.is_set():
+            if not updated.wait(IDLE_POLL_S):
+                sink.wait_key(1)  # Keep the window responsive
+                continue
+            updated.clear()
+            with lock:
+                np.copyto(region, slot)
+                current = sequence.value
+            if current == last:
+                continue
+            skipped += current - last - 1
+            last = current
+            sink.present(calculator(region))
+            sink.wait_key(1)
+            computed += 1
+    finally:
+        last_frame = getattr(sink, "last_frame", None)
+        results.put(
+            {
+                "observed": sequence.value,
+                "computed": computed,
+                "skipped": skipped,
+                "last_frame": None if last_frame is None else np.array(last_frame),
+            }
+        )
+        sink.close()
+        del slot
+        memory.close()
+
+
+class FarFieldPreview:
+    """
+    Shows the simulated far field of the presented frames in a separate window.
+
+    `observe` is a render stage (see `display_control.with_stages`): it copies the
+    previewed region of each frame into shared memory and returns at once. A separate
+    process computes and shows the far field of the newest region whenever it is
+    free, so a slow preview drops frames instead of slowing down the SLM loop. Place
+    the stage before the LUT, whose input is proportional to the phase.
+
+    Args:
+        frame_shape (tuple): (height, width) of the observed frames.
+        size (int): Side of the preview image.
+        downsample (int): The previewed region is a square of size * downsample pixels,
+                          averaged down to size x size before the transform.
+        center (tuple, optional): (row, column) the region is centred on; defaults to
+                                  the frame centre. The region is kept inside the frame.
+        modulation (str): "phase" or "amplitude".
+        sink_factory (callable): Creates the preview's sink in the preview process; must
+                                 be picklable, e.g. a module-level function.
+    """
+
+    def __init__(
+        self,
+        frame_shape,
+        size=256,
+        downsample=2,
+        center=None,
+        modulation="phase",
+        sink_factory=open_preview_window,
+    ):
+        height, width = frame_shape
+        extent = size * downsample
+        if extent > min(height, width):
+            raise ValueError(f"A {extent} pixel preview region does not fit in {width}x{height}")
+        row, column = center or (height // 2, width // 2)
+        top = min(max(row - extent // 2, 0), height - extent)
+        left = min(max(column - extent // 2, 0), width - extent)
+        self.region = (slice(top, top + extent), slice(left, left + extent))
+
+        # Spawned like the multi-screen presenters, for a clean GUI toolkit state
+        context = multiprocessing.get_context("spawn")
+        self.memory = shared_memory.SharedMemory(create=True, size=extent * extent)
+        self.slot = np.ndarray((extent, extent), dtype=np.uint8, buffer=self.memory.buf)
+        self.lock = context.Lock()
+        self.sequence = context.Value("Q", 0, lock=False)  # Guarded by self.lock
+        self.updated = context.Event()
+        self.closing = context.Event()
+        self.results = context.Queue()
+        self.process = context.Process(
+            target=_preview_far_field,
+            args=(
+                self.memory.name,
+                extent,
+                size,
+                downsample,
+                modulation,
+                sink_factory,
+                self.lock,
+                self.sequence,
+                self.updated,
+                self.closing,
+                self.results,
+            ),
+            daemon=True,
+        )
+        self.process.start()
+
+    def observe(self, frame):
+        """
+        Hands the previewed region of `frame` to the preview and returns `frame` unchanged.
+        """
+        with self.lock:
+            np.copyto(self.slot, frame[self.region])
+            self.sequence.value += 1
+        self.updated.set()
+        return frame
+
+    def close(self, timeout_s=10.0):
+        """
+        Stops the preview process and frees the shared memory.
+
+        Returns:
+            dict or None: Numbers of observed, computed and skipped frames and, for sinks
+                          that keep it (such as `MemorySink`), the last preview image;
+                          None if the process did not report.
+        """
+        self.closing.set()
+        try:
+            report = self.results.get(timeout=timeout_s if self.process.is_alive() else 0.1)
+        except queue.Empty:
+            report = None
+        self.process.join(timeout_s)
+        if self.process.is_alive():
+            self.process.terminate()
+        del self.slot
+        self.memory.close()
+        self.memory.unlink()
+        return report
@@ -0,0 +1,392 @@
+import json
+import threading
+import time
+
+import numpy as np
+
+from circular_slm_pattern import CircleRenderer, CircleState
+from compositor import Compositor, layer_from_spec
+from display_sinks import ESCAPE_KEY, OpenCVWindowSink, get_monitors
+from double_slit_slm_pattern import DoubleSlitRenderer, DoubleSlitState
+from grayscale_slm_pattern import GrayscaleRenderer, GrayscaleState
+from pattern_pack import PackedMaskTiler, PatternPack
+from phase_lut import load_lut
+from repeat_pattern import PatternTiler
+from send_repeated_slm_pattern import DELTAS
+
+# Memory a frame bank may use; longer sequences are streamed through a ring this size
+MAX_BANK_BYTES = 2 * 2**30
+
+
+class FrameBank:
+    """
+    Ring buffer of ready-to-present uint8 frames, allocated once up front.
+
+    Args:
+        frame_shape (tuple): Shape of a single frame, e.g. (height, width).
+        capacity (int): Number of frames the bank can hold.
+    """
+
+    def __init__(self, frame_shape, capacity):
+        self.frames = np.empty((capacity,) + tuple(frame_shape), dtype=np.uint8)
+        self.capacity = capacity
+        self.start = 0
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if not -self.count <= index < self.count:
+            raise IndexError(f"frame index {index} out of range for {self.count} frames")
+        return self.frames[(self.start + index) % self.capacity]
+
+    def append(self, frame):
+        """
+        Copies `frame` into the next slot, overwriting the oldest frame when full.
+        """
+        slot = (self.start + self.count) % self.capacity
+        self.frames[slot] = frame
+        if self.count < self.capacity:
+            self.count += 1
+        else:
+            self.start = (self.start + 1) % self.capacity
+
+    def drop_oldest(self):
+        """
+        Frees the slot of the oldest frame.
+        """
+        if not self.count:
+            raise IndexError("drop from an empty frame bank")
+        self.start = (self.start + 1) % self.capacity
+        self.count -= 1
+
+    def close(self):
+        """
+        Does nothing; a bank holds no thread, unlike `FrameStream`.
+        """
+
+
+class FrameStream:
+    """
+    Frames of a sequence rendered ahead of playback into a `FrameBank` ring.
+
+    The first `capacity` frames are rendered up front. A background thread then renders
+    the following ones, starting over at the end of the sequence, into the slots that
+    playback has finished with. Frames must be read in order (0, 1, ..., n - 1, 0, ...),
+    and a frame stays valid until the next one is read.
+
+    Args:
+        sequence (list): Pattern entries, see `render_pattern`.
+        width (int): Frame width in pixels.
+        height (int): Frame height in pixels.
+        lut (PhaseLUT, optional): Gray-level correction baked into the stored frames.
+        capacity (int): Number of frames held at once, at least 2.
+    """
+
+    def __init__(self, sequence, width, height, lut=None, capacity=2):
+        if capacity < 2:
+            raise ValueError(f"capacity must be >= 2, got {capacity}")
+        self.sequence = sequence
+        self.width = width
+        self.height = height
+        self.lut = lut
+        self.bank = FrameBank((height, width), capacity)
+        self.read = 0  # Frames handed to playback so far
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name="frame-stream", daemon=True)
+        self._thread.start()
+        with self._condition:
+            self._condition.wait_for(lambda: len(self.bank) == capacity or self._error)
+
+    def __len__(self):
+        return len(self.sequence)
+
+    def _run(self):
+        renderers = {}
+        index = 0
+        try:
+            while True:
+                spec = self.sequence[index % len(self.sequence)]
+                frame = render_pattern(spec, self.width, self.height, renderers)
+                if self.lut is not None:
+                    frame = self.lut.apply(frame)
+                with self._condition:
+                    self._condition.wait_for(
+                        lambda: self._stopped or len(self.bank) < self.bank.capacity
+                    )
+                    if self._stopped:
+                        return
+                    self.bank.append(frame)
+                    self._condition.notify_all()
+                index += 1
+        except Exception as error:
+            with self._condition:
+                self._error = error
+                self._condition.notify_all()
+
+    def __getitem__(self, index):
+        with self._condition:
+            if index % len(self) != self.read % len(self):
+                raise IndexError(f"frame {index} read out of order, expected {self.read}")
+            if self.read:  # Playback is done with the previous frame
+                self.bank.drop_oldest()
+                self._condition.notify_all()
+            self._condition.wait_for(lambda: len(self.bank) or self._error)
+            if not len(self.bank):
+                raise RuntimeError("Rendering the sequence failed") from self._error
+            self.read += 1
+            return self.bank[0]
+
+    def close(self):
+        """
+        Stops the render thread.
+        """
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+        self._thread.join()
+
+
+SHAPE_RENDERERS = {
+    "circle": (CircleState, CircleRenderer),
+    "double_slit": (DoubleSlitState, DoubleSlitRenderer),
+    "square": (GrayscaleState, GrayscaleRenderer),
+}
+
+
+def render_pattern(spec, width, height, renderers=None):
+    """
+    Renders one entry of a pattern sequence.
+
+    Supported entries (extra keys are passed to the matching state):
+        {"type": "mask", "path": ..., "x_offset": ..., "y_offset": ..., "scale": ...}
+        {"type": "mask", "pack": ..., "name": ..., "x_offset": ..., "y_offset": ..., "scale": ...}
+        {"type": "gray", "value": ...}
+        {"type": "circle", "x_offset": ..., "y_offset": ..., "radius": ...}
+        {"type": "double_slit", "x_offset": ..., "y_offset": ..., "slit_width": ..., "separation": ...}
+        {"type": "square", "x_center": ..., "y_center": ..., "half_side": ..., "gray_value": ...}
+        {"type": "composite", "layers": [...layer entries, see compositor.layer_from_spec...]}
+
+    Args:
+        spec (dict): The pattern description.
+        width (int): Frame width in pixels.
+        height (int): Frame height in pixels.
+        renderers (dict, optional): Cache of tilers and shape renderers, so a mask used
+                                    several times is only decoded once and shapes are
+                                    redrawn on a persistent canvas. The mask tilers
+                                    share one output buffer.
+
+    Returns:
+        numpy.ndarray: The rendered 2-D uint8 frame. It may be a shared buffer; copy it to keep it.
+    """
+    if renderers is None:
+        renderers = {}
+    params = dict(spec)
+    kind = params.pop("type")
+    if kind == "mask":
+        if "mask_buffer" not in renderers:
+            renderers["mask_buffer"] = np.empty((height, width), dtype=np.uint8)
+        buffer = renderers["mask_buffer"]
+        if "pack" in params:
+            pack_path, name = params["pack"], params["name"]
+            key = ("mask", pack_path, name)
+            if ("pack", pack_path) not in renderers:
+                renderers[("pack", pack_path)] = PatternPack(pack_path)
+            if key not in renderers:
+                pack = renderers[("pack", pack_path)]
+                renderers[key] = PackedMaskTiler(pack, name, width, height, buffer=buffer)
+        else:
+            key = ("mask", params["path"])
+            if key not in renderers:
+                renderers[key] = PatternTiler(params["path"], width, height, buffer=buffer)
+        scale = params.get("scale", DELTAS[params.get("delta_index", 2)])
+        return renderers[key].render(
+            x_offset=params.get("x_offset", width // 2),
+            y_offset=params.get("y_offset", height // 2),
+            scale=scale,
+        )
+    if kind == "gray":
+        return np.full((height, width), params["value"], dtype=np.uint8)
+    if kind == "composite":
+        # One compositor for the sequence, so consecutive scenes share unchanged layers
+        if kind not in renderers:
+            renderers[kind] = Compositor(width, height)
+        return renderers[kind].render([layer_from_spec(layer) for layer in params["layers"]])
+    if kind in SHAPE_RENDERERS:
+        state_type, renderer_type = SHAPE_RENDERERS[kind]
+        if kind not in renderers:
+            renderers[kind] = renderer_type(width, height)
+        return renderers[kind].render(state_type(**params))
+    raise ValueError(f"Unknown pattern type: {kind}")
+
+
+def load_sequence(sequence_path):
+    """
+    Loads a pattern sequence from a JSON file containing a list of pattern entries.
+    """
+    with open(sequence_path) as f:
+        sequence = json.load(f)
+    if not isinstance(sequence, list):
+        raise ValueError(f"{sequence_path} must contain a list of patterns")
+    return sequence
+
+
+def build_frame_bank(sequence, width, height, lut=None, max_bytes=MAX_BANK_BYTES):
+    """
+    Pre-renders `sequence` into a `FrameBank`, or a `FrameStream` if it does not fit.
+
+    Args:
+        sequence (list): Pattern entries, see `render_pattern`.
+        width (int): Frame width in pixels.
+        height (int): Frame height in pixels.
+        lut (PhaseLUT, optional): Gray-level correction baked into the stored frames.
+        max_bytes (int): Memory the frames may use.
+
+    Returns:
+        FrameBank or FrameStream: Frames indexed by entry, in order. Close it after playback.
+    """
+    capacity = max(2, max_bytes // (width * height))
+    if len(sequence) > capacity:
+        return FrameStream(sequence, width, height, lut, capacity)
+    bank = FrameBank((height, width), len(sequence))
+    renderers = {}
+    for spec in sequence:
+        frame = render_pattern(spec, width, height, renderers)
+        bank.append(frame if lut is None else lut.apply(frame))
+    return bank
+
+
+def jitter_summary(scheduled, presented):
+    """
+    Summarizes presentation jitter as the deviation of presentation times from their schedule.
+
+    Args:
+        scheduled (array-like): Target presentation times in seconds.
+        presented (array-like): Measured presentation times in seconds.
+
+    Returns:
+        dict: Mean, standard deviation and maximum absolute deviation in milliseconds,
+              plus the mean interval between presented frames.
+    """
+    scheduled = np.asarray(scheduled, dtype=np.float64)
+    presented = np.asarray(presented, dtype=np.float64)
+    deviation_ms = (presented - scheduled) * 1e3
+    intervals_ms = np.diff(presented) * 1e3
+    return {
+        "frames": len(presented),
+        "mean_ms": float(deviation_ms.mean()) if len(deviation_ms) else 0.0,
+        "std_ms": float(deviation_ms.std()) if len(deviation_ms) else 0.0,
+        "max_abs_ms": float(np.abs(deviation_ms).max()) if len(deviation_ms) else 0.0,
+        "mean_interval_ms": float(intervals_ms.mean()) if len(intervals_ms) else 0.0,
+    }
+
+
+def wait_until(deadline, spin_s=0.002):
+    """
+    Waits until `time.perf_counter()` reaches `deadline`: sleeps most of the way, then
+    spins for the last `spin_s` seconds, which a sleep would overshoot.
+    """
+    remaining = deadline - time.perf_counter()
+    if remaining > spin_s:
+        time.sleep(remaining - spin_s)
+    while time.perf_counter() < deadline:
+        pass
+
+
+def play_sequence(sink, bank, fps=None, trigger=None, repeat=1, timer=None):
+    """
+    Plays a pre-rendered frame bank, either at a fixed rate or one frame per trigger.
+
+    With `fps` set, frame i of the run is scheduled at start + i / fps. Otherwise each
+    frame is shown as soon as `trigger()` returns; the default trigger waits for any
+    key press in the window. Escape aborts playback in both modes.
+
+    Args:
+        sink: Output sink that presents frames and reads keys, e.g. `OpenCVWindowSink`.
+        bank (FrameBank or FrameStream): Frames to present, read in order.
+        fps (float, optional): Presentation rate in frames per second.
+        trigger (callable, optional): Blocks until the next frame should be shown.
+                                      Returning False aborts playback.
+        repeat (int): Number of passes through the bank.
+        timer (FrameTimer, optional): Records the present duration of every frame and
+                                      the time spent waiting for its slot or trigger.
+
+    Returns:
+        dict: Jitter summary, see `jitter_summary`.
+    """
+    scheduled = []
+    presented = []
+    start = time.perf_counter()
+    for i in range(len(bank) * repeat):
+        frame = bank[i % len(bank)]
+        waiting = time.perf_counter()
+        if fps is not None:
+            target = start + i / fps
+            wait_until(target)
+        else:
+            if trigger is None:
+                if sink.wait_key(0) & 0xFF == ESCAPE_KEY:
+                    break
+            elif trigger() is False:
+                break
+            target = time.perf_counter()
+
+        presenting = time.perf_counter()
+        sink.present(frame)
+        key = sink.wait_key(1)  # Let the GUI paint the frame
+        scheduled.append(target)
+        presented.append(time.perf_counter())
+        if timer is not None:
+            timer.record(presented[-1], 0.0, presented[-1] - presenting, presenting - waiting)
+        if key != -1 and key & 0xFF == ESCAPE_KEY:
+            break
+
+    return jitter_summary(scheduled, presented)
+
+
+def play_sequence_on_screen(
+    screen_id, sequence, fps=None, repeat=1, sink=None, lut_path=None
+):
+    """
+    Pre-renders `sequence` for the given monitor and plays it full-screen.
+
+    Args:
+        screen_id (int): The index of the monitor to display the sequence on.
+        sequence (list): Pattern entries, see `render_pattern`.
+        fps (float, optional): Presentation rate; None advances on key presses.
+        repeat (int): Number of passes through the sequence.
+        sink (optional): Output sink to present frames to. Defaults to a full-screen OpenCV window.
+        lut_path (str, optional): SLM calibration file applied to every frame.
+    """
+    screen = get_monitors()[screen_id]
+    width, height = screen.width, screen.height
+
+    start = time.perf_counter()
+    lut = load_lut(lut_path) if lut_path else None
+    bank = build_frame_bank(sequence, width, height, lut)
+    ready = len(bank.bank) if isinstance(bank, FrameStream) else len(bank)
+    print(f"Pre-rendered {ready} of {len(bank)} frames in {time.perf_counter() - start:.2f} s")
+
+    if sink is None:
+        sink = OpenCVWindowSink(screen, "projector")
+    summary = play_sequence(sink, bank, fps=fps, repeat=repeat)
+    bank.close()
+    print(
+        f"Presented {summary['frames']} frames, jitter mean {summary['mean_ms']:.3f} ms, "
+        f"std {summary['std_ms']:.3f} ms, max {summary['max_abs_ms']:.3f} ms, "
+        f"interval {summary['mean_interval_ms']:.3f} ms"
+    )
+
+    sink.close()
+    return summary
+
+
+if __name__ == "__main__":
+    screen_id = 0
+    sequence_path = "./sequence.json"  # List of pattern entries, see render_pattern
+    fps = 10  # Set to None to advance with a key press
+
+    play_sequence_on_screen(screen_id, load_sequence(sequence_path), fps=fps)
@@ -0,0 +1,128 @@
+import csv
+import sys
+import time
+
+import numpy as np
+
+STAGES = ("render", "present", "input_wait")
+
+
+class FrameTimer:
+    """
+    Fixed-size ring of per-frame stage durations.
+
+    Each presented frame records its presentation timestamp and how long was spent
+    rendering it, presenting it, and waiting for input before it was requested.
+    Only the most recent `capacity` frames are kept.
+
+    Args:
+        capacity (int): Number of frames kept in the ring.
+    """
+
+    def __init__(self, capacity=4096):
+        self.capacity = capacity
+        # Columns: timestamp (s), then one duration (s) per stage
+        self.samples = np.zeros((capacity, 1 + len(STAGES)), dtype=np.float64)
+        self.count = 0
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def record(self, timestamp, render=0.0, present=0.0, input_wait=0.0):
+        """
+        Stores one frame. Durations are in seconds.
+        """
+        self.samples[self.count % self.capacity] = (timestamp, render, present, input_wait)
+        self.count += 1
+
+    def ordered(self):
+        """
+        Returns the stored samples, oldest first.
+        """
+        if self.count <= self.capacity:
+            return self.samples[: self.count]
+        start = self.count % self.capacity
+        return np.concatenate((self.samples[start:], self.samples[:start]))
+
+    def summary(self, percentiles=(50, 95, 99)):
+        """
+        Summarizes the stored frames.
+
+        Returns:
+            dict: Frame count, frame rate over the stored span, and for each stage the
+                  mean, maximum and requested percentiles in milliseconds.
+        """
+        samples = self.ordered()
+        result = {"frames": len(samples), "fps": 0.0}
+        if len(samples) == 0:
+            return result
+        span = samples[-1, 0] - samples[0, 0]
+        if span > 0:
+            result["fps"] = (len(samples) - 1) / span
+        for i, stage in enumerate(STAGES, start=1):
+            ms = samples[:, i] * 1e3
+            stats = {"mean": float(ms.mean()), "max": float(ms.max())}
+            for p, value in zip(percentiles, np.percentile(ms, percentiles)):
+                stats[f"p{p}"] = float(value)
+            result[stage] = stats
+        return result
+
+    def format_summary(self):
+        summary = self.summary()
+        if summary["frames"] == 0:
+            return "No frames recorded."
+        parts = [f"{summary['frames']} frames, {summary['fps']:.1f} frames/s"]
+        for stage in STAGES:
+            s = summary[stage]
+            parts.append(
+                f"{stage} p50/p95/p99/max {s['p50']:.2f}/{s['p95']:.2f}/{s['p99']:.2f}/{s['max']:.2f} ms"
+            )
+        return "; ".join(parts)
+
+    def dump_csv(self, path):
+        """
+        Writes the stored frames as CSV, one row per frame, durations in milliseconds.
+        """
+        first = max(0, self.count - self.capacity)
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["frame", "timestamp_s"] + [f"{stage}_ms" for stage in STAGES])
+            for i, row in enumerate(self.ordered()):
+                writer.writerow(
+                    [first + i, f"{row[0]:.6f}"] + [f"{v * 1e3:.3f}" for v in row[1:]]
+                )
+
+
+class StatusPrinter:
+    """
+    Prints status lines at most `max_rate_hz` times per second.
+
+    Lines arriving faster than that replace each other; the newest one is printed
+    once the interval has elapsed, on a later `update` or `flush`.
+
+    Args:
+        max_rate_hz (float): Maximum number of lines printed per second; 0 disables throttling.
+        stream (file, optional): Where to print. Defaults to sys.stdout.
+    """
+
+    def __init__(self, max_rate_hz=10.0, stream=None):
+        self.min_interval = 1.0 / max_rate_hz if max_rate_hz > 0 else 0.0
+        self.stream = stream
+        self.pending = None
+        self.last_printed = -float("inf")
+
+    def update(self, line):
+        self.pending = line
+        self.flush()
+
+    def flush(self, force=False):
+        """
+        Prints the pending line if the interval has elapsed (or always, with `force`).
+        """
+        if self.pending is None:
+            return
+        now = time.perf_counter()
+        if force or now - self.last_printed >= self.min_interval:
+            print(self.pending, file=self.stream or sys.stdout)
+            self.pending = None
+            self.last_printed = now
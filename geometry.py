@@ -0,0 +1,227 @@
+from functools import lru_cache
+
+import cv2
+import numpy as np
+
+# *  Mount geometry: flips, quarter turns, small rotations and keystone of the SLM image
+
+INTERPOLATIONS = {"nearest": cv2.INTER_NEAREST, "linear": cv2.INTER_LINEAR}
+
+# Rows of the remap tables computed at a time, to bound the float64 temporaries
+_TABLE_BAND_ROWS = 256
+
+
+def orientation_matrix(width, height, flip_horizontal=False, flip_vertical=False, quarter_turns=0):
+    """
+    Returns the 3x3 matrix moving pixel (x, y) of a width x height frame to its place in
+    the flipped and turned frame (flips first, then counter-clockwise quarter turns), and
+    the (width, height) of that frame.
+    """
+    matrix = np.eye(3)
+    if flip_horizontal:
+        matrix = np.array([[-1, 0, width - 1], [0, 1, 0], [0, 0, 1]]) @ matrix
+    if flip_vertical:
+        matrix = np.array([[1, 0, 0], [0, -1, height - 1], [0, 0, 1]]) @ matrix
+    for _ in range(quarter_turns % 4):
+        matrix = np.array([[0, 1, 0], [-1, 0, width - 1], [0, 0, 1]]) @ matrix
+        width, height = height, width
+    return matrix, (width, height)
+
+
+def rotation_matrix(width, height, degrees):
+    """
+    Returns the 3x3 matrix rotating a width x height frame counter-clockwise about its centre.
+    """
+    center = ((width - 1) / 2, (height - 1) / 2)
+    return np.vstack([cv2.getRotationMatrix2D(center, degrees, 1.0), [0, 0, 1]])
+
+
+def keystone_matrix(width, height, corners):
+    """
+    Returns the 3x3 perspective matrix moving the corners of a width x height frame to
+    `corners`: the (x, y) screen positions of its top-left, top-right, bottom-right and
+    bottom-left corners.
+    """
+    source = np.float32([[0, 0], [width - 1, 0], [width - 1, height - 1], [0, height - 1]])
+    return cv2.getPerspectiveTransform(source, np.float32(corners)).astype(np.float64)
+
+
+@lru_cache(maxsize=8)
+def remap_tables(width, height, source_width, source_height, matrix, interpolation):
+    """
+    Fixed-point `cv2.remap` tables for a perspective transform.
+
+    Args:
+        width (int): Output width.
+        height (int): Output height.
+        source_width (int): Width of the transformed frames.
+        source_height (int): Height of the transformed frames.
+        matrix (tuple): The 9 entries of the 3x3 matrix moving source pixels to output
+                        pixels; a tuple, so the tables are cached per transform.
+        interpolation (int): cv2.INTER_NEAREST or cv2.INTER_LINEAR.
+
+    Returns:
+        tuple: The two read-only maps from `cv2.convertMaps` (CV_16SC2 coordinates and
+               interpolation weights, None for nearest neighbour), to pass to
+               `cv2.remap` as they are.
+    """
+    inverse = np.linalg.inv(np.array(matrix, dtype=np.float64).reshape(3, 3))
+    map_x = np.empty((height, width), dtype=np.float32)
+    map_y = np.empty((height, width), dtype=np.float32)
+    x = np.arange(width, dtype=np.float64)[None, :]
+    for top in range(0, height, _TABLE_BAND_ROWS):
+        y = np.arange(top, min(top + _TABLE_BAND_ROWS, height), dtype=np.float64)[:, None]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            w = inverse[2, 0] * x + inverse[2, 1] * y + inverse[2, 2]
+            sx = (inverse[0, 0] * x + inverse[0, 1] * y + inverse[0, 2]) / w
+            sy = (inverse[1, 0] * x + inverse[1, 1] * y + inverse[1, 2]) / w
+        # Points behind the projection, or far outside, read the border
+        outside = ~(w > 0) | ~(np.abs(sx) < 2 * source_width) | ~(np.abs(sy) < 2 * source_height)
+        sx[outside] = sy[outside] = -1
+        map_x[top : top + len(y)] = sx
+        map_y[top : top + len(y)] = sy
+
+    nearest = interpolation == cv2.INTER_NEAREST
+    coordinates, weights = cv2.convertMaps(map_x, map_y, cv2.CV_16SC2, nninterpolation=nearest)
+    for table in (coordinates, weights):
+        if table is not None:  # Nearest-neighbour tables have no weights
+            table.flags.writeable = False
+    return coordinates, weights
+
+
+class GeometryStage:
+    """
+    Output stage compensating how the SLM is mounted.
+
+    Flips alone are one `cv2.flip` pass into the output buffer (about 1-2 ms at 4K).
+    Returning a flipped view would not save it: OpenCV copies negative-stride arrays
+    before the LUT reads them, which is slower than the flip. A half turn is folded
+    into the flip; an odd number of turns of a square frame adds a `cv2.rotate` pass.
+    A rotation or keystone correction is one `cv2.remap` pass with fixed-point tables,
+    computed on the first frame of each size and cached; flips and turns are folded
+    into the same tables. The result is written into a buffer reused by the next
+    `apply`.
+
+    Quarter turns that do not fit the frame (an odd number of turns of a non-square
+    frame) are applied about the frame centre through the remap, which crops the
+    long axis.
+
+    Nearest-neighbour interpolation is the default: blending neighbours across a
+    phase wrap (255 next to 0) gives a wrong phase, so use "linear" for amplitude
+    patterns only.
+
+    Args:
+        flip_horizontal (bool): Mirror left and right.
+        flip_vertical (bool): Mirror top and bottom.
+        quarter_turns (int): Counter-clockwise 90 degree turns, after the flips.
+        rotation_deg (float): Counter-clockwise rotation about the frame centre.
+        keystone (list, optional): Screen (x, y) positions of the frame's top-left,
+                                   top-right, bottom-right and bottom-left corners,
+                                   after the other corrections.
+        interpolation (str): "nearest" or "linear".
+        border_value (int): Gray level of screen pixels that no frame pixel maps to.
+    """
+
+    def __init__(
+        self,
+        flip_horizontal=False,
+        flip_vertical=False,
+        quarter_turns=0,
+        rotation_deg=0.0,
+        keystone=None,
+        interpolation="nearest",
+        border_value=0,
+    ):
+        if interpolation not in INTERPOLATIONS:
+            raise ValueError(f"Unknown interpolation {interpolation!r}")
+        self.flip_horizontal = bool(flip_horizontal)
+        self.flip_vertical = bool(flip_vertical)
+        self.quarter_turns = int(quarter_turns) % 4
+        self.rotation_deg = float(rotation_deg)
+        self.keystone = None if keystone is None else [tuple(map(float, p)) for p in keystone]
+        self.interpolation = INTERPOLATIONS[interpolation]
+        self.border_value = int(border_value)
+        self.tables = {}  # Frame shape -> remap tables, or False without a remap
+        self.buffer = None
+        self.turned = None  # Output of the quarter turn of a square frame
+
+    @classmethod
+    def from_dict(cls, settings):
+        """
+        Builds the stage from the "geometry" entry of a calibration file, see
+        `phase_lut.load_lut`.
+        """
+        return cls(**settings)
+
+    def matrix(self, width, height):
+        """
+        Returns the 3x3 matrix moving pixels of a width x height frame to the screen, or
+        None when the correction is a strided view of the frame.
+        """
+        turned = self.quarter_turns % 2 and width != height
+        if not (turned or self.rotation_deg or self.keystone):
+            return None
+        matrix, (oriented_width, oriented_height) = orientation_matrix(
+            width, height, self.flip_horizontal, self.flip_vertical, self.quarter_turns
+        )
+        # Keep the turned frame centred on the screen
+        center = np.eye(3)
+        center[:2, 2] = (width - oriented_width) / 2, (height - oriented_height) / 2
+        matrix = center @ matrix
+        if self.rotation_deg:
+            matrix = rotation_matrix(width, height, self.rotation_deg) @ matrix
+        if self.keystone:
+            matrix = keystone_matrix(width, height, self.keystone) @ matrix
+        return matrix
+
+    def _output(self, shape):
+        if self.buffer is None or self.buffer.shape != shape:
+            self.buffer = np.empty(shape, dtype=np.uint8)
+        return self.buffer
+
+    def _flip(self, frame):
+        # Flips and quarter turns of a square frame, without a remap
+        half_turn = self.quarter_turns >= 2  # Same as flipping both ways
+        flips = (self.flip_horizontal != half_turn, self.flip_vertical != half_turn)
+        if any(flips):
+            code = {(True, False): 1, (False, True): 0, (True, True): -1}[flips]
+            frame = cv2.flip(frame, code, dst=self._output(frame.shape))
+        if self.quarter_turns % 2:
+            if self.turned is None or self.turned.shape != frame.shape:
+                self.turned = np.empty(frame.shape, dtype=np.uint8)
+            frame = cv2.rotate(frame, cv2.ROTATE_90_COUNTERCLOCKWISE, dst=self.turned)
+        return frame
+
+    def apply(self, frame):
+        """
+        Returns the frame as it must be shown on the screen.
+
+        Args:
+            frame (numpy.ndarray): 2-D uint8 frame.
+
+        Returns:
+            numpy.ndarray: `frame` itself when there is nothing to correct, otherwise
+                           a shared output buffer; either way with the same shape as
+                           `frame`.
+        """
+        if frame.shape not in self.tables:
+            height, width = frame.shape
+            matrix = self.matrix(width, height)
+            self.tables[frame.shape] = matrix is not None and remap_tables(
+                width, height, width, height, tuple(matrix.ravel()), self.interpolation
+            )
+        tables = self.tables[frame.shape]
+        if not tables:
+            return self._flip(frame)
+
+        coordinates, weights = tables
+        cv2.remap(
+            frame,
+            coordinates,
+            weights,
+            self.interpolation,
+            dst=self._output(frame.shape),
+            borderMode=cv2.BORDER_CONSTANT,
+            borderValue=self.border_value,
+        )
+        return self.buffer
@@ -1,11 +1,211 @@
+from dataclasses import dataclass, replace
+
 import cv2
-import numpy as np
-from screeninfo import get_monitors
+
+from dirty_canvas import DirtyCanvas, rects_overlap
+from display_control import key_bindings, run_keyboard_loop
+from display_sinks import OpenCVWindowSink, get_monitors
 
 # *  This script can be used for SLM calibration
 
+# Define movement and size increments
+LARGE_STEP = 10  # Movement step for 'w', 'a', 's', 'd'
+SMALL_STEP = 2  # Movement step for 'i', 'j', 'k', 'l'
+SIZE_STEP = 10  # Size increment/decrement step
+MIN_HALF_SIDE = 5  # Minimum half side length to prevent inversion
+
+# Define grayscale adjustment step and limits
+GRAYSCALE_STEP = 1
+MAX_GRAYSCALE = 255
+MIN_GRAYSCALE = 0
+
+# Define the grayscale value label
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+FONT_SCALE = 1
+TEXT_THICKNESS = 2
+TEXT_POSITION = (10, 30)  # Position near the top-left corner
+
+
+@dataclass(frozen=True)
+class GrayscaleState:
+    x_center: int
+    y_center: int
+    half_side: int = 200  # Initial half side length of the square
+    gray_value: int = 0  # Initial grayscale value (0-255)
+
+    def __post_init__(self):
+        if not MIN_GRAYSCALE <= self.gray_value <= MAX_GRAYSCALE:
+            raise ValueError(f"gray_value must be in 0-255, got {self.gray_value}")
+        if self.half_side < 0:
+            raise ValueError(f"half_side must be >= 0, got {self.half_side}")
+
+
+class GrayscaleRenderer:
+    """
+    Renders the calibration canvas: a uniform gray field with a square and a value label.
+
+    The canvas persists between frames. It is only repainted in full when the grayscale
+    value changes; otherwise just the previous and new square are redrawn, and the label
+    is re-rasterized only when the square overlaps it.
+
+    Args:
+        width (int): Width of the canvas in pixels.
+        height (int): Height of the canvas in pixels.
+    """
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.canvas = DirtyCanvas(width, height)
+        self.gray_value = None
+        self.text_rect = None
+
+    def _draw_text(self, gray_value):
+        # Display the grayscale value on the top-left corner
+        text = f"Grayscale Value: {gray_value}"
+        # Determine text color based on grayscale value for contrast
+        if gray_value > 128:
+            font_color = 0  # Black text for lighter squares
+        else:
+            font_color = 255  # White text for darker squares
+
+        # Bounding box of the rendered label, padded for the stroke and anti-aliasing
+        (text_width, text_height), baseline = cv2.getTextSize(
+            text, FONT, FONT_SCALE, TEXT_THICKNESS
+        )
+        pad = TEXT_THICKNESS + 1
+        x, y = TEXT_POSITION
+        x0, y0 = max(0, x - pad), max(0, y - text_height - pad)
+        x1, y1 = min(self.width, x + text_width + pad), min(self.height, y + baseline + pad)
+        self.text_rect = (x0, y0, x1, y1)
+
+        # Clear the previous label first: anti-aliased edges drawn over themselves
+        # would darken (or lighten) with every redraw
+        self.canvas.canvas[y0:y1, x0:x1] = self.canvas.background
+        cv2.putText(
+            self.canvas.canvas,
+            text,
+            TEXT_POSITION,
+            FONT,
+            FONT_SCALE,
+            font_color,
+            TEXT_THICKNESS,
+            cv2.LINE_AA,
+        )
+
+    def render(self, state):
+        if state.gray_value != self.gray_value:
+            # Create a single-channel gray canvas
+            self.canvas.fill(state.gray_value)
+            self.gray_value = state.gray_value
+            redraw_text = True
+        else:
+            # Only the old square and, if it was covered, the label need repainting
+            redraw_text = any(rects_overlap(rect, self.text_rect) for rect in self.canvas.dirty)
+            self.canvas.erase()
+
+        # Calculate top-left and bottom-right points of the square
+        top_left = (state.x_center - state.half_side, state.y_center - state.half_side)
+        bottom_right = (state.x_center + state.half_side, state.y_center + state.half_side)
+
+        # Ensure the square stays within the canvas boundaries
+        top_left = (max(0, top_left[0]), max(0, top_left[1]))
+        bottom_right = (
+            min(self.width - 1, bottom_right[0]),
+            min(self.height - 1, bottom_right[1]),
+        )
+
+        # Draw the grayscale square on the canvas
+        cv2.rectangle(self.canvas.canvas, top_left, bottom_right, state.gray_value, -1)
+        square_rect = self.canvas.mark(*top_left, *bottom_right)
+
+        if redraw_text or rects_overlap(square_rect, self.text_rect):
+            self._draw_text(state.gray_value)
+        return self.canvas.canvas
+
+
+def render_grayscale(state, width, height):
+    """
+    Renders the calibration canvas for a single state on a fresh canvas.
+
+    Args:
+        state (GrayscaleState): Square position, size and grayscale value.
+        width (int): Width of the canvas in pixels.
+        height (int): Height of the canvas in pixels.
 
-def display_image_with_keyboard_control(screen_id=0):
+    Returns:
+        numpy.ndarray: The rendered canvas.
+    """
+    return GrayscaleRenderer(width, height).render(state)
+
+
+def grayscale_key_bindings(width, height):
+    """
+    Builds the keyboard bindings for the calibration square.
+
+    Args:
+        width (int): Width of the canvas in pixels.
+        height (int): Height of the canvas in pixels.
+
+    Returns:
+        dict: Mapping of key codes to state actions.
+    """
+
+    def move(dx, dy):
+        def action(state):
+            half_side = state.half_side
+            return replace(
+                state,
+                x_center=min(width - half_side, max(half_side, state.x_center + dx)),
+                y_center=min(height - half_side, max(half_side, state.y_center + dy)),
+            )
+
+        return action
+
+    def change_gray(step):
+        return lambda state: replace(
+            state,
+            gray_value=min(MAX_GRAYSCALE, max(MIN_GRAYSCALE, state.gray_value + step)),
+        )
+
+    def grow(state):
+        # Ensure the square does not exceed canvas boundaries
+        half_side = min(
+            state.half_side + SIZE_STEP // 2,
+            state.x_center,
+            state.y_center,
+            width - state.x_center,
+            height - state.y_center,
+        )
+        return replace(state, half_side=half_side)
+
+    def shrink(state):
+        return replace(state, half_side=max(MIN_HALF_SIDE, state.half_side - SIZE_STEP // 2))
+
+    return key_bindings(
+        {
+            # Handle key presses for movement
+            "w": move(0, -LARGE_STEP),
+            "s": move(0, LARGE_STEP),
+            "a": move(-LARGE_STEP, 0),
+            "d": move(LARGE_STEP, 0),
+            "i": move(0, -SMALL_STEP),
+            "k": move(0, SMALL_STEP),
+            "j": move(-SMALL_STEP, 0),
+            "l": move(SMALL_STEP, 0),
+            # Handle key presses for grayscale adjustment
+            "t": change_gray(GRAYSCALE_STEP),
+            "g": change_gray(-GRAYSCALE_STEP),
+            # Handle key presses for resizing
+            "=+": grow,
+            "-_": shrink,
+        }
+    )
+
+
+def display_image_with_keyboard_control(
+    screen_id=0, sink=None, timing_csv=None, state=None, control=None, journal_path=None
+):
     """
     Displays a full-screen window with a movable and resizable square controlled via keyboard inputs.
 
@@ -22,11 +222,19 @@ def display_image_with_keyboard_control(screen_id=0):
         - '-' / '_' : Decrease square size by 10 pixels (side length)
         - 'T' / 't' : Increase grayscale value by 5 (up to 255)
         - 'G' / 'g' : Decrease grayscale value by 5 (down to 0)
+        - 'Tab'     : Print frame timing statistics
         - 'Esc'     : Exit the application
 
     Args:
         screen_id (int): Index of the monitor to display the window on.
                          Defaults to 0 (primary monitor).
+        sink (optional): Output sink to present frames to. Defaults to a
+                         full-screen OpenCV window on the monitor.
+        timing_csv (str, optional): Path to write per-frame timings to on exit.
+        state (GrayscaleState, optional): Initial square and grayscale value.
+                                          Defaults to a black square at the centre.
+        control (ControlServer, optional): Started server accepting remote state updates.
+        journal_path (str, optional): Record every shown state for replay, see session_journal.py.
     """
     # Retrieve available monitors
     try:
@@ -48,126 +256,29 @@ def display_image_with_keyboard_control(screen_id=0):
     screen = monitors[screen_id]
     width, height = screen.width, screen.height
 
-    # Define the grayscale variable
-    calibrate_reflective_slm_value = 0  # Initial grayscale value (0-255)
-
     # Initialize square properties at the center of the screen
-    x_center, y_center = width // 2, height // 2
-    half_side = 200  # Initial half side length of the square
+    if state is None:
+        state = GrayscaleState(x_center=width // 2, y_center=height // 2)
 
     # Define window properties
-    window_name = "Projector Control - Square"
-    cv2.namedWindow(window_name, cv2.WINDOW_NORMAL)
-    cv2.moveWindow(window_name, screen.x, screen.y)
-    cv2.setWindowProperty(window_name, cv2.WND_PROP_FULLSCREEN, cv2.WINDOW_FULLSCREEN)
-
-    # Define movement and size increments
-    large_step = 10  # Movement step for 'w', 'a', 's', 'd'
-    small_step = 2  # Movement step for 'i', 'j', 'k', 'l'
-    size_step = 10  # Size increment/decrement step
-    min_half_side = 5  # Minimum half side length to prevent inversion
-
-    # Define grayscale adjustment step and limits
-    grayscale_step = 1
-    max_grayscale = 255
-    min_grayscale = 0
-
-    while True:
-        # Create a gray canvas
-        canvas = np.full(
-            (height, width, 3), calibrate_reflective_slm_value, dtype=np.uint8
-        )
-
-        # Calculate top-left and bottom-right points of the square
-        top_left = (x_center - half_side, y_center - half_side)
-        bottom_right = (x_center + half_side, y_center + half_side)
-
-        # Ensure the square stays within the canvas boundaries
-        top_left = (max(0, top_left[0]), max(0, top_left[1]))
-        bottom_right = (
-            min(width - 1, bottom_right[0]),
-            min(height - 1, bottom_right[1]),
-        )
-
-        # Draw the grayscale square on the canvas
-        # Since OpenCV uses BGR, set all channels to the grayscale value
-        square_color = (calibrate_reflective_slm_value,) * 3
-        cv2.rectangle(canvas, top_left, bottom_right, square_color, -1)
-
-        # Display the grayscale value on the top-left corner
-        text = f"Grayscale Value: {calibrate_reflective_slm_value}"
-        font = cv2.FONT_HERSHEY_SIMPLEX
-        font_scale = 1
-        # Determine text color based on grayscale value for contrast
-        if calibrate_reflective_slm_value > 128:
-            font_color = (0, 0, 0)  # Black text for lighter squares
-        else:
-            font_color = (255, 255, 255)  # White text for darker squares
-        thickness = 2
-        text_position = (10, 30)  # Position near the top-left corner
-        cv2.putText(
-            canvas,
-            text,
-            text_position,
-            font,
-            font_scale,
-            font_color,
-            thickness,
-            cv2.LINE_AA,
-        )
-
-        # Display the canvas
-        cv2.imshow(window_name, canvas)
-
-        # Wait for a key press for 10ms
-        key = cv2.waitKey(10) & 0xFF  # Mask to get last 8 bits
-
-        # Handle key presses for movement
-        if key == ord("w"):
-            y_center = max(half_side, y_center - large_step)
-        elif key == ord("s"):
-            y_center = min(height - half_side, y_center + large_step)
-        elif key == ord("a"):
-            x_center = max(half_side, x_center - large_step)
-        elif key == ord("d"):
-            x_center = min(width - half_side, x_center + large_step)
-        elif key == ord("i"):
-            y_center = max(half_side, y_center - small_step)
-        elif key == ord("k"):
-            y_center = min(height - half_side, y_center + small_step)
-        elif key == ord("j"):
-            x_center = max(half_side, x_center - small_step)
-        elif key == ord("l"):
-            x_center = min(width - half_side, x_center + small_step)
-        # Handle key presses for grayscale adjustment
-        elif key == ord("t"):
-            # Increase grayscale value
-            calibrate_reflective_slm_value = min(
-                max_grayscale, calibrate_reflective_slm_value + grayscale_step
-            )
-        elif key == ord("g"):
-            # Decrease grayscale value
-            calibrate_reflective_slm_value = max(
-                min_grayscale, calibrate_reflective_slm_value - grayscale_step
-            )
-        # Handle key presses for resizing
-        elif key == ord("=") or key == ord("+"):
-            half_side += size_step // 2
-            # Ensure the square does not exceed canvas boundaries
-            half_side = min(
-                half_side, x_center, y_center, width - x_center, height - y_center
-            )
-        elif key == ord("-") or key == ord("_"):
-            half_side = max(min_half_side, half_side - size_step // 2)
-        elif key == 27:  # ESC key
-            print("Exiting the application.")
-            break
+    if sink is None:
+        sink = OpenCVWindowSink(screen, "Projector Control - Square")
 
-        # Optional: Print the current state (commented out to reduce console clutter)
-        # print(f"Center: ({x_center}, {y_center}), Half Side: {half_side}, Grayscale: {calibrate_reflective_slm_value}")
+    # The canvas is only redrawn when a key press changes the state
+    run_keyboard_loop(
+        sink,
+        state,
+        GrayscaleRenderer(width, height).render,
+        grayscale_key_bindings(width, height),
+        timing_csv=timing_csv,
+        control=control,
+        journal_path=journal_path,
+        journal_context={"pattern": "grayscale", "width": width, "height": height},
+    )
+    print("Exiting the application.")
 
     # Clean up and close the window
-    cv2.destroyAllWindows()
+    sink.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,341 @@
+import argparse
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from phase_slm_pattern import GRAY_LEVELS, wrap_to_gray
+from repeat_pattern import load_mask
+
+# *  Iterative phase retrieval (Gerchberg-Saxton) for periodic unit-cell masks
+
+try:
+    import scipy.fft as _scipy_fft
+except ImportError:  # numpy.fft is used instead, threaded here over blocks of lines
+    _scipy_fft = None
+
+# numpy >= 2.0 can write FFT results into a preallocated array
+_NUMPY_FFT_OUT = np.lib.NumpyVersion(np.__version__) >= "2.0.0"
+
+# Smallest transform, in elements, worth splitting across threads without scipy
+_THREADED_FFT_SIZE = 2**16
+
+METRICS = ("efficiency", "uniformity", "error")
+
+# Smallest amplitude divided by when normalizing fields
+_EPS = np.float32(1e-12)
+
+
+def fft2(field, inverse=False, workers=-1):
+    """
+    Unitary 2-D FFT of a complex array over its last two axes, in place.
+
+    fftn/ifftn are used because numpy's ifft2 mishandles `out`.
+
+    Args:
+        field (numpy.ndarray): complex64 or complex128 array, overwritten by its transform.
+        inverse (bool): Compute the inverse transform.
+        workers (int): FFT threads; -1 uses all cores.
+
+    Returns:
+        numpy.ndarray: `field`.
+    """
+    axes = (-2, -1)
+    if _scipy_fft is not None:
+        transform = _scipy_fft.ifftn if inverse else _scipy_fft.fftn
+        result = transform(field, axes=axes, norm="ortho", overwrite_x=True, workers=workers)
+    else:
+        workers = os.cpu_count() if workers == -1 else workers
+        if workers > 1 and field.size >= _THREADED_FFT_SIZE:
+            return _threaded_fft2(field, inverse, workers)
+        transform = np.fft.ifftn if inverse else np.fft.fftn
+        if _NUMPY_FFT_OUT:
+            return transform(field, axes=axes, norm="ortho", out=field)
+        result = transform(field, axes=axes, norm="ortho")
+    if result is not field:
+        np.copyto(field, result)
+    return field
+
+
+@lru_cache(maxsize=None)
+def _fft_pool(workers):
+    return ThreadPoolExecutor(workers, thread_name_prefix="fft")
+
+
+def _threaded_fft2(field, inverse, workers):
+    # numpy.fft releases the GIL, so the 1-D transforms along each axis are split into
+    # blocks of lines: rows first, then columns, each block on its own thread
+    transform = np.fft.ifft if inverse else np.fft.fft
+
+    def lines(axis, block):
+        part = field[..., block, :] if axis == -1 else field[..., block]
+        if _NUMPY_FFT_OUT:
+            transform(part, axis=axis, norm="ortho", out=part)
+        else:
+            part[...] = transform(part, axis=axis, norm="ortho")
+
+    pool = _fft_pool(workers)
+    for axis, length in ((-1, field.shape[-2]), (-2, field.shape[-1])):
+        bounds = np.linspace(0, length, min(workers, length) + 1).astype(int)
+        blocks = [slice(a, b) for a, b in zip(bounds[:-1], bounds[1:])]
+        list(pool.map(lines, [axis] * len(blocks), blocks))
+    return field
+
+
+class HologramEngine:
+    """
+    Computes phase-only masks whose far field reproduces target intensity patterns.
+
+    The mask is one period of the tiling drawn by `repeat_image`, so its far field is
+    sampled at the harmonics of the cell and a plain 2-D FFT over the cell models the
+    propagation. A batch of same-sized targets is iterated together, and all complex
+    and real work arrays are allocated once per engine and reused across runs.
+
+    FFTs run on `workers` threads, through scipy.fft when it is installed and
+    otherwise as blocks of numpy.fft line transforms, see `fft2`.
+
+    Args:
+        shape (tuple): (height, width) of the unit cell.
+        batch (int): Number of targets processed together.
+        workers (int): FFT threads; -1 uses all cores.
+        source (numpy.ndarray, optional): Illumination amplitude on the SLM, shape
+                                          (height, width). Defaults to uniform.
+    """
+
+    def __init__(self, shape, batch=1, workers=-1, source=None):
+        self.shape = tuple(shape)
+        self.batch = batch
+        self.workers = workers
+        stack = (batch,) + self.shape
+        if source is None:
+            source = np.ones(self.shape, dtype=np.float32)
+        self.source = np.asarray(source, dtype=np.float32)
+
+        self.field = np.empty(stack, dtype=np.complex64)
+        self.amplitude = np.empty(stack, dtype=np.float32)
+        self.target = np.empty(stack, dtype=np.float32)
+        self.weights = np.empty(stack, dtype=np.float32)
+        self.signal = np.empty(stack, dtype=bool)
+
+    def _set_targets(self, targets):
+        targets = np.asarray(targets, dtype=np.float32)
+        if targets.ndim == 2:
+            targets = targets[None]
+        if targets.shape != self.target.shape:
+            raise ValueError(
+                f"Targets of shape {targets.shape} do not match {self.target.shape}"
+            )
+        if (targets < 0).any():
+            raise ValueError("Target intensities must be non-negative")
+
+        # Targets are drawn with the zero order in the middle; the FFT has it at [0, 0]
+        shifted = np.fft.ifftshift(targets, axes=(-2, -1))
+        np.sqrt(shifted, out=self.target)
+        np.greater(self.target, 0, out=self.signal)
+
+        # Scale each target to carry the same power as the illumination
+        power = np.square(self.target).sum(axis=(-2, -1), keepdims=True)
+        if (power == 0).any():
+            raise ValueError("Every target needs at least one non-zero pixel")
+        self.target *= np.sqrt(np.square(self.source).sum() / power)
+
+    def _record(self, metrics, iteration):
+        # Far-field amplitude is in self.amplitude
+        intensity = np.square(self.amplitude)
+        total = intensity.sum(axis=(-2, -1))
+        in_signal = np.where(self.signal, intensity, 0).sum(axis=(-2, -1))
+        metrics["efficiency"][iteration] = in_signal / np.maximum(total, _EPS)
+
+        # Spread of the delivered intensity relative to what each pixel asked for
+        ratio = np.where(
+            self.signal, intensity / np.maximum(np.square(self.target), _EPS), np.nan
+        )
+        high = np.nanmax(ratio, axis=(-2, -1))
+        low = np.nanmin(ratio, axis=(-2, -1))
+        metrics["uniformity"][iteration] = 1 - (high - low) / np.maximum(high + low, _EPS)
+
+        # RMS amplitude error inside the signal, after rescaling to the target power
+        target_power = np.square(self.target).sum(axis=(-2, -1))
+        scale = np.sqrt(target_power / np.maximum(in_signal, _EPS))[:, None, None]
+        difference = np.where(self.signal, self.amplitude * scale - self.target, 0)
+        metrics["error"][iteration] = np.sqrt(
+            np.square(difference).sum(axis=(-2, -1)) / target_power
+        )
+
+    def run(self, targets, iterations=30, weighted=False, seed=None):
+        """
+        Runs Gerchberg-Saxton iterations for a batch of targets.
+
+        The weighted variant scales each signal pixel's target amplitude by how far it
+        fell short in the previous iteration, trading a little efficiency for a much
+        more uniform result (typically for spot arrays).
+
+        Args:
+            targets (numpy.ndarray): Target intensities, shape (batch, height, width)
+                                     or (height, width), zero order in the middle.
+            iterations (int): Number of iterations.
+            weighted (bool): Use the weighted Gerchberg-Saxton update.
+            seed (int, optional): Seed for the random starting phase.
+
+        Returns:
+            tuple: (phase, metrics) where `phase` is the float32 mask phase in
+                   [0, 2 pi) with shape (batch, height, width), and `metrics` maps each
+                   name in METRICS to a (iterations, batch) array measured on the far
+                   field of the mask after each iteration; the last row is that of
+                   the returned `phase`.
+        """
+        self._set_targets(targets)
+        self.weights.fill(1)
+        field, amplitude = self.field, self.amplitude
+
+        rng = np.random.default_rng(seed)
+        phase = rng.uniform(0, 2 * np.pi, size=field.shape).astype(np.float32)
+        np.multiply(self.source, np.exp(1j * phase), out=field)
+
+        metrics = {name: np.zeros((iterations, self.batch)) for name in METRICS}
+        for iteration in range(iterations):
+            fft2(field, inverse=False, workers=self.workers)
+            np.abs(field, out=amplitude)
+            if iteration:  # The far field of the previous iteration's mask
+                self._record(metrics, iteration - 1)
+
+            if weighted:
+                # Normalize the far field to the target power before comparing
+                in_signal = np.where(self.signal, np.square(amplitude), 0).sum(
+                    axis=(-2, -1), keepdims=True
+                )
+                target_power = np.square(self.target).sum(axis=(-2, -1), keepdims=True)
+                scale = np.sqrt(target_power / np.maximum(in_signal, _EPS))
+                correction = self.target / np.maximum(amplitude * scale, _EPS)
+                np.multiply(self.weights, correction, out=self.weights, where=self.signal)
+
+            # Far-field constraint: keep the phase, impose the (weighted) target amplitude
+            np.maximum(amplitude, _EPS, out=amplitude)
+            np.divide(self.target, amplitude, out=amplitude)
+            if weighted:
+                amplitude *= self.weights
+            field *= amplitude
+
+            # SLM constraint: keep the phase, impose the illumination amplitude
+            fft2(field, inverse=True, workers=self.workers)
+            np.abs(field, out=amplitude)
+            np.maximum(amplitude, _EPS, out=amplitude)
+            np.divide(self.source, amplitude, out=amplitude)
+            field *= amplitude
+
+        phase = np.angle(field).astype(np.float32)
+        phase[phase < 0] += np.float32(2 * np.pi)
+        if iterations:
+            for name, values in self.evaluate(phase).items():
+                metrics[name][-1] = values
+        return phase, metrics
+
+    def evaluate(self, phase):
+        """
+        Measures the far field of phase masks against the targets of the last `run`.
+
+        Args:
+            phase (numpy.ndarray): Mask phase in radians, shape (batch, height, width).
+
+        Returns:
+            dict: Maps each name in METRICS to a (batch,) array.
+        """
+        np.multiply(self.source, np.exp(1j * np.asarray(phase, dtype=np.float32)), out=self.field)
+        fft2(self.field, inverse=False, workers=self.workers)
+        np.abs(self.field, out=self.amplitude)
+        metrics = {name: np.zeros((1, self.batch)) for name in METRICS}
+        self._record(metrics, 0)
+        return {name: values[0] for name, values in metrics.items()}
+
+
+def phase_to_gray(phase):
+    """
+    Quantizes a phase in radians to the nearest uint8 gray level, GRAY_LEVELS per wave,
+    as `phase_slm_pattern` does.
+    """
+    return wrap_to_gray(np.asarray(phase) * (GRAY_LEVELS / (2 * np.pi)))
+
+
+def gray_to_phase(gray):
+    """
+    Returns the float32 phase in radians shown by uint8 gray levels.
+    """
+    return np.asarray(gray, dtype=np.float32) * np.float32(2 * np.pi / GRAY_LEVELS)
+
+
+def load_target(path, shape=None):
+    """
+    Loads a target intensity pattern from an image, optionally resized to (height, width).
+    """
+    target = load_mask(path)
+    if shape is not None and target.shape != tuple(shape):
+        target = cv2.resize(target, (shape[1], shape[0]), interpolation=cv2.INTER_AREA)
+    return target.astype(np.float32)
+
+
+def design_masks(targets, iterations=30, weighted=False, seed=None, workers=-1):
+    """
+    Computes gray-level phase masks for a batch of target intensity patterns.
+
+    Args:
+        targets (numpy.ndarray): Target intensities, shape (batch, height, width) or
+                                 (height, width).
+        iterations (int): Number of Gerchberg-Saxton iterations.
+        weighted (bool): Use the weighted variant.
+        seed (int, optional): Seed for the random starting phase.
+        workers (int): FFT threads, see `HologramEngine`.
+
+    Returns:
+        tuple: (masks, metrics) with uint8 masks shaped like `targets`, ready to be
+               saved and tiled by `repeat_image`, and the metrics from `HologramEngine.run`
+               with the last row measured on the quantized masks.
+    """
+    targets = np.asarray(targets, dtype=np.float32)
+    stack = targets if targets.ndim == 3 else targets[None]
+    engine = HologramEngine(stack.shape[1:], batch=stack.shape[0], workers=workers)
+    phase, metrics = engine.run(stack, iterations, weighted=weighted, seed=seed)
+    masks = phase_to_gray(phase)
+    if iterations:
+        for name, values in engine.evaluate(gray_to_phase(masks)).items():
+            metrics[name][-1] = values
+    return (masks if targets.ndim == 3 else masks[0]), metrics
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compute phase-only mask cells for target intensity images."
+    )
+    parser.add_argument("targets", nargs="+", help="Target intensity images")
+    parser.add_argument(
+        "--output",
+        help="Output mask path (single target only); defaults to <target>_mask.png",
+    )
+    parser.add_argument("--size", help="Unit cell size as WxH; defaults to the first target's")
+    parser.add_argument("--iterations", type=int, default=30)
+    parser.add_argument("--weighted", action="store_true", help="Use weighted Gerchberg-Saxton")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=-1)
+    args = parser.parse_args()
+
+    if args.output and len(args.targets) > 1:
+        parser.error("--output can only be used with a single target")
+    if args.size:
+        width, height = (int(v) for v in args.size.lower().split("x"))
+        shape = (height, width)
+    else:
+        shape = load_mask(args.targets[0]).shape
+    targets = np.stack([load_target(path, shape) for path in args.targets])
+
+    masks, metrics = design_masks(
+        targets, args.iterations, weighted=args.weighted, seed=args.seed, workers=args.workers
+    )
+    for i, path in enumerate(args.targets):
+        output = args.output or os.path.splitext(path)[0] + "_mask.png"
+        Image.fromarray(masks[i]).save(output)
+        print(
+            f"{output}: efficiency {metrics['efficiency'][-1, i]:.3f}, "
+            f"uniformity {metrics['uniformity'][-1, i]:.3f}, error {metrics['error'][-1, i]:.3f}"
+        )
@@ -0,0 +1,358 @@
+import multiprocessing
+import queue
+import time
+from collections import deque
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from display_sinks import OpenCVWindowSink, get_monitors
+
+# *  Driving several SLMs together: one presenter process per screen, frames handed
+#    over in shared memory, and a barrier so that paired frames flip at the same time
+
+# How often an idle presenter polls its window for key presses
+IDLE_POLL_S = 0.01
+
+
+def open_window_sink(screen, index):
+    """
+    Default sink factory: a full-screen OpenCV window per screen.
+    """
+    return OpenCVWindowSink(screen, f"projector{index}")
+
+
+def _present_frames(
+    index,
+    screen,
+    shape,
+    memory_name,
+    slots,
+    sink_factory,
+    lut_path,
+    commands,
+    events,
+    barrier,
+    timeout_s,
+):
+    # Presenter process: waits for slot numbers, then flips in step with the others
+    from phase_lut import load_lut
+
+    memory = shared_memory.SharedMemory(name=memory_name)
+    frames = np.ndarray((slots,) + shape, dtype=np.uint8, buffer=memory.buf)
+    lut = load_lut(lut_path) if lut_path else None
+    sink = sink_factory(screen, index)
+    flip_times = []
+    events.put(("ready", index))
+    try:
+        while True:
+            try:
+                command = commands.get(timeout=IDLE_POLL_S)
+            except queue.Empty:
+                # Keep the window responsive and forward keys while idle
+                key = sink.wait_key(1)
+                if key != -1:
+                    events.put(("key", index, key))
+                continue
+            if command is None:
+                break
+            sequence, slot = command
+            frame = frames[slot] if lut is None else lut.apply(frames[slot])
+            barrier.wait(timeout_s)
+            sink.present(frame)
+            flip_times.append(time.perf_counter())
+            key = sink.wait_key(1)  # Let the GUI paint the frame
+            events.put(("presented", index, sequence, key))
+    finally:
+        last_frame = getattr(sink, "last_frame", None)
+        events.put(
+            (
+                "closed",
+                index,
+                {
+                    "presented": len(flip_times),
+                    "flip_times": flip_times,
+                    "last_frame": None if last_frame is None else np.array(last_frame),
+                },
+            )
+        )
+        sink.close()
+        del frames
+        memory.close()
+
+
+class MultiScreenPresenter:
+    """
+    Presents frames on several screens at once, one presenter process per screen.
+
+    Each screen gets a shared-memory block of `slots` frame buffers. `present` copies
+    one frame per screen into the next slot and sends only the slot number to the
+    presenters, so no frame data is pickled. Presenters meet at a barrier before each
+    flip, so frames passed to the same `present` call are shown together.
+
+    The presenter has the sink interface (`present`, `wait_key`, `close`), with
+    `present` taking one frame per screen, so it can be driven by `run_keyboard_loop`
+    or `frame_sequence.play_sequence`. Keys pressed in any screen's window are
+    reported by `wait_key`.
+
+    Args:
+        screen_ids (list): Monitor indices, see `display_sinks.get_monitors`.
+        sink_factory (callable): Called as sink_factory(screen, index) in each presenter
+                                 process to create its sink; must be picklable, e.g. a
+                                 module-level function.
+        lut_paths (list, optional): Calibration file (or None) per screen, applied in
+                                    the presenter processes.
+        slots (int): Frame buffers per screen; with more than one, the next frames can
+                     be written while the previous ones are being shown.
+        synchronous (bool): If True, `present` returns only after all screens flipped.
+        timeout_s (float): How long to wait for a presenter before giving up.
+    """
+
+    def __init__(
+        self,
+        screen_ids,
+        sink_factory=open_window_sink,
+        lut_paths=None,
+        slots=2,
+        synchronous=True,
+        timeout_s=10.0,
+    ):
+        monitors = get_monitors()
+        self.screens = [monitors[i] for i in screen_ids]
+        self.shapes = [(screen.height, screen.width) for screen in self.screens]
+        self.slots = slots
+        self.synchronous = synchronous
+        self.timeout_s = timeout_s
+        lut_paths = lut_paths or [None] * len(self.screens)
+
+        # Spawned presenters start from a clean interpreter, which GUI toolkits need
+        context = multiprocessing.get_context("spawn")
+        self.events = context.Queue()
+        self.barrier = context.Barrier(len(self.screens))
+        self.memories, self.buffers, self.commands, self.processes = [], [], [], []
+        for index, (screen, shape) in enumerate(zip(self.screens, self.shapes)):
+            memory = shared_memory.SharedMemory(create=True, size=slots * shape[0] * shape[1])
+            commands = context.Queue()
+            process = context.Process(
+                target=_present_frames,
+                args=(
+                    index,
+                    screen,
+                    shape,
+                    memory.name,
+                    slots,
+                    sink_factory,
+                    lut_paths[index],
+                    commands,
+                    self.events,
+                    self.barrier,
+                    timeout_s,
+                ),
+                daemon=True,
+            )
+            process.start()
+            self.memories.append(memory)
+            self.buffers.append(np.ndarray((slots,) + shape, dtype=np.uint8, buffer=memory.buf))
+            self.commands.append(commands)
+            self.processes.append(process)
+
+        self.sequence = 0
+        self.in_flight = deque()  # Sequence numbers not yet presented on every screen
+        self.flipped = {}  # Sequence number -> screens that have presented it
+        self.keys = deque()
+        self.reports = [None] * len(self.screens)
+
+        # Wait until every presenter has its sink open, so the first frame is not late
+        self.ready = 0
+        deadline = time.perf_counter() + timeout_s
+        while self.ready < len(self.screens):
+            if self._next_event(IDLE_POLL_S):
+                continue
+            stopped = [i for i, p in enumerate(self.processes) if not p.is_alive()]
+            if stopped or time.perf_counter() > deadline:
+                self.close()
+                raise RuntimeError(f"Presenters for screens {stopped or screen_ids} did not start")
+
+    def _handle(self, event):
+        kind, index = event[0], event[1]
+        if kind == "presented":
+            sequence, key = event[2], event[3]
+            self.flipped[sequence] = self.flipped.get(sequence, 0) + 1
+            if key != -1:
+                self.keys.append(key)
+        elif kind == "key":
+            self.keys.append(event[2])
+        elif kind == "ready":
+            self.ready += 1
+        elif kind == "closed":
+            self.reports[index] = event[2]
+
+    def _next_event(self, timeout_s):
+        try:
+            self._handle(self.events.get(timeout=timeout_s))
+            return True
+        except queue.Empty:
+            return False
+
+    def _wait_flipped(self, sequence):
+        # Blocks until every screen has presented `sequence`
+        deadline = time.perf_counter() + self.timeout_s
+        while self.flipped.get(sequence, 0) < len(self.screens):
+            if not self._next_event(max(0.0, deadline - time.perf_counter())):
+                stopped = [i for i, p in enumerate(self.processes) if not p.is_alive()]
+                raise RuntimeError(
+                    f"Frame {sequence} was not presented on all screens"
+                    + (f"; presenters {stopped} stopped" if stopped else "")
+                )
+        del self.flipped[sequence]
+
+    def present(self, frames):
+        """
+        Shows one frame per screen, all flipping together.
+
+        Args:
+            frames (sequence): 2-D uint8 frames, one per screen, each of that screen's
+                               size. They are copied, so the caller may reuse them.
+        """
+        if len(frames) != len(self.screens):
+            raise ValueError(f"Expected {len(self.screens)} frames, got {len(frames)}")
+        # The slot about to be overwritten must have been shown on every screen
+        while self.in_flight and self.in_flight[0] <= self.sequence - self.slots:
+            self._wait_flipped(self.in_flight.popleft())
+
+        slot = self.sequence % self.slots
+        for buffer, frame in zip(self.buffers, frames):
+            np.copyto(buffer[slot], frame)
+        for commands in self.commands:
+            commands.put((self.sequence, slot))
+        self.in_flight.append(self.sequence)
+        self.sequence += 1
+        if self.synchronous:
+            self._wait_flipped(self.in_flight.pop())
+
+    def wait_key(self, delay_ms):
+        """
+        Returns the next key pressed in any presenter window, or -1 after `delay_ms`
+        (0 waits indefinitely).
+        """
+        deadline = None if delay_ms <= 0 else time.perf_counter() + delay_ms / 1e3
+        while not self.keys:
+            if deadline is None:
+                self._next_event(None)
+            elif not self._next_event(max(0.0, deadline - time.perf_counter())):
+                break
+            if deadline is not None and time.perf_counter() >= deadline:
+                break
+        return self.keys.popleft() if self.keys else -1
+
+    def close(self):
+        """
+        Stops the presenters and frees the shared memory.
+
+        Returns:
+            list: Per screen, a dict with the number of presented frames, their flip
+                  times (time.perf_counter) and, for sinks that keep it (such as
+                  `MemorySink`), a copy of the last presented frame.
+        """
+        for commands in self.commands:
+            commands.put(None)
+        deadline = time.perf_counter() + self.timeout_s
+        while time.perf_counter() < deadline and any(
+            report is None and process.is_alive()
+            for report, process in zip(self.reports, self.processes)
+        ):
+            self._next_event(IDLE_POLL_S)
+        for process in self.processes:
+            process.join(max(0.0, deadline - time.perf_counter()))
+            if process.is_alive():
+                process.terminate()
+        self.buffers.clear()
+        for memory in self.memories:
+            memory.close()
+            memory.unlink()
+        self.memories.clear()
+        return self.reports
+
+
+def flip_skew_ms(reports):
+    """
+    Returns the largest spread of flip times across screens for any frame, in milliseconds.
+    """
+    counts = [len(report["flip_times"]) for report in reports]
+    if not counts or min(counts) == 0:
+        return 0.0
+    times = np.array([report["flip_times"][: min(counts)] for report in reports])
+    return float((times.max(axis=0) - times.min(axis=0)).max() * 1e3)
+
+
+class _LockstepFrames:
+    # Entry i of every bank as one step; banks that stream are read in order, in step
+    def __init__(self, banks):
+        self.banks = banks
+
+    def __len__(self):
+        return len(self.banks[0])
+
+    def __getitem__(self, index):
+        return tuple(bank[index] for bank in self.banks)
+
+
+def play_sequences_on_screens(
+    screen_ids,
+    sequences,
+    fps=None,
+    repeat=1,
+    lut_paths=None,
+    sink_factory=open_window_sink,
+):
+    """
+    Pre-renders one pattern sequence per screen and plays them in lockstep.
+
+    Entry i of every sequence is shown at the same time, e.g. the amplitude and phase
+    patterns of one step on two SLMs.
+
+    Args:
+        screen_ids (list): Monitor indices.
+        sequences (list): One list of pattern entries per screen, all of the same length;
+                          see `frame_sequence.render_pattern`.
+        fps (float, optional): Presentation rate; None advances on key presses.
+        repeat (int): Number of passes through the sequences.
+        lut_paths (list, optional): Calibration file (or None) per screen.
+        sink_factory (callable): Creates each presenter's sink, see `MultiScreenPresenter`.
+
+    Returns:
+        tuple: (jitter summary of `frame_sequence.play_sequence`, presenter reports).
+    """
+    from frame_sequence import build_frame_bank, play_sequence
+
+    if len({len(sequence) for sequence in sequences}) > 1:
+        raise ValueError("All sequences must have the same number of entries")
+    monitors = get_monitors()
+    banks = [
+        build_frame_bank(sequence, monitors[i].width, monitors[i].height)
+        for i, sequence in zip(screen_ids, sequences)
+    ]
+    steps = _LockstepFrames(banks)
+
+    presenter = MultiScreenPresenter(screen_ids, sink_factory, lut_paths)
+    try:
+        summary = play_sequence(presenter, steps, fps=fps, repeat=repeat)
+    finally:
+        reports = presenter.close()
+        for bank in banks:
+            bank.close()
+    print(
+        f"Presented {summary['frames']} paired frames on {len(screen_ids)} screens, "
+        f"jitter std {summary['std_ms']:.3f} ms, max flip skew {flip_skew_ms(reports):.3f} ms"
+    )
+    return summary, reports
+
+
+if __name__ == "__main__":
+    from frame_sequence import load_sequence
+
+    screen_ids = [1, 2]  # Amplitude and phase SLM
+    sequence_paths = ["./amplitude_sequence.json", "./phase_sequence.json"]
+    fps = 10  # Set to None to advance with a key press
+
+    play_sequences_on_screens(screen_ids, [load_sequence(p) for p in sequence_paths], fps=fps)
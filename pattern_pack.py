@@ -0,0 +1,273 @@
+import argparse
+import glob
+import json
+import os
+import struct
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from repeat_pattern import PatternTiler, load_mask
+
+# *  Pattern packs: many pre-decoded masks in one memory-mapped file
+
+PACK_EXTENSION = ".slmpack"
+
+# File layout: magic, little-endian uint64 index length, JSON index, then the pixel
+# data of every entry as C-ordered uint8, each entry starting on an ALIGNMENT boundary
+MAGIC = b"SLMPACK1"
+_PREAMBLE = struct.Struct("<8sQ")
+ALIGNMENT = 64
+
+
+def _align(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def frame_key(name, width, height):
+    """
+    Returns the index name of the pre-tiled (width x height) frame of mask `name`.
+    """
+    return f"{name}@{width}x{height}"
+
+
+class PatternPack:
+    """
+    Read-only pattern pack opened by memory mapping.
+
+    Every entry is a read-only view into the mapped file, so selecting a mask costs
+    neither decoding nor copying; pages are read from disk on first access.
+
+    Entries are unit cells keyed by name (the source path relative to the packed
+    directory, without extension), and optionally full frames pre-tiled for a
+    target resolution, keyed by `frame_key` and carrying the offsets and scale
+    they were tiled with.
+
+    Args:
+        path (str): Path to a pack written by `build_pack`.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            magic, index_length = _PREAMBLE.unpack(f.read(_PREAMBLE.size))
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a pattern pack")
+            self.index = json.loads(f.read(index_length))
+        self.data = np.memmap(path, dtype=np.uint8, mode="r")
+        self.entries = {entry["name"]: entry for entry in self.index["entries"]}
+
+    @property
+    def names(self):
+        """
+        Names of the unit-cell masks, in pack order.
+        """
+        return [entry["name"] for entry in self.index["entries"] if entry["kind"] == "cell"]
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.entries
+
+    def __getitem__(self, name):
+        """
+        Returns the entry `name` (a cell or a `frame_key`) as a read-only 2-D uint8 view.
+        """
+        entry = self.entries[name]
+        height, width = entry["shape"]
+        start = entry["offset"]
+        return self.data[start : start + height * width].reshape(height, width)
+
+    def frame(self, name, width, height):
+        """
+        Returns the pre-tiled frame entry of mask `name` for a resolution, or None.
+        """
+        return self.entries.get(frame_key(name, width, height))
+
+
+class PackedMaskTiler(PatternTiler):
+    """
+    `PatternTiler` over a mask stored in a `PatternPack`.
+
+    The unit cell is the mapped view, so nothing is decoded. When the pack holds a
+    frame pre-tiled for this resolution and the requested placement matches the one
+    it was built with, `render` returns that mapped frame directly instead of tiling.
+
+    Args:
+        pack (PatternPack): The open pack.
+        name (str): Mask name in the pack.
+        target_width (int): Width of the output frame.
+        target_height (int): Height of the output frame.
+        **kwargs: Passed on to `PatternTiler`.
+    """
+
+    def __init__(self, pack, name, target_width, target_height, **kwargs):
+        super().__init__(name, target_width, target_height, mask=pack[name], **kwargs)
+        self.pack = pack
+        self.name = name
+        entry = pack.frame(name, target_width, target_height)
+        self.prerendered = None
+        if entry is not None:
+            self.prerendered = (
+                (entry["x_offset"], entry["y_offset"], entry["scale"]),
+                pack[entry["name"]],
+            )
+
+    def render(self, x_offset=0, y_offset=0, scale=1, flip_horizontal=False, flip_vertical=False):
+        placement = (x_offset, y_offset, scale)
+        flipped = flip_horizontal or flip_vertical
+        if self.prerendered is not None and not flipped and self.prerendered[0] == placement:
+            return self.prerendered[1]
+        return super().render(x_offset, y_offset, scale, flip_horizontal, flip_vertical)
+
+
+def _entry_name(path, root):
+    relative = os.path.relpath(path, root) if root else os.path.basename(path)
+    return os.path.splitext(relative)[0].replace(os.sep, "/")
+
+
+def _fill_entry(pack_path, entry, source, tile):
+    # Runs in a worker process: decode (and tile) one source straight into the file
+    height, width = entry["shape"]
+    out = np.memmap(
+        pack_path, dtype=np.uint8, mode="r+", offset=entry["offset"], shape=(height, width)
+    )
+    if tile is None:
+        out[:] = load_mask(source)
+    else:
+        tiler = PatternTiler(source, width, height, cache_size=1)
+        out[:] = tiler.render(tile["x_offset"], tile["y_offset"], tile["scale"])
+    out.flush()
+    del out
+
+
+def build_pack(
+    output_path,
+    sources,
+    root=None,
+    resolutions=(),
+    x_offset=None,
+    y_offset=None,
+    scale=None,
+    workers=None,
+):
+    """
+    Converts mask images into a pattern pack.
+
+    Image sizes are read from the file headers to lay out the index, then the images
+    are decoded (and tiled) in parallel by worker processes, each writing straight
+    into its slot of the memory-mapped output.
+
+    Args:
+        output_path (str): Path of the pack to write.
+        sources (list): Image paths.
+        root (str, optional): Directory entry names are made relative to; by default
+                              names are the file names without extension.
+        resolutions (iterable): (width, height) pairs to also store pre-tiled frames for.
+        x_offset (float, optional): Tiling offset of the pre-tiled frames; defaults to
+                                    the frame centre.
+        y_offset (float, optional): See `x_offset`.
+        scale (float, optional): Scale the pre-tiled frames are rendered at; defaults to
+                                 the delta size of a fresh `TiledMaskState`.
+        workers (int, optional): Number of worker processes; defaults to the CPU count.
+
+    Returns:
+        PatternPack: The written pack, opened for reading.
+    """
+    if scale is None:
+        from send_repeated_slm_pattern import DELTAS, TiledMaskState
+
+        scale = DELTAS[TiledMaskState(0, 0).delta_index]
+
+    entries, jobs = [], []
+    for source in sources:
+        with Image.open(source) as image:
+            width, height = image.size
+        name = _entry_name(source, root)
+        entries.append({"name": name, "kind": "cell", "shape": [height, width]})
+        jobs.append((source, None))
+        for target_width, target_height in resolutions:
+            tile = {
+                "x_offset": target_width // 2 if x_offset is None else x_offset,
+                "y_offset": target_height // 2 if y_offset is None else y_offset,
+                "scale": scale,
+            }
+            entries.append(
+                {
+                    "name": frame_key(name, target_width, target_height),
+                    "kind": "frame",
+                    "cell": name,
+                    "shape": [target_height, target_width],
+                    **tile,
+                }
+            )
+            jobs.append((source, tile))
+    if len({entry["name"] for entry in entries}) != len(entries):
+        raise ValueError("Pattern names in a pack must be unique")
+
+    # The index stores absolute offsets, so reserve room for it by measuring it with
+    # placeholder offsets at least as long as the real ones
+    for entry in entries:
+        entry["offset"] = 10**15
+    measured = json.dumps({"version": 1, "entries": entries}).encode()
+    data_start = _align(_PREAMBLE.size + len(measured))
+    offset = data_start
+    for entry in entries:
+        entry["offset"] = offset
+        height, width = entry["shape"]
+        offset = _align(offset + height * width)
+    index = json.dumps({"version": 1, "entries": entries}).encode()
+
+    with open(output_path, "wb") as f:
+        f.write(_PREAMBLE.pack(MAGIC, len(index)))
+        f.write(index)
+        f.truncate(offset)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(_fill_entry, output_path, entry, source, tile)
+            for entry, (source, tile) in zip(entries, jobs)
+        ]
+        for future in futures:
+            future.result()
+    return PatternPack(output_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Pack a directory of mask images into a memory-mapped pattern pack."
+    )
+    parser.add_argument("directory", help="Directory searched recursively for .png masks")
+    parser.add_argument("output", help=f"Output pack path, e.g. masks{PACK_EXTENSION}")
+    parser.add_argument(
+        "--tile",
+        action="append",
+        default=[],
+        metavar="WxH",
+        help="Also store frames pre-tiled for this resolution (repeatable)",
+    )
+    parser.add_argument("--x-offset", type=float, help="Tiling offset; defaults to the centre")
+    parser.add_argument("--y-offset", type=float, help="Tiling offset; defaults to the centre")
+    parser.add_argument(
+        "--scale", type=float, help="Tiling scale; defaults to the default delta size"
+    )
+    parser.add_argument("--workers", type=int)
+    args = parser.parse_args()
+
+    sources = sorted(glob.glob(os.path.join(args.directory, "**", "*.png"), recursive=True))
+    resolutions = [tuple(int(v) for v in size.lower().split("x")) for size in args.tile]
+    pack = build_pack(
+        args.output,
+        sources,
+        root=args.directory,
+        resolutions=resolutions,
+        x_offset=args.x_offset,
+        y_offset=args.y_offset,
+        scale=args.scale,
+        workers=args.workers,
+    )
+    for name in pack.names:
+        print(f"{name}: {pack[name].shape[1]}x{pack[name].shape[0]}")
+    print(f"Wrote {len(pack)} masks to {args.output}")
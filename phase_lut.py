@@ -0,0 +1,106 @@
+import json
+import os
+
+import cv2
+import numpy as np
+
+from geometry import GeometryStage
+
+
+def _as_table(values):
+    table = np.asarray(values, dtype=np.float64).ravel()
+    if table.shape != (256,):
+        raise ValueError(f"A lookup table needs 256 entries, got {table.size}")
+    return np.clip(np.rint(table), 0, 255).astype(np.uint8)
+
+
+class PhaseLUT:
+    """
+    Gray-level correction applied to a uint8 frame by table lookup.
+
+    A global 256-entry table maps every pixel; optional regions override it inside
+    rectangles, for spatially varying response. The lookup writes into a preallocated
+    buffer that is reused (and overwritten) by the next `apply`.
+
+    A mount correction (see geometry.py) is applied before the lookup, so region
+    rectangles are in screen coordinates. Flips add one `cv2.flip` pass; other
+    corrections add one remap pass.
+
+    Args:
+        lut (array-like): 256 output values, indexed by input gray level.
+        regions (list, optional): (x0, y0, x1, y1, lut) tuples with exclusive ends;
+                                  later regions take precedence where they overlap.
+        geometry (GeometryStage, optional): Mount correction of the SLM.
+    """
+
+    def __init__(self, lut, regions=None, geometry=None):
+        self.lut = _as_table(lut)
+        self.regions = [
+            (int(x0), int(y0), int(x1), int(y1), _as_table(table))
+            for x0, y0, x1, y1, table in (regions or [])
+        ]
+        self.geometry = geometry
+        self.buffer = None
+
+    @classmethod
+    def identity(cls):
+        return cls(np.arange(256))
+
+    def apply(self, frame):
+        """
+        Returns the corrected frame.
+
+        Args:
+            frame (numpy.ndarray): 2-D uint8 frame.
+
+        Returns:
+            numpy.ndarray: The shared output buffer with the same shape as `frame`.
+        """
+        if self.buffer is None or self.buffer.shape != frame.shape:
+            self.buffer = np.empty(frame.shape, dtype=np.uint8)
+        out = self.buffer
+
+        if self.geometry is not None:
+            frame = self.geometry.apply(frame)
+        cv2.LUT(frame, self.lut, dst=out)
+
+        # Region tables overwrite the global lookup inside their rectangles
+        for x0, y0, x1, y1, table in self.regions:
+            out[y0:y1, x0:x1] = cv2.LUT(frame[y0:y1, x0:x1], table)
+        return out
+
+
+def load_lut(path):
+    """
+    Loads a `PhaseLUT` from a calibration file.
+
+    Supported formats:
+        - .npy: a 256-entry array.
+        - .csv / .txt: 256 values, one per line (or comma separated).
+        - .json: {"lut": [...256 values...],
+                  "regions": [{"rect": [x0, y0, x1, y1], "lut": [...]}, ...],
+                  "geometry": {"flip_horizontal": true, "rotation_deg": 0.3, ...}}
+          where "geometry" holds the arguments of `geometry.GeometryStage`.
+
+    Args:
+        path (str): Path to the calibration file.
+
+    Returns:
+        PhaseLUT: The loaded correction.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".npy":
+        return PhaseLUT(np.load(path))
+    if extension in (".csv", ".txt"):
+        return PhaseLUT(np.loadtxt(path, delimiter="," if extension == ".csv" else None))
+    if extension == ".json":
+        with open(path) as f:
+            calibration = json.load(f)
+        regions = [
+            (*region["rect"], region["lut"]) for region in calibration.get("regions", [])
+        ]
+        geometry = calibration.get("geometry")
+        if geometry is not None:
+            geometry = GeometryStage.from_dict(geometry)
+        return PhaseLUT(calibration.get("lut", np.arange(256)), regions, geometry)
+    raise ValueError(f"Unsupported calibration file: {path}")
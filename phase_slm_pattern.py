@@ -0,0 +1,405 @@
+import math
+from dataclasses import dataclass, replace
+from functools import lru_cache
+
+import cv2
+import numpy as np
+
+from display_control import key_bindings, run_keyboard_loop, with_stages
+from display_sinks import OpenCVWindowSink, get_monitors
+from phase_lut import load_lut
+
+# *  Analytic phase patterns (blazed gratings, Fresnel lenses, vortices, Zernike terms)
+
+GRAY_LEVELS = 256  # Gray levels spanning one wave (2 pi) of phase; wraps like uint8
+
+# Default optical parameters used to convert a focal length into a lens phase
+WAVELENGTH = 532e-9  # m
+PIXEL_PITCH = 8e-6  # m
+
+
+# Adding this to a float32 phase in gray levels rounds it to the nearest level and
+# leaves that level in the low bits of the float's bit pattern, so the low byte of
+# the bits, read as int32, is the phase wrapped to 0-255
+_ROUNDING_MAGIC = np.float32(1.5 * 2**23)
+# Largest |phase| in gray levels the rounding trick holds for
+_ROUNDING_RANGE = 2**22
+# Resolution, in fractions of a gray level, of the column phase of separable patterns
+_SUBLEVELS = 16
+
+
+def wrap_to_gray(levels):
+    """
+    Rounds a phase in gray levels to the nearest level and wraps it into a uint8 array.
+    """
+    return np.mod(np.rint(levels), GRAY_LEVELS).astype(np.uint8)
+
+
+@lru_cache(maxsize=4)
+def coordinate_axes(width, height, x_center, y_center):
+    """
+    Returns float32 pixel coordinates relative to the centre as broadcastable axes.
+
+    Returns:
+        tuple: x with shape (1, width) and y with shape (height, 1), read-only.
+    """
+    x = (np.arange(width, dtype=np.float32) - np.float32(x_center))[None, :]
+    y = (np.arange(height, dtype=np.float32) - np.float32(y_center))[:, None]
+    x.flags.writeable = False
+    y.flags.writeable = False
+    return x, y
+
+
+@lru_cache(maxsize=4)
+def radius_squared(width, height, x_center, y_center):
+    """
+    Returns the cached float32 squared distance to the centre, shape (height, width).
+    """
+    x, y = coordinate_axes(width, height, x_center, y_center)
+    r2 = x * x + y * y
+    r2.flags.writeable = False
+    return r2
+
+
+@lru_cache(maxsize=4)
+def azimuth(width, height, x_center, y_center):
+    """
+    Returns the cached float32 azimuthal angle in (-pi, pi], shape (height, width).
+    """
+    x, y = coordinate_axes(width, height, x_center, y_center)
+    theta = np.arctan2(y, x).astype(np.float32)
+    theta.flags.writeable = False
+    return theta
+
+
+def zernike_radial(n, m, rho):
+    """
+    Evaluates the Zernike radial polynomial R_n^|m| at `rho`.
+    """
+    m = abs(m)
+    if (n - m) % 2:
+        return np.zeros_like(rho)
+    result = np.zeros_like(rho)
+    for k in range((n - m) // 2 + 1):
+        coefficient = (
+            (-1) ** k
+            * math.factorial(n - k)
+            / (
+                math.factorial(k)
+                * math.factorial((n + m) // 2 - k)
+                * math.factorial((n - m) // 2 - k)
+            )
+        )
+        result += np.float32(coefficient) * rho ** (n - 2 * k)
+    return result
+
+
+@lru_cache(maxsize=16)
+def zernike_basis(n, m, width, height, x_center, y_center, aperture_radius):
+    """
+    Returns a cached float32 Zernike term Z_n^m over the frame, in waves per unit coefficient.
+
+    The polynomial is normalized to a disk of `aperture_radius` pixels and evaluated
+    over the whole frame; m >= 0 selects the cosine term and m < 0 the sine term.
+    """
+    if abs(m) > n:
+        raise ValueError(f"Invalid Zernike term n={n}, m={m}")
+    r2 = radius_squared(width, height, x_center, y_center)
+    rho = np.sqrt(r2) / np.float32(aperture_radius)
+    basis = zernike_radial(n, m, rho)
+    if m > 0:
+        basis *= np.cos(m * azimuth(width, height, x_center, y_center))
+    elif m < 0:
+        basis *= np.sin(-m * azimuth(width, height, x_center, y_center))
+    basis = basis.astype(np.float32)
+    basis.flags.writeable = False
+    return basis
+
+
+@lru_cache(maxsize=16)
+def zernike_peak(n, m, width, height, x_center, y_center, aperture_radius):
+    """
+    Returns the largest |Z_n^m| over the frame, see `zernike_basis`.
+    """
+    basis = zernike_basis(n, m, width, height, x_center, y_center, aperture_radius)
+    return float(np.abs(basis).max())
+
+
+class PhasePatternGenerator:
+    """
+    Sums analytic phase terms on cached coordinate grids and wraps them into uint8.
+
+    Phase is counted in gray levels (GRAY_LEVELS per wave). The blazed grating and the
+    constant are separable, so they are kept as a float64 row and column. A pattern
+    with nothing else is written straight in uint8: rows whose column phase has the
+    same fraction (rounded to 1/_SUBLEVELS level) share one quantised row, and the
+    whole levels are added with uint8 wrap-around. Otherwise the row and column are
+    expanded into a float32 frame before the first lens, vortex or Zernike term, each
+    of which is one fused multiply-add; terms with a zero amplitude are skipped.
+    Quantising that frame to the nearest gray level and wrapping it is one float32
+    add and a cast to uint8. All frame buffers are preallocated, and the returned
+    frame is shared and overwritten by the next render.
+
+    Args:
+        width (int): Frame width in pixels.
+        height (int): Frame height in pixels.
+        center (tuple, optional): (x, y) pixel the lens, vortex and Zernike terms are
+                                  centred on. Defaults to the frame centre.
+    """
+
+    def __init__(self, width, height, center=None):
+        self.width = width
+        self.height = height
+        self.center = center if center is not None else (width / 2, height / 2)
+        self.phase = np.empty((height, width), dtype=np.float32)
+        self.scratch = np.empty((height, width), dtype=np.float32)
+        self.frame = np.empty((height, width), dtype=np.uint8)
+        self.clear()
+
+    def _grid_key(self):
+        return (self.width, self.height) + tuple(self.center)
+
+    def clear(self, constant=0.0):
+        """
+        Starts a new pattern with a constant phase, in waves.
+        """
+        self.row = np.full(self.width, constant * GRAY_LEVELS)
+        self.column = np.zeros(self.height)
+        self.expanded = False  # True once `phase` holds the row and column
+        self.bound = GRAY_LEVELS  # Bound on |phase| in gray levels
+        return self
+
+    def add_blazed_grating(self, period_x=None, period_y=None):
+        """
+        Adds a linear phase ramp of one wave per `period_x` / `period_y` pixels.
+        """
+        x, y = coordinate_axes(*self._grid_key())
+        if period_x:
+            self._separable(self.row, x[0], GRAY_LEVELS / period_x)
+        if period_y:
+            self._separable(self.column, y[:, 0], GRAY_LEVELS / period_y)
+        return self
+
+    def _separable(self, axis, coordinates, levels_per_px):
+        if self.expanded:  # Added after a dense term: add it over the whole frame
+            values = np.mod(coordinates * levels_per_px, GRAY_LEVELS).astype(np.float32)
+            shape = (1, -1) if axis is self.row else (-1, 1)
+            np.add(self.phase, values.reshape(shape), out=self.phase)
+            self.bound += GRAY_LEVELS
+        else:
+            np.add(axis, coordinates * levels_per_px, out=axis)
+
+    def add_fresnel_lens(self, focal_length, wavelength=WAVELENGTH, pixel_pitch=PIXEL_PITCH):
+        """
+        Adds a thin-lens phase -r^2 / (2 lambda f), with `focal_length` in metres.
+        """
+        waves_per_px2 = -(pixel_pitch**2) / (2 * wavelength * focal_length)
+        x, y = coordinate_axes(*self._grid_key())
+        peak = float(np.abs(x).max()) ** 2 + float(np.abs(y).max()) ** 2
+        self._add_scaled(radius_squared(*self._grid_key()), waves_per_px2, peak)
+        return self
+
+    def add_vortex(self, charge):
+        """
+        Adds a helical phase of `charge` waves per revolution.
+        """
+        self._add_scaled(azimuth(*self._grid_key()), charge / (2 * np.pi), np.pi)
+        return self
+
+    def add_zernike(self, coefficients, aperture_radius):
+        """
+        Adds Zernike terms.
+
+        Args:
+            coefficients (dict): Mapping of (n, m) to amplitude in waves.
+            aperture_radius (float): Radius in pixels of the unit disk.
+        """
+        for (n, m), amplitude in coefficients.items():
+            if amplitude:
+                basis = zernike_basis(n, m, *self._grid_key(), aperture_radius)
+                peak = zernike_peak(n, m, *self._grid_key(), aperture_radius)
+                self._add_scaled(basis, amplitude, peak)
+        return self
+
+    def _expand(self):
+        # Writes the wrapped row + column over the frame
+        row = np.mod(self.row, GRAY_LEVELS).astype(np.float32)
+        column = np.mod(self.column, GRAY_LEVELS).astype(np.float32)
+        np.add(row[None, :], column[:, None], out=self.phase)
+        self.expanded = True
+        self.bound = 2 * GRAY_LEVELS
+
+    def _add_scaled(self, grid, waves, peak):
+        # Adds waves * grid, where `peak` bounds |grid|
+        if not waves:
+            return
+        if not self.expanded:
+            self._expand()
+        scale = waves * GRAY_LEVELS
+        cv2.scaleAdd(grid, scale, self.phase, dst=self.phase)
+        self.bound += abs(scale) * peak
+
+    def _separable_to_uint8(self):
+        row = np.mod(self.row, GRAY_LEVELS)
+        sublevels = np.rint(np.mod(self.column, GRAY_LEVELS) * _SUBLEVELS).astype(np.int64)
+        whole, fraction = np.divmod(sublevels, _SUBLEVELS)
+        fractions, rows = np.unique(fraction, return_inverse=True)
+        patterns = np.rint(row[None, :] + fractions[:, None] / _SUBLEVELS)
+        patterns = np.mod(patterns, GRAY_LEVELS).astype(np.uint8)
+        np.take(patterns, rows.ravel(), axis=0, out=self.frame)
+        np.add(self.frame, whole.astype(np.uint8)[:, None], out=self.frame)
+        return self.frame
+
+    def to_uint8(self):
+        """
+        Wraps the accumulated phase into [0, GRAY_LEVELS) and returns the shared uint8 frame.
+        """
+        if not self.expanded:
+            return self._separable_to_uint8()
+        if self.bound >= _ROUNDING_RANGE:
+            # Too large for the rounding trick (and for float32 precision): wrap first
+            np.rint(self.phase, out=self.scratch)
+            np.mod(self.scratch, GRAY_LEVELS, out=self.scratch)
+            np.copyto(self.frame, self.scratch, casting="unsafe")
+            return self.frame
+        np.add(self.phase, _ROUNDING_MAGIC, out=self.scratch)
+        np.copyto(self.frame, self.scratch.view(np.int32), casting="unsafe")
+        return self.frame
+
+
+@dataclass(frozen=True)
+class PhaseState:
+    grating_period_x: float = 0.0  # Pixels per wave; 0 disables the grating
+    grating_period_y: float = 0.0
+    focal_length: float = 0.0  # Metres; 0 disables the lens
+    vortex_charge: int = 0
+    defocus: float = 0.0  # Zernike Z(2, 0) amplitude in waves
+    astigmatism: float = 0.0  # Zernike Z(2, 2) amplitude in waves
+    aperture_radius: float = 500.0  # Zernike unit disk radius in pixels
+
+    def __post_init__(self):
+        if self.aperture_radius <= 0:
+            raise ValueError(f"aperture_radius must be > 0, got {self.aperture_radius}")
+
+
+def render_phase(state, generator):
+    """
+    Renders a `PhaseState` with a `PhasePatternGenerator`.
+    """
+    generator.clear()
+    generator.add_blazed_grating(state.grating_period_x, state.grating_period_y)
+    if state.focal_length:
+        generator.add_fresnel_lens(state.focal_length)
+    if state.vortex_charge:
+        generator.add_vortex(state.vortex_charge)
+    generator.add_zernike(
+        {(2, 0): state.defocus, (2, 2): state.astigmatism}, state.aperture_radius
+    )
+    return generator.to_uint8()
+
+
+def phase_key_bindings():
+    def scale_period(field, factor):
+        def action(state):
+            period = getattr(state, field) or 16.0
+            return replace(state, **{field: period * factor})
+
+        return action
+
+    def scale_focal_length(factor):
+        def action(state):
+            focal_length = state.focal_length or 1.0
+            return replace(state, focal_length=focal_length * factor)
+
+        return action
+
+    def nudge(field, step):
+        return lambda state: replace(state, **{field: round(getattr(state, field) + step, 6)})
+
+    return key_bindings(
+        {
+            "d": scale_period("grating_period_x", 1.05),  # Coarser horizontal grating
+            "a": scale_period("grating_period_x", 1 / 1.05),  # Finer horizontal grating
+            "s": scale_period("grating_period_y", 1.05),  # Coarser vertical grating
+            "w": scale_period("grating_period_y", 1 / 1.05),  # Finer vertical grating
+            "x": lambda state: replace(state, grating_period_x=0.0, grating_period_y=0.0),
+            "=": scale_focal_length(1.05),  # Longer focal length
+            "-": scale_focal_length(1 / 1.05),  # Shorter focal length
+            "0": lambda state: replace(state, focal_length=0.0),  # Remove the lens
+            "v": nudge("vortex_charge", 1),
+            "c": nudge("vortex_charge", -1),
+            "u": nudge("defocus", 0.1),
+            "j": nudge("defocus", -0.1),
+            "i": nudge("astigmatism", 0.1),
+            "k": nudge("astigmatism", -0.1),
+        }
+    )
+
+
+def display_phase_pattern_with_keyboard_control(
+    screen_id,
+    state=None,
+    sink=None,
+    lut_path=None,
+    timing_csv=None,
+    control=None,
+    journal_path=None,
+):
+    """
+    Displays an analytic phase pattern with keyboard controls for its parameters.
+
+    Keyboard Controls:
+        - 'a' / 'd' : Finer / coarser horizontal grating
+        - 'w' / 's' : Finer / coarser vertical grating
+        - 'x'       : Remove the grating
+        - '-' / '=' : Shorter / longer lens focal length
+        - '0'       : Remove the lens
+        - 'c' / 'v' : Decrease / increase vortex charge
+        - 'j' / 'u' : Decrease / increase defocus by 0.1 wave
+        - 'k' / 'i' : Decrease / increase astigmatism by 0.1 wave
+        - 'Esc'     : Exit the application
+
+    Args:
+        screen_id (int): Index of the monitor to display the pattern on.
+        state (PhaseState, optional): Initial parameters.
+        sink (optional): Output sink to present frames to. Defaults to a full-screen OpenCV window.
+        lut_path (str, optional): SLM calibration file applied to every frame.
+        timing_csv (str, optional): Path to write per-frame timings to on exit.
+        control (ControlServer, optional): Started server accepting remote state updates.
+        journal_path (str, optional): Record every shown state for replay, see session_journal.py.
+    """
+    screen = get_monitors()[screen_id]
+    width, height = screen.width, screen.height
+    generator = PhasePatternGenerator(width, height)
+    lut = load_lut(lut_path) if lut_path else None
+
+    if sink is None:
+        sink = OpenCVWindowSink(screen, "projector")
+
+    run_keyboard_loop(
+        sink,
+        state or PhaseState(),
+        with_stages(lambda state: render_phase(state, generator), lut and lut.apply),
+        phase_key_bindings(),
+        status=lambda state: (
+            f"Grating period: ({state.grating_period_x:.2f}, {state.grating_period_y:.2f}) px, "
+            f"Focal length: {state.focal_length:.4f} m, Vortex charge: {state.vortex_charge}, "
+            f"Defocus: {state.defocus:.1f}, Astigmatism: {state.astigmatism:.1f}"
+        ),
+        timing_csv=timing_csv,
+        control=control,
+        journal_path=journal_path,
+        journal_context={
+            "pattern": "phase",
+            "width": width,
+            "height": height,
+            "lut_path": lut_path,
+        },
+    )
+
+    sink.close()
+
+
+if __name__ == "__main__":
+    screen_id = 0
+    display_phase_pattern_with_keyboard_control(screen_id, PhaseState(grating_period_x=16.0))
@@ -1,7 +1,251 @@
+import math
+from collections import OrderedDict
+from functools import lru_cache
+
 from PIL import Image
 import cv2
 import numpy as np
 
+from phase_slm_pattern import GRAY_LEVELS, wrap_to_gray
+
+
+def load_mask(image_path):
+    """
+    Loads a mask image from disk as a 2-D uint8 grayscale array.
+
+    Args:
+        image_path (str): Path to the input image.
+
+    Returns:
+        numpy.ndarray: The decoded mask with shape (height, width).
+    """
+    image = Image.open(image_path).convert("L")  # Convert to grayscale
+    return np.array(image)
+
+
+def tile_into(cell, out, row_start=0, col_start=0):
+    """
+    Fills `out` with a periodic repetition of `cell`.
+
+    Pixel (r, c) of `out` receives cell[(row_start + r) % h, (col_start + c) % w], so
+    an offset is applied to the period of the unit cell rather than to a whole mosaic.
+    The first period is copied once and then doubled in place along each axis, which
+    keeps the work at a handful of contiguous copies regardless of the cell size.
+
+    Args:
+        cell (numpy.ndarray): The periodic unit cell with shape (h, w).
+        out (numpy.ndarray): Preallocated output buffer with shape (height, width).
+        row_start (int): Row of the unit cell that lands on the first output row.
+        col_start (int): Column of the unit cell that lands on the first output column.
+
+    Returns:
+        numpy.ndarray: `out`, for convenience.
+    """
+    cell_h, cell_w = cell.shape[:2]
+    out_h, out_w = out.shape[:2]
+    rolled = np.roll(cell, (-(row_start % cell_h), -(col_start % cell_w)), axis=(0, 1))
+
+    # Copy the first period, then double the filled region until the frame is covered
+    block_h, block_w = min(cell_h, out_h), min(cell_w, out_w)
+    out[:block_h, :block_w] = rolled[:block_h, :block_w]
+    filled = block_w
+    while filled < out_w:
+        n = min(filled, out_w - filled)
+        out[:block_h, filled : filled + n] = out[:block_h, :n]
+        filled += n
+    filled = block_h
+    while filled < out_h:
+        n = min(filled, out_h - filled)
+        out[filled : filled + n] = out[:n]
+        filled += n
+    return out
+
+
+# Complex field of each gray level, GRAY_LEVELS per wave of phase
+_PHASE_FIELD = np.exp(2j * np.pi * np.arange(GRAY_LEVELS) / GRAY_LEVELS).astype(np.complex64)
+
+
+@lru_cache(maxsize=64)
+def _phase_ramp(height, width, dx, dy):
+    # Fourier-domain kernel translating a periodic (height, width) cell by (dx, dy)
+    ky = np.fft.fftfreq(height)[:, None]
+    kx = np.fft.fftfreq(width)[None, :]
+    ramp = np.exp(-2j * np.pi * (ky * dy + kx * dx))
+    ramp.flags.writeable = False
+    return ramp
+
+
+def cell_spectrum(cell):
+    """
+    Returns the 2-D spectrum of the complex field of a phase unit cell, see `shift_cell`.
+    """
+    return np.fft.fft2(_PHASE_FIELD[cell])
+
+
+def shift_cell(cell, dx, dy, method="fourier", spectrum=None):
+    """
+    Translates a periodic phase unit cell by a fractional number of pixels.
+
+    The cell is treated as one period of an infinite tiling, so content leaving one
+    edge re-enters on the opposite edge and the tiled result stays seamless. Gray
+    levels are phases that wrap from 255 to 0, so the complex field exp(2 pi i g / 256)
+    is shifted rather than the levels, and its phase is rounded back to a gray level.
+
+    Args:
+        cell (numpy.ndarray): The periodic unit cell with shape (h, w).
+        dx (float): Shift to the right in pixels.
+        dy (float): Shift downwards in pixels.
+        method (str): "fourier" for an exact band-limited shift by a phase ramp, or
+                      "linear" / "cubic" for interpolation with wrap-around borders.
+        spectrum (numpy.ndarray, optional): Precomputed `cell_spectrum(cell)`.
+
+    Returns:
+        numpy.ndarray: The shifted cell, uint8 with the same shape as `cell`.
+    """
+    cell_h, cell_w = cell.shape
+    if method == "fourier":
+        if spectrum is None:
+            spectrum = cell_spectrum(cell)
+        field = np.fft.ifft2(spectrum * _phase_ramp(cell_h, cell_w, dx, dy))
+    elif method in ("linear", "cubic"):
+        interpolation = cv2.INTER_LINEAR if method == "linear" else cv2.INTER_CUBIC
+        translation = np.float32([[1, 0, dx], [0, 1, dy]])
+        field = _PHASE_FIELD[cell]
+        # Real and imaginary parts as the two channels of one image
+        planes = cv2.warpAffine(
+            np.dstack((field.real, field.imag)),
+            translation,
+            (cell_w, cell_h),
+            flags=interpolation,
+            borderMode=cv2.BORDER_WRAP,
+        )
+        field = planes[..., 0] + 1j * planes[..., 1]
+    else:
+        raise ValueError(f"Unknown sub-pixel method: {method}")
+    return wrap_to_gray(np.angle(field) * (GRAY_LEVELS / (2 * np.pi)))
+
+
+class PatternTiler:
+    """
+    Reusable tiler that repeats a mask image over a fixed target frame.
+
+    The mask is decoded once, resized unit cells are kept in a small LRU cache keyed
+    by scale, and every frame is composed into the same preallocated output buffer.
+    The returned frame is therefore overwritten by the next call to `render`; copy it
+    if it has to outlive that call.
+
+    Fractional offsets are supported by translating only the unit cell by the
+    fractional part (see `shift_cell`) and tiling it with the integer part, so a
+    sub-pixel nudge costs tile-sized work. Shifted cells are cached as well.
+
+    Args:
+        image_path (str): Path to the input image.
+        target_width (int): Width of the output frame.
+        target_height (int): Height of the output frame.
+        cache_size (int): Number of unit cells (resized or shifted) kept in the cache.
+        subpixel_method (str): How fractional offsets are resampled, see `shift_cell`.
+        mask (numpy.ndarray, optional): Already decoded 2-D uint8 mask to use instead of
+                                        reading `image_path`, e.g. from a pattern pack.
+        buffer (numpy.ndarray, optional): (target_height, target_width) uint8 output
+                                          buffer, e.g. one shared by the tilers of the
+                                          masks a screen switches between.
+    """
+
+    def __init__(
+        self,
+        image_path,
+        target_width,
+        target_height,
+        cache_size=8,
+        subpixel_method="fourier",
+        mask=None,
+        buffer=None,
+    ):
+        self.image_path = image_path
+        self.mask = load_mask(image_path) if mask is None else mask
+        self.target_width = target_width
+        self.target_height = target_height
+        self.cache_size = cache_size
+        self.subpixel_method = subpixel_method
+        self._cells = OrderedDict()
+        if buffer is None:
+            buffer = np.empty((target_height, target_width), dtype=np.uint8)
+        elif buffer.shape != (target_height, target_width) or buffer.dtype != np.uint8:
+            raise ValueError(f"Expected a {target_width}x{target_height} uint8 buffer")
+        self.buffer = buffer
+
+    def _cached(self, key, compute):
+        value = self._cells.get(key)
+        if value is not None:
+            self._cells.move_to_end(key)
+            return value
+        value = compute()
+        self._cells[key] = value
+        if len(self._cells) > self.cache_size:
+            self._cells.popitem(last=False)
+        return value
+
+    def _resize(self, scale):
+        original_height, original_width = self.mask.shape
+        height = max(1, int(original_height * scale))
+        width = max(1, int(original_width * scale))
+        if (height, width) == self.mask.shape:
+            return self.mask
+        return cv2.resize(self.mask, (width, height), interpolation=cv2.INTER_CUBIC)
+
+    def unit_cell(self, scale=1, dx=0.0, dy=0.0, flip_horizontal=False, flip_vertical=False):
+        """
+        Returns the mask resized by `scale`, mirrored, and shifted by the fractional
+        (dx, dy), computing it only on a cache miss.
+        """
+        cell = self._cached(scale, lambda: self._resize(scale))
+        flips = (flip_horizontal, flip_vertical)
+        if any(flips):
+            code = {(True, False): 1, (False, True): 0, (True, True): -1}[flips]
+            cell = self._cached((scale, flips), lambda: cv2.flip(cell, code))
+        if dx == 0 and dy == 0:
+            return cell
+
+        method = self.subpixel_method
+        spectrum = None
+        if method == "fourier":
+            spectrum = self._cached((scale, flips, "spectrum"), lambda: cell_spectrum(cell))
+        return self._cached(
+            (scale, flips, dx, dy, method),
+            lambda: shift_cell(cell, dx, dy, method, spectrum),
+        )
+
+    def render(self, x_offset=0, y_offset=0, scale=1, flip_horizontal=False, flip_vertical=False):
+        """
+        Composes the tiled frame for the given offset and scale.
+
+        Args:
+            x_offset (float): Screen column on which the centre of a unit cell is placed.
+            y_offset (float): Screen row on which the centre of a unit cell is placed.
+            scale (float): Resize factor applied to the mask before tiling.
+            flip_horizontal (bool): Mirror the pattern left and right about `x_offset`.
+            flip_vertical (bool): Mirror the pattern top and bottom about `y_offset`.
+
+        Returns:
+            numpy.ndarray: The shared output buffer with shape (target_height, target_width).
+        """
+        # Integer parts are applied by tiling, fractional parts by shifting the cell
+        x_whole, y_whole = math.floor(x_offset), math.floor(y_offset)
+        dx = round(x_offset - x_whole, 6)
+        dy = round(y_offset - y_whole, 6)
+        cell = self.unit_cell(scale, dx, dy, flip_horizontal, flip_vertical)
+        cell_h, cell_w = cell.shape
+        # A mirrored cell has its centre pixel at h - 1 - h // 2, which differs from
+        # h // 2 for even sizes; placing that pixel keeps the mirror axis on the offset
+        center_row = cell_h - 1 - cell_h // 2 if flip_vertical else cell_h // 2
+        center_col = cell_w - 1 - cell_w // 2 if flip_horizontal else cell_w // 2
+        return tile_into(
+            cell,
+            self.buffer,
+            row_start=center_row - y_whole,
+            col_start=center_col - x_whole,
+        )
+
 
 def repeat_image(
     image_path,
@@ -16,6 +260,9 @@ def repeat_image(
     """
     Repeats a grayscale image to fit a target size in both x and y directions, with an optional offset.
 
+    This is a one-shot helper; code that renders repeatedly should keep a `PatternTiler`
+    around instead so the image is not decoded and resized on every call.
+
     Args:
         image_path (str): Path to the input image.
         target_width (int): Target width of the output image.
@@ -23,63 +270,20 @@ def repeat_image(
         output_path (str, optional): Path to save the resulting image. If None, the image will be displayed.
         x_offset (int): Horizontal offset to shift the center of the image after repeating.
         y_offset (int): Vertical offset to shift the center of the image after repeating.
+        scale (float): Resize factor applied to the image before repeating.
 
     Returns:
-        None
+        numpy.ndarray or None: The repeated 2-D uint8 image when `output_path` is None.
     """
-    # Load the image
-    image = Image.open(image_path)  # Convert to grayscale
-
-    # Convert image to a NumPy array
-    image_array = np.array(image)
-    original_height, original_width = image_array.shape
-    original_height, original_width = int(original_height*scale), int(original_width*scale)
-    image_array = cv2.resize(
-                image_array,
-                (original_height, original_width),
-                interpolation=cv2.INTER_CUBIC,
-            )
-
-    # Calculate the number of repeats needed
-    repeat_x = -(-target_width // original_width)  # Ceiling division
-    repeat_y = -(-target_height // original_height)  # Ceiling division
-    if repeat_x % 2 == 0:
-        repeat_x += 1
-    if repeat_y % 2 == 0:
-        repeat_y += 1
-
-    # Repeat the image using NumPy's tile function
-    repeated_array = np.tile(image_array, (repeat_y, repeat_x))
-
-    # Apply offsets by rolling the repeated array
-    repeated_array = np.roll(
-        repeated_array, shift=y_offset - target_height // 2, axis=0
-    )  # Vertical shift
-    repeated_array = np.roll(
-        repeated_array, shift=x_offset - target_width // 2, axis=1
-    )  # Horizontal shift
-    # Crop to the target size
-    cropped_array = repeated_array[
-        repeated_array.shape[0] // 2
-        - target_height // 2 : repeated_array.shape[0] // 2
-        + target_height // 2
-        + 1,
-        repeated_array.shape[1] // 2
-        - target_width // 2 : repeated_array.shape[1] // 2
-        + target_width // 2
-        + 1,
-    ]
-
-    # Convert the cropped array back to an image
-    repeated_image = Image.fromarray(cropped_array)
+    tiler = PatternTiler(image_path, target_width, target_height, cache_size=1)
+    cropped_array = tiler.render(x_offset=x_offset, y_offset=y_offset, scale=scale)
 
     # Save or display the resulting image
     if output_path:
+        repeated_image = Image.fromarray(cropped_array)
         repeated_image.save(output_path)
         print(f"Repeated image saved to {output_path}")
     else:
-        cropped_array = np.stack((cropped_array,) * 3, axis=-1)
-
         return cropped_array
 
 
@@ -1,131 +1,256 @@
-import cv2
+from dataclasses import dataclass, replace
+
 import numpy as np
-import screeninfo
-from repeat_pattern import repeat_image
+
+from display_control import key_bindings, run_keyboard_loop, with_stages
+from display_sinks import OpenCVWindowSink, get_monitors
+from pattern_pack import PACK_EXTENSION, PackedMaskTiler, PatternPack
+from phase_lut import load_lut
+from repeat_pattern import PatternTiler
+
+# Scale factors the mask can be cycled through with '=' and '-'
+DELTAS = [0.7, 1, 1.4]
+
+# Fractional move for 'I', 'J', 'K', 'L'; only the unit cell is resampled
+SUBPIXEL_STEP = 0.25
+
+
+@dataclass(frozen=True)
+class TiledMaskState:
+    x_offset: float  # Fractional offsets are rendered by sub-pixel resampling
+    y_offset: float
+    delta_index: int = 2
+    flip_horizontal: bool = False
+    flip_vertical: bool = False
+    status: str = "image"  # "image" shows the mask, "blank" a gray background
+    mask_index: int = 0  # Selected mask when displaying a pattern pack
+
+    def __post_init__(self):
+        if not 0 <= self.delta_index < len(DELTAS):
+            raise ValueError(f"delta_index must be in 0-{len(DELTAS) - 1}, got {self.delta_index}")
+        if self.status not in ("image", "blank"):
+            raise ValueError(f"status must be 'image' or 'blank', got {self.status!r}")
+        if self.mask_index < 0:
+            raise ValueError(f"mask_index must be >= 0, got {self.mask_index}")
 
 
-def display_image_with_keyboard_control(screen_id, image_path, circular_wrapping=False):
+def render_tiled_mask(state, tiler):
+    """
+    Renders the tiled mask, or a gray background when the state is blank.
+
+    Parameters:
+    - state (TiledMaskState): Offsets, scale index, flips and display status.
+    - tiler (PatternTiler): Tiler holding the decoded mask and the output buffer.
+    """
+    # Set display as mask or blank
+    if state.status == "image":
+        # Flips mirror the unit cell about the offset, so the alignment is kept
+        return tiler.render(
+            x_offset=state.x_offset,
+            y_offset=state.y_offset,
+            scale=DELTAS[state.delta_index],
+            flip_horizontal=state.flip_horizontal,
+            flip_vertical=state.flip_vertical,
+        )
+    return np.full(
+        (tiler.target_height, tiler.target_width), 180, dtype=np.uint8
+    )  # Gray background
+
+
+def _check_mask_index(state, mask_count):
+    # Remote updates may name any index; the keys wrap around the pack
+    if state.mask_index >= mask_count:
+        raise ValueError(f"mask_index must be below {mask_count}, got {state.mask_index}")
+
+
+def tiled_mask_key_bindings(width, height, mask_count=1):
+    """
+    Builds the keyboard bindings that move, resize, flip and switch the tiled mask.
+
+    Parameters:
+    - width (int): Screen width; horizontal offsets wrap around it.
+    - height (int): Screen height; vertical offsets wrap around it.
+    - mask_count (int): Number of masks '[' and ']' cycle through.
+    """
+
+    def move(dx, dy):
+        # Keep offsets within screen bounds (circular wrapping)
+        return lambda state: replace(
+            state,
+            x_offset=(state.x_offset + dx) % width,
+            y_offset=(state.y_offset + dy) % height,
+        )
+
+    def change_delta(step):
+        def action(state):
+            return replace(state, delta_index=(state.delta_index + step) % len(DELTAS))
+
+        return action
+
+    def toggle_flip_horizontal(state):
+        return replace(state, flip_horizontal=not state.flip_horizontal)
+
+    def toggle_flip_vertical(state):
+        return replace(state, flip_vertical=not state.flip_vertical)
+
+    def change_mask(step):
+        def action(state):
+            return replace(state, mask_index=(state.mask_index + step) % mask_count)
+
+        return action
+
+    def toggle_status(state):
+        return replace(state, status="blank" if state.status == "image" else "image")
+
+    # * Logic Control
+    return key_bindings(
+        {
+            "w": move(0, -10),  # Move up
+            "s": move(0, 10),  # Move down
+            "a": move(-10, 0),  # Move left
+            "d": move(10, 0),  # Move right
+            "i": move(0, -1),  # Smaller move up
+            "k": move(0, 1),  # Smaller move down
+            "j": move(-1, 0),  # Smaller move left
+            "l": move(1, 0),  # Smaller move right
+            "I": move(0, -SUBPIXEL_STEP),  # Sub-pixel move up
+            "K": move(0, SUBPIXEL_STEP),  # Sub-pixel move down
+            "J": move(-SUBPIXEL_STEP, 0),  # Sub-pixel move left
+            "L": move(SUBPIXEL_STEP, 0),  # Sub-pixel move right
+            "=": change_delta(1),  # Increase size
+            "-": change_delta(-1),  # Decrease size
+            "f": toggle_flip_horizontal,
+            "g": toggle_flip_vertical,
+            " ": toggle_status,  # Toggle between image and blank
+            "]": change_mask(1),  # Next mask of a pattern pack
+            "[": change_mask(-1),  # Previous mask of a pattern pack
+        }
+    )
+
+
+def load_tilers(image_path, width, height):
+    """
+    Loads the mask (or every mask of a pattern pack) for tiling over a screen.
+
+    Parameters:
+    - image_path (str): Mask image, or pattern pack (see pattern_pack.py).
+    - width (int): Screen width.
+    - height (int): Screen height.
+
+    Returns:
+    - tuple: (mask names, one tiler per mask). The tilers share one output buffer, so
+      a frame is overwritten by the next render of any of them.
+    """
+    # Decode the mask once; resized unit cells are cached per scale. Pack masks are
+    # mapped from disk, so switching between them decodes nothing
+    if image_path.endswith(PACK_EXTENSION):
+        pack = PatternPack(image_path)
+        buffer = np.empty((height, width), dtype=np.uint8)
+        tilers = [PackedMaskTiler(pack, name, width, height, buffer=buffer) for name in pack.names]
+        return pack.names, tilers
+    return [image_path], [PatternTiler(image_path, width, height)]
+
+
+def display_image_with_keyboard_control(
+    screen_id,
+    image_path,
+    circular_wrapping=False,
+    sink=None,
+    lut_path=None,
+    render_thread=False,
+    timing_csv=None,
+    mask_name=None,
+    state=None,
+    control=None,
+    preview=False,
+    journal_path=None,
+):
     """
     Displays an image on the specified screen with keyboard controls to move, resize, and flip the image.
     Optionally enables circular wrapping when shifting the image.
 
     Parameters:
     - screen_id (int): The index of the monitor to display the image on.
-    - image_path (str): Path to the image file.
+    - image_path (str): Path to the image file, or to a pattern pack (see pattern_pack.py) whose
+      masks are then switched with '[' and ']'.
     - circular_wrapping (bool): If True, enables circular wrapping of the image around screen edges.
+    - sink (optional): Output sink to present frames to. Defaults to a full-screen OpenCV window.
+    - lut_path (str, optional): SLM calibration file; its lookup table is applied to every frame.
+    - render_thread (bool): If True, renders on a background thread so key handling never waits on it.
+    - timing_csv (str, optional): Path to write per-frame render/present/input-wait timings to on exit.
+    - mask_name (str, optional): Mask of the pattern pack shown first; defaults to the first one.
+    - state (TiledMaskState, optional): Initial offsets, scale and flips.
+    - control (ControlServer, optional): Started server accepting remote state updates; its
+      "select" command picks a pack mask by name.
+    - preview (bool): If True, shows the simulated far field of the mask in a second window.
+    - journal_path (str, optional): Records every shown state for replay, see session_journal.py.
     """
     # Get the size and position of the screen
-    screen = screeninfo.get_monitors()[screen_id]
+    screen = get_monitors()[screen_id]
     width, height = screen.width, screen.height
 
-    # Load the image
-    # original_image = cv2.imread(image_path, cv2.IMREAD_COLOR)
-    x_offset, y_offset = 819, 439  # Dynamically calculate based on screen size
-
-    # Get original image dimensions
-    original_image = repeat_image(
-        image_path, width, height, x_offset=x_offset, y_offset=y_offset
-    )
-    if original_image is None:
+    try:
+        names, tilers = load_tilers(image_path, width, height)
+    except OSError:
         print(f"Error: Unable to load image from {image_path}")
         return
-    original_h, original_w = original_image.shape[:2]
-    # Initial center position (dynamically set to screen center)
-
-    # Initial deltas[delta_index]
-    deltas = [0.7, 1, 1.4]
-    delta_index = 2
-
-    # Flip state flags
-    flip_horizontal = False
-    flip_vertical = False
-
-    window_name = "projector"
-    cv2.namedWindow(window_name, cv2.WINDOW_NORMAL)
-    cv2.moveWindow(window_name, screen.x, screen.y)
-    cv2.setWindowProperty(window_name, cv2.WND_PROP_FULLSCREEN, cv2.WINDOW_FULLSCREEN)
-    status = "image"  # Start with a blank canvas
-
-    while True:
-
-        # Set display as mask or blank
-        if status == "image":
-            canvas = repeat_image(
-                image_path,
-                width,
-                height,
-                x_offset=x_offset,
-                y_offset=y_offset,
-                scale=deltas[delta_index],
-            )
-        else:
-            canvas = (
-                np.ones((height, width, 3), dtype=np.uint8) * 180
-            )  # Gray background
-
-        # Optional: Print the current position, size, and flip status for debugging
-        print(
-            f"Offset (x_offset, y_offset): ({x_offset}, {y_offset}), "
-            f"Delta Size: {deltas[delta_index]}, "
-            f"Flip Horizontal: {flip_horizontal}, Flip Vertical: {flip_vertical}, "
-        )
+    if mask_name is not None and mask_name not in names:
+        print(f"Error: No mask named {mask_name} in {image_path}")
+        return
+
+    # Gray-level correction is applied on the output frame, not baked into the mask
+    lut = load_lut(lut_path) if lut_path else None
+
+    if state is None:
+        state = TiledMaskState(x_offset=819, y_offset=439)  # Dynamically calculate based on screen size
+    if mask_name:
+        state = replace(state, mask_index=names.index(mask_name))
+
+    if sink is None:
+        sink = OpenCVWindowSink(screen, "projector")
 
-        # Display the canvas in the window
-        cv2.imshow(window_name, canvas)
-
-        # Wait for a key press for 10 ms
-        key = cv2.waitKey(10) & 0xFF  # Mask to get the last 8 bits
-
-        # * Logic Control
-        # Handle keyboard inputs to move the image or adjust its size
-        if key == ord("w"):  # Move up
-            y_offset -= 10
-        elif key == ord("s"):  # Move down
-            y_offset += 10
-        elif key == ord("a"):  # Move left
-            x_offset -= 10
-        elif key == ord("d"):  # Move right
-            x_offset += 10
-        elif key == ord("i"):  # Smaller move up
-            y_offset -= 1
-        elif key == ord("k"):  # Smaller move down
-            y_offset += 1
-        elif key == ord("j"):  # Smaller move left
-            x_offset -= 1
-        elif key == ord("l"):  # Smaller move right
-            x_offset += 1
-
-        elif key == ord("="):  # Increase size
-            # Increase deltas[delta_index]
-            delta_index = delta_index + 1 if delta_index < len(deltas) - 1 else 0
-            print(f"change delta to {deltas[delta_index]}")
-
-        elif key == ord("-"):  # Decrease size
-            # Prevent deltas[delta_index] from making the image too small
-            delta_index = delta_index - 1 if delta_index > 0 else len(deltas) - 1
-            print(f"change delta to {deltas[delta_index]}")
-
-        elif key == ord("f"):  # Toggle horizontal flip
-            flip_horizontal = not flip_horizontal
-            print(f"Horizontal Flip set to: {flip_horizontal}")
-        elif key == ord("g"):  # Toggle vertical flip
-            flip_vertical = not flip_vertical
-            print(f"Vertical Flip set to: {flip_vertical}")
-
-        elif key == ord(" "):  # Toggle between image and blank
-            if status == "image":
-                status = "blank"
-            else:
-                status = "image"
-        elif key == 27:  # Escape key to exit
-            break
-
-        # If circular wrapping is enabled, keep offsets within screen bounds
-        x_offset %= width
-        y_offset %= height
+    if preview:
+        from far_field_preview import FarFieldPreview
+
+        preview = FarFieldPreview((height, width))
+
+    if control is not None:
+        control.select = lambda state, name: replace(state, mask_index=names.index(name))
+        control.validate = lambda state: _check_mask_index(state, len(tilers))
+
+    # Print the current position, size, and flip status whenever they change
+    run_keyboard_loop(
+        sink,
+        state,
+        with_stages(
+            lambda state: render_tiled_mask(state, tilers[state.mask_index]),
+            preview.observe if preview else None,
+            lut and lut.apply,
+        ),
+        tiled_mask_key_bindings(width, height, len(tilers)),
+        status=lambda state: (
+            f"Mask: {names[state.mask_index]}, "
+            f"Offset (x_offset, y_offset): ({state.x_offset}, {state.y_offset}), "
+            f"Delta Size: {DELTAS[state.delta_index]}, "
+            f"Flip Horizontal: {state.flip_horizontal}, Flip Vertical: {state.flip_vertical}, "
+        ),
+        render_thread=render_thread,
+        timing_csv=timing_csv,
+        control=control,
+        journal_path=journal_path,
+        journal_context={
+            "pattern": "tile",
+            "width": width,
+            "height": height,
+            "image_path": image_path,
+            "lut_path": lut_path,
+        },
+    )
 
     # Clean up and close the window
-    cv2.destroyAllWindows()
+    sink.close()
+    if preview:
+        preview.close()
 
 
 if __name__ == "__main__":
@@ -136,6 +261,14 @@ if __name__ == "__main__":
     # image_path = "./optical_interpolation_pattern/zero_insertion/remapped_mask_v3.png" # cifar zero insertion
     # image_path = "./optical_interpolation_pattern/imagenet_nn/remapped_mask.png" # imagenet nn
     image_path = "./optical_interpolation_pattern/imagenet_zero_insertion/remapped_mask.png"  # imagenet zero insertion
+    # Or all of them at once, switched with '[' and ']':
+    #   python pattern_pack.py ./optical_interpolation_pattern masks.slmpack
+    # image_path = "./masks.slmpack"
+
+    # Phase calibration measured with grayscale_slm_pattern, or None to show raw gray levels
+    lut_path = None
 
     # Set circular_wrapping to True to enable wrapping
-    display_image_with_keyboard_control(screen_id, image_path, circular_wrapping=True)
+    display_image_with_keyboard_control(
+        screen_id, image_path, circular_wrapping=True, lut_path=lut_path
+    )
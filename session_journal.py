@@ -0,0 +1,277 @@
+import importlib
+import json
+import struct
+import time
+from dataclasses import fields
+
+import numpy as np
+
+# *  Session journals: every presented state of a keyboard loop, for exact replay
+#
+# File layout: magic, little-endian uint32 header length, JSON header, then records.
+# Each record starts with a tag byte:
+#   b"S": int64 nanoseconds since the session start, then the state's fields packed
+#         with the header's struct format (str fields as uint16 string ids)
+#   b"T": uint16 string id, uint16 byte length, UTF-8 bytes; defines a string id
+#         before the first state record using it
+
+MAGIC = b"SLMJRNL1"
+_PREAMBLE = struct.Struct("<8sI")
+_STRING = struct.Struct("<HH")
+JOURNAL_EXTENSION = ".slmjournal"
+
+# struct codes of the supported state field types
+_FIELD_CODES = {int: "q", float: "d", bool: "?", str: "H"}
+
+
+def _state_layout(state_type):
+    # [(name, struct code)] for a dataclass state type
+    layout = []
+    for field in fields(state_type):
+        code = _FIELD_CODES.get(field.type)
+        if code is None:
+            raise TypeError(f"Cannot journal field {field.name} of type {field.type}")
+        layout.append((field.name, code))
+    return layout
+
+
+class JournalWriter:
+    """
+    Appends presented states to a session journal.
+
+    Records are fixed-size packed structs (a `CircleState` takes 33 bytes), written
+    through the file's buffer, so recording costs a few microseconds per frame.
+    Timestamps are time.perf_counter_ns() relative to the start of the session.
+
+    Args:
+        path (str): Journal file to create.
+        state_type (type): Dataclass of the recorded states; its fields must be int,
+                           float, bool or str.
+        context (dict, optional): JSON-serializable description of how states were
+                                  rendered, see `session_render`.
+    """
+
+    def __init__(self, path, state_type, context=None):
+        self.path = path
+        layout = _state_layout(state_type)
+        self.names = [name for name, _ in layout]
+        self.strings = [i for i, (_, code) in enumerate(layout) if code == "H"]
+        self.record_struct = struct.Struct("<cq" + "".join(code for _, code in layout))
+        self.string_ids = {}
+        self.start_ns = time.perf_counter_ns()
+        header = json.dumps(
+            {
+                "version": 1,
+                "state": f"{state_type.__module__}:{state_type.__qualname__}",
+                "fields": layout,
+                "context": context or {},
+                "started": time.time(),
+            }
+        ).encode()
+        self.file = open(path, "wb")
+        self.file.write(_PREAMBLE.pack(MAGIC, len(header)))
+        self.file.write(header)
+        self.count = 0
+
+    def _string_id(self, value):
+        string_id = self.string_ids.get(value)
+        if string_id is None:
+            string_id = self.string_ids[value] = len(self.string_ids)
+            encoded = value.encode()
+            self.file.write(b"T" + _STRING.pack(string_id, len(encoded)) + encoded)
+        return string_id
+
+    def record(self, state, timestamp_ns=None):
+        """
+        Appends `state`, stamped with the current time unless `timestamp_ns` is given.
+        """
+        if timestamp_ns is None:
+            timestamp_ns = time.perf_counter_ns()
+        values = [getattr(state, name) for name in self.names]
+        for i in self.strings:
+            values[i] = self._string_id(values[i])
+        self.file.write(self.record_struct.pack(b"S", timestamp_ns - self.start_ns, *values))
+        self.count += 1
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class SessionJournal:
+    """
+    A session journal read back into memory.
+
+    A journal cut short by a crash is read up to its last complete record.
+
+    Args:
+        path (str): Journal written by `JournalWriter`.
+
+    Attributes:
+        state_type (type): The recorded dataclass, imported from its module.
+        context (dict): Rendering context stored by the writer.
+        times (numpy.ndarray): Seconds since the session start of each state.
+        states (list): The recorded states, in order.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            data = f.read()
+        magic, header_length = _PREAMBLE.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a session journal")
+        position = _PREAMBLE.size
+        self.header = json.loads(data[position : position + header_length])
+        position += header_length
+
+        module, name = self.header["state"].split(":")
+        self.state_type = getattr(importlib.import_module(module), name)
+        self.context = self.header["context"]
+        layout = self.header["fields"]
+        names = [name for name, _ in layout]
+        strings = [i for i, (_, code) in enumerate(layout) if code == "H"]
+        record = struct.Struct("<q" + "".join(code for _, code in layout))
+
+        table = {}
+        times, self.states = [], []
+        while position < len(data):
+            tag = data[position : position + 1]
+            position += 1
+            if tag == b"S":
+                if position + record.size > len(data):
+                    break
+                timestamp_ns, *values = record.unpack_from(data, position)
+                position += record.size
+                for i in strings:
+                    values[i] = table[values[i]]
+                times.append(timestamp_ns)
+                self.states.append(self.state_type(**dict(zip(names, values))))
+            elif tag == b"T":
+                if position + _STRING.size > len(data):
+                    break
+                string_id, length = _STRING.unpack_from(data, position)
+                position += _STRING.size
+                if position + length > len(data):
+                    break
+                table[string_id] = data[position : position + length].decode()
+                position += length
+            else:
+                raise ValueError(f"Corrupt record at byte {position - 1} of {path}")
+        self.times = np.array(times, dtype=np.float64) / 1e9
+
+    def __len__(self):
+        return len(self.states)
+
+
+def _render_circle(context):
+    from circular_slm_pattern import CircleRenderer
+
+    return CircleRenderer(context["width"], context["height"]).render
+
+
+def _render_double_slit(context):
+    from double_slit_slm_pattern import DoubleSlitRenderer
+
+    return DoubleSlitRenderer(context["width"], context["height"]).render
+
+
+def _render_grayscale(context):
+    from grayscale_slm_pattern import GrayscaleRenderer
+
+    return GrayscaleRenderer(context["width"], context["height"]).render
+
+
+def _render_tiled_mask(context):
+    from send_repeated_slm_pattern import load_tilers, render_tiled_mask
+
+    _, tilers = load_tilers(context["image_path"], context["width"], context["height"])
+    return lambda state: render_tiled_mask(state, tilers[state.mask_index])
+
+
+def _render_phase(context):
+    from phase_slm_pattern import PhasePatternGenerator, render_phase
+
+    generator = PhasePatternGenerator(context["width"], context["height"])
+    return lambda state: render_phase(state, generator)
+
+
+# Context "pattern" -> builder of the render function the display loop used
+SESSION_RENDERERS = {
+    "circle": _render_circle,
+    "double_slit": _render_double_slit,
+    "grayscale": _render_grayscale,
+    "tile": _render_tiled_mask,
+    "phase": _render_phase,
+}
+
+
+def session_render(context, lut=True):
+    """
+    Rebuilds the render function of a recorded session from its context.
+
+    The context is written by the display functions: "pattern" (a key of
+    `SESSION_RENDERERS`), "width", "height", "lut_path" and pattern specific entries
+    such as "image_path".
+
+    Args:
+        context (dict): The journal's context.
+        lut (bool): Apply the session's calibration LUT, as the SLM showed it.
+    """
+    from display_control import with_stages
+    from phase_lut import load_lut
+
+    render = SESSION_RENDERERS[context["pattern"]](context)
+    lut_path = context.get("lut_path")
+    return with_stages(render, load_lut(lut_path).apply if lut and lut_path else None)
+
+
+def replay_session(journal, sink, realtime=False, speed=1.0, lut=True):
+    """
+    Re-renders a recorded session into a sink, without a keyboard loop.
+
+    As fast as possible (the default), frames go straight to `sink.present`, e.g. a
+    `FileSink` for offline analysis. In real time, each frame is presented at its
+    recorded time (scaled by `speed`) and the sink is given a millisecond to paint.
+
+    Args:
+        journal (SessionJournal or str): The journal or its path.
+        sink: Output sink.
+        realtime (bool): Keep the recorded timing.
+        speed (float): Playback speed factor in real time.
+        lut (bool): Apply the session's calibration LUT.
+
+    Returns:
+        dict: Frames and elapsed seconds; in real time also the jitter against the
+              recorded schedule, see `frame_sequence.jitter_summary`.
+    """
+    from frame_sequence import jitter_summary, wait_until
+
+    if isinstance(journal, str):
+        journal = SessionJournal(journal)
+    render = session_render(journal.context, lut)
+    offsets = journal.times - journal.times[0] if len(journal) else journal.times
+    scheduled, presented = [], []
+    start = time.perf_counter()
+    for offset, state in zip(offsets, journal.states):
+        frame = render(state)
+        if realtime:
+            target = start + offset / speed
+            wait_until(target)
+            sink.present(frame)
+            sink.wait_key(1)
+            scheduled.append(target)
+            presented.append(time.perf_counter())
+        else:
+            sink.present(frame)
+    elapsed_s = time.perf_counter() - start
+    summary = {"frames": len(journal), "elapsed_s": elapsed_s}
+    if realtime:
+        summary.update(jitter_summary(scheduled, presented))
+    return summary
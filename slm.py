@@ -0,0 +1,364 @@
+import argparse
+import contextlib
+import json
+import os
+import sys
+
+# *  Single command-line entry point for the SLM patterns
+#
+#    python slm.py circle --screen 1 --x-offset 812 --y-offset 512
+#    python slm.py tile ./optical_interpolation_pattern/imagenet_nn/remapped_mask.png
+#    python slm.py scene aperture.json --lut calibration.json
+#    python slm.py --config lab.json double-slit
+#    python slm.py multi amplitude.json phase.json --screens 1 2 --fps 10
+#    python slm.py replay session.slmjournal --output frames.npy
+#
+# Only argparse is loaded up front; the pattern modules, and with them numpy, cv2,
+# PIL and screeninfo, are imported by the subcommand that runs.
+
+
+def _control_server(args):
+    # Context manager yielding a running ControlServer, or None without --control
+    if not args.control:
+        return contextlib.nullcontext()
+    from control_server import ControlServer
+
+    print(f"Accepting commands on {args.control}")
+    return ControlServer(args.control)
+
+
+def _screen_size(screen_id):
+    from display_sinks import get_monitors
+
+    screen = get_monitors()[screen_id]
+    return screen.width, screen.height
+
+
+def run_circle(args):
+    from circular_slm_pattern import CircleState, display_image_with_keyboard_control
+
+    state = CircleState(args.x_offset, args.y_offset, args.radius)
+    with _control_server(args) as control:
+        display_image_with_keyboard_control(
+            args.screen,
+            lut_path=args.lut,
+            timing_csv=args.timing_csv,
+            state=state,
+            control=control,
+            journal_path=args.journal,
+        )
+
+
+def run_double_slit(args):
+    from double_slit_slm_pattern import (
+        DoubleSlitState,
+        display_double_slit_with_keyboard_control,
+    )
+
+    y_offset = args.y_offset
+    if y_offset is None:
+        y_offset = _screen_size(args.screen)[1] // 2
+    state = DoubleSlitState(args.x_offset, y_offset, args.slit_width, args.separation)
+    with _control_server(args) as control:
+        display_double_slit_with_keyboard_control(
+            args.screen,
+            lut_path=args.lut,
+            timing_csv=args.timing_csv,
+            state=state,
+            control=control,
+            preview=args.preview,
+            journal_path=args.journal,
+        )
+
+
+def run_grayscale(args):
+    from grayscale_slm_pattern import GrayscaleState, display_image_with_keyboard_control
+
+    width, height = _screen_size(args.screen)
+    state = GrayscaleState(
+        x_center=width // 2 if args.x_center is None else args.x_center,
+        y_center=height // 2 if args.y_center is None else args.y_center,
+        half_side=args.half_side,
+        gray_value=args.gray_value,
+    )
+    with _control_server(args) as control:
+        display_image_with_keyboard_control(
+            args.screen,
+            timing_csv=args.timing_csv,
+            state=state,
+            control=control,
+            journal_path=args.journal,
+        )
+
+
+def run_tile(args):
+    from send_repeated_slm_pattern import TiledMaskState, display_image_with_keyboard_control
+
+    state = TiledMaskState(args.x_offset, args.y_offset, delta_index=args.delta_index)
+    with _control_server(args) as control:
+        display_image_with_keyboard_control(
+            args.screen,
+            args.image,
+            circular_wrapping=True,
+            lut_path=args.lut,
+            render_thread=args.render_thread,
+            timing_csv=args.timing_csv,
+            mask_name=args.mask_name,
+            state=state,
+            control=control,
+            preview=args.preview,
+            journal_path=args.journal,
+        )
+
+
+def run_scene(args):
+    from compositor import display_scene_with_keyboard_control
+
+    with _control_server(args) as control:
+        display_scene_with_keyboard_control(
+            args.screen,
+            args.scene,
+            lut_path=args.lut,
+            timing_csv=args.timing_csv,
+            selected=args.selected,
+            control=control,
+        )
+
+
+def run_sequence(args):
+    from frame_sequence import load_sequence, play_sequence_on_screen
+
+    play_sequence_on_screen(
+        args.screen,
+        load_sequence(args.sequence),
+        fps=args.fps,
+        repeat=args.repeat,
+        lut_path=args.lut,
+    )
+
+
+def run_multi(args):
+    from frame_sequence import load_sequence
+    from multi_slm import play_sequences_on_screens
+
+    if len(args.sequences) != len(args.screens):
+        raise SystemExit("multi needs one sequence per screen")
+    play_sequences_on_screens(
+        args.screens,
+        [load_sequence(path) for path in args.sequences],
+        fps=args.fps,
+        repeat=args.repeat,
+        lut_paths=args.luts,
+    )
+
+
+def run_replay(args):
+    from session_journal import SessionJournal, replay_session
+
+    journal = SessionJournal(args.journal_file)
+    if args.output:
+        from display_sinks import FileSink
+
+        sink = FileSink(args.output)
+    else:
+        from display_sinks import OpenCVWindowSink, get_monitors
+
+        sink = OpenCVWindowSink(get_monitors()[args.screen], "projector")
+    try:
+        summary = replay_session(
+            journal, sink, realtime=not args.output, speed=args.speed, lut=not args.no_lut
+        )
+    finally:
+        sink.close()
+    print(
+        f"Replayed {summary['frames']} frames of {journal.state_type.__name__} "
+        f"in {summary['elapsed_s']:.2f} s"
+    )
+
+
+def build_parser():
+    """
+    Builds the argument parser.
+
+    Returns:
+        tuple: (parser, subparsers) where `subparsers` maps subcommand names to their parsers.
+    """
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--config", help="JSON file with option defaults, see load_config")
+    common.add_argument(
+        "--monitor-cache",
+        help="JSON file the monitor list is cached in between runs (also SLM_MONITOR_CACHE)",
+    )
+    common.add_argument(
+        "--refresh-monitors", action="store_true", help="Re-enumerate monitors, updating the cache"
+    )
+    single = argparse.ArgumentParser(add_help=False)
+    single.add_argument("--screen", type=int, default=0, help="Monitor index")
+    single.add_argument("--timing-csv", help="Write per-frame timings to this CSV on exit")
+    calibrated = argparse.ArgumentParser(add_help=False)
+    calibrated.add_argument("--lut", help="SLM calibration file applied to every frame")
+    interactive = argparse.ArgumentParser(add_help=False)
+    interactive.add_argument(
+        "--control",
+        metavar="ADDRESS",
+        help="Accept state updates on host:port or unix:/path, see control_server.py",
+    )
+    recorded = argparse.ArgumentParser(add_help=False)
+    recorded.add_argument(
+        "--journal", help="Record every shown state to this file, for slm.py replay"
+    )
+
+    # Options go after the subcommand; only --config is also accepted before it
+    parser = argparse.ArgumentParser(
+        prog="slm", description="Display patterns on a spatial light modulator."
+    )
+    parser.add_argument("--config", help="JSON file with option defaults, see load_config")
+    commands = parser.add_subparsers(dest="command", required=True)
+    subparsers = {}
+
+    def add(name, run, help, parents=(common, single, calibrated, interactive, recorded)):
+        subparser = commands.add_parser(name, help=help, parents=list(parents))
+        subparser.set_defaults(run=run)
+        subparsers[name] = subparser
+        return subparser
+
+    circle = add("circle", run_circle, "Movable bright circle")
+    circle.add_argument("--x-offset", type=int, default=812)
+    circle.add_argument("--y-offset", type=int, default=512)
+    circle.add_argument("--radius", type=int, default=50)
+
+    double_slit = add("double-slit", run_double_slit, "Movable double slit")
+    double_slit.add_argument("--x-offset", type=int, default=852, help="Centre between the slits")
+    double_slit.add_argument("--y-offset", type=int, help="Defaults to the screen centre")
+    double_slit.add_argument("--slit-width", type=int, default=5)
+    double_slit.add_argument("--separation", type=int, default=20)
+    double_slit.add_argument(
+        "--preview", action="store_true", help="Show the simulated far field in a second window"
+    )
+
+    # No --lut: this pattern is used to measure the calibration
+    grayscale = add(
+        "grayscale",
+        run_grayscale,
+        "Calibration square",
+        parents=(common, single, interactive, recorded),
+    )
+    grayscale.add_argument("--x-center", type=int, help="Defaults to the screen centre")
+    grayscale.add_argument("--y-center", type=int, help="Defaults to the screen centre")
+    grayscale.add_argument("--half-side", type=int, default=200)
+    grayscale.add_argument("--gray-value", type=int, default=0)
+
+    tile = add("tile", run_tile, "Tiled mask image or pattern pack")
+    tile.add_argument("image", nargs="?", help="Mask image or .slmpack pattern pack")
+    tile.add_argument("--mask-name", help="Pack mask shown first")
+    tile.add_argument("--x-offset", type=float, default=819)
+    tile.add_argument("--y-offset", type=float, default=439)
+    tile.add_argument("--delta-index", type=int, default=2, help="Index into the scale factors")
+    tile.add_argument(
+        "--render-thread", action="store_true", help="Render on a background thread"
+    )
+    tile.add_argument(
+        "--preview", action="store_true", help="Show the simulated far field in a second window"
+    )
+
+    # No --journal: journal states have flat fields, scenes hold a tuple of layers
+    scene = add(
+        "scene",
+        run_scene,
+        "Layered scene of shapes, masks and uniform fields",
+        parents=(common, single, calibrated, interactive),
+    )
+    scene.add_argument("scene", nargs="?", help="JSON list of layers, bottom first")
+    scene.add_argument("--selected", type=int, default=0, help="Layer selected first")
+
+    sequence = add(
+        "sequence",
+        run_sequence,
+        "Timed sequence of pre-rendered patterns",
+        parents=(common, single, calibrated),
+    )
+    sequence.add_argument("sequence", nargs="?", help="JSON list of pattern entries")
+    sequence.add_argument("--fps", type=float, help="Presentation rate; omit to step with keys")
+    sequence.add_argument("--repeat", type=int, default=1)
+
+    replay = add("replay", run_replay, "Replay a recorded session journal", parents=(common,))
+    replay.add_argument("journal_file", help="Journal written with --journal")
+    replay.add_argument("--screen", type=int, default=0, help="Monitor to replay on in real time")
+    replay.add_argument(
+        "--output", help="Render as fast as possible into this .npy or raw file instead"
+    )
+    replay.add_argument("--speed", type=float, default=1.0, help="Real-time playback speed")
+    replay.add_argument("--no-lut", action="store_true", help="Skip the recorded calibration")
+
+    multi = add(
+        "multi", run_multi, "Sequences on several screens, flipped together", parents=(common,)
+    )
+    multi.add_argument("sequences", nargs="*", help="One JSON sequence per screen")
+    multi.add_argument("--screens", type=int, nargs="+", default=[0, 1], help="Monitor indices")
+    multi.add_argument("--luts", nargs="+", help="Calibration file per screen")
+    multi.add_argument("--fps", type=float, help="Presentation rate; omit to step with keys")
+    multi.add_argument("--repeat", type=int, default=1)
+    return parser, subparsers
+
+
+def load_config(path):
+    """
+    Loads option defaults from a JSON file.
+
+    Top-level keys apply to every subcommand, and an object under a subcommand name
+    applies to that subcommand only. Keys are option names with underscores, e.g.
+    {"screen": 1, "lut": "slm.json", "tile": {"image": "mask.png", "x_offset": 800}}.
+    Options given on the command line take precedence.
+    """
+    with open(path) as f:
+        config = json.load(f)
+    if not isinstance(config, dict):
+        raise ValueError(f"{path} must contain a JSON object")
+    return config
+
+
+def parse_args(argv=None):
+    # --config has to be read first, since it supplies the defaults of the real parse
+    pre = argparse.ArgumentParser(add_help=False)
+    pre.add_argument("--config")
+    config_path = pre.parse_known_args(argv)[0].config
+
+    parser, subparsers = build_parser()
+    if config_path:
+        config = load_config(config_path)
+        shared = {k: v for k, v in config.items() if not isinstance(v, dict)}
+        options = {name: {a.dest for a in sub._actions} for name, sub in subparsers.items()}
+        unknown = set(shared) - set().union(*options.values())
+        for name in config.keys() - shared.keys():
+            if name not in subparsers:
+                parser.error(f"unknown subcommand {name} in {config_path}")
+            unknown |= {f"{name}.{key}" for key in config[name].keys() - options[name]}
+        if unknown:
+            parser.error(f"unknown options in {config_path}: {', '.join(sorted(unknown))}")
+
+        # Shared keys only reach the subcommands that have the option (e.g. no lut for
+        # grayscale); a subcommand's own section overrides them
+        for name, subparser in subparsers.items():
+            defaults = {k: v for k, v in shared.items() if k in options[name]}
+            subparser.set_defaults(**{**defaults, **config.get(name, {})})
+
+    args = parser.parse_args(argv)
+    for required in ("image", "scene", "sequence"):
+        if getattr(args, required, "") is None:
+            parser.error(f"{args.command} needs {required} (argument or config file)")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    from display_sinks import MONITOR_CACHE_ENV, get_monitors
+
+    if args.monitor_cache:
+        os.environ[MONITOR_CACHE_ENV] = args.monitor_cache
+    if args.refresh_monitors:
+        get_monitors(refresh=True)
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
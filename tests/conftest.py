@@ -0,0 +1,10 @@
+import os
+import sys
+
+# The SDK is a set of top-level modules; tests import them from the repository root
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+# Tests never touch physical monitors
+os.environ.setdefault("SLM_FAKE_MONITORS", "320x240,640x360")
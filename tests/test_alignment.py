@@ -0,0 +1,71 @@
+from dataclasses import replace
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from alignment import (
+    GRAY_LEVELS,
+    SimulatedCamera,
+    align,
+    gaussian_beam,
+    region_score,
+    tiled_mask_search,
+)
+from repeat_pattern import PatternTiler
+from send_repeated_slm_pattern import DELTAS, TiledMaskState, render_tiled_mask
+
+WIDTH, HEIGHT = 96, 64
+
+
+@pytest.fixture
+def tiler(tmp_path):
+    # A smooth mask without mirror symmetry, so each flip gives a different frame
+    y, x = np.mgrid[:12, :16]
+    phase = 2 + np.cos(2 * np.pi * x / 16) + 0.5 * np.sin(2 * np.pi * y / 12)
+    phase += 0.7 * np.sin(2 * np.pi * (y / 12 + x / 16))
+    path = str(tmp_path / "mask.png")
+    Image.fromarray((phase / phase.max() * 255).astype(np.uint8)).save(path)
+    return PatternTiler(path, WIDTH, HEIGHT)
+
+
+def search(tiler, hidden, choices=None):
+    def render(state):
+        return render_tiled_mask(state, tiler)
+
+    beam = gaussian_beam(WIDTH, HEIGHT, WIDTH / 2, HEIGHT / 2, 20)
+    camera = SimulatedCamera(beam * np.exp(-2j * np.pi * render(hidden) / GRAY_LEVELS))
+    rows, cols = camera.shape
+    score = region_score(rows // 2 - 1, rows // 2 + 2, cols // 2 - 1, cols // 2 + 2)
+    ranges, default_choices = tiled_mask_search(tiler, DELTAS, step=2)
+    start = TiledMaskState(WIDTH // 2, HEIGHT // 2)
+    return align(
+        start, render, camera.capture, score, ranges, choices or default_choices, verbose=False
+    )
+
+
+def test_finds_hidden_scale_offset_and_flip(tiler):
+    hidden = TiledMaskState(50, 30, delta_index=1, flip_horizontal=True)
+    best, report = search(tiler, hidden)
+    assert best == hidden
+    assert report["score"] > 0.9
+
+
+def test_screened_flips_cost_fewer_captures(tiler):
+    hidden = TiledMaskState(50, 30, delta_index=1, flip_vertical=True)
+    _, choices = tiled_mask_search(tiler, DELTAS)
+    unscreened = [replace(choice, screened=False) for choice in choices]
+    best, screened_report = search(tiler, hidden)
+    full_best, full_report = search(tiler, hidden, unscreened)
+    assert best == full_best == hidden
+    assert screened_report["captured"] < full_report["captured"]
+
+
+def test_offset_is_found_up_to_one_period(tiler):
+    # One period (16 px at scale 1) right of the start, the search may settle on either
+    hidden = TiledMaskState(WIDTH // 2 + 16 + 3, 30, delta_index=1)
+    best, _ = search(tiler, hidden)
+    assert best.x_offset % 16 == hidden.x_offset % 16
+    np.testing.assert_array_equal(
+        render_tiled_mask(best, tiler).copy(), render_tiled_mask(hidden, tiler)
+    )
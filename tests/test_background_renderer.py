@@ -0,0 +1,68 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from display_control import BackgroundRenderer
+from display_sinks import MemorySink
+
+
+def present_next(renderer, sink, timeout_s=5.0):
+    deadline = time.perf_counter() + timeout_s
+    while time.perf_counter() < deadline:
+        presented = renderer.present_ready(sink)
+        if presented is not None:
+            return presented
+        time.sleep(0.001)
+    raise AssertionError("no frame became ready")
+
+
+def test_states_submitted_while_busy_supersede_each_other():
+    release = threading.Event()
+    rendered = []
+
+    def render(state):
+        rendered.append(state)
+        if state == 0:
+            release.wait(5)
+        return np.full((4, 4), state, dtype=np.uint8)
+
+    renderer = BackgroundRenderer(render).start()
+    sink = MemorySink()
+    try:
+        renderer.submit(0)
+        while not rendered:
+            time.sleep(0.001)
+        for state in (1, 2, 3):  # Queued behind the slow frame; only 3 is kept
+            renderer.submit(state)
+        release.set()
+        # The slow frame may itself be superseded if 3 completes before it is shown
+        shown = [present_next(renderer, sink)[0]]
+        if shown[0] != 3:
+            shown.append(present_next(renderer, sink)[0])
+        assert shown in ([0, 3], [3])
+        assert not renderer.busy
+    finally:
+        renderer.stop()
+    assert rendered == [0, 3]
+    assert sink.last_frame[0, 0] == 3
+
+
+def test_render_errors_are_reported_and_rendering_continues():
+    def render(state):
+        if state < 0:
+            raise ValueError("negative")
+        return np.full((2, 2), state, dtype=np.uint8)
+
+    renderer = BackgroundRenderer(render).start()
+    sink = MemorySink()
+    try:
+        renderer.submit(-1)
+        with pytest.raises(RuntimeError) as raised:
+            present_next(renderer, sink)
+        assert isinstance(raised.value.__cause__, ValueError)
+        renderer.submit(7)
+        assert present_next(renderer, sink)[0] == 7
+    finally:
+        renderer.stop()
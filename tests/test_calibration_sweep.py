@@ -0,0 +1,67 @@
+import tracemalloc
+
+import numpy as np
+
+from calibration_sweep import render_circle_batch, render_square_batch, sweep_grid, write_sweep
+from circular_slm_pattern import BACKGROUND, CIRCLE_COLOR
+from grayscale_slm_pattern import GrayscaleRenderer, GrayscaleState
+
+
+def test_circle_batch_matches_distance_map():
+    params = sweep_grid(x_offset=[0, 37, 79], y_offset=[-5, 30], radius=[0, 4, 25, 200])
+    n = len(params["radius"])
+    out = np.empty((n, 60, 80), dtype=np.uint8)
+    render_circle_batch(params, out)
+
+    rows, cols = np.mgrid[:60, :80]
+    for i in range(n):
+        distance2 = (rows - params["y_offset"][i]) ** 2 + (cols - params["x_offset"][i]) ** 2
+        expected = np.where(distance2 <= params["radius"][i] ** 2, CIRCLE_COLOR, BACKGROUND)
+        np.testing.assert_array_equal(out[i], expected)
+
+
+def test_square_batch_matches_the_renderer():
+    params = sweep_grid(
+        x_center=[3, 200], y_center=[150], half_side=[0, 40, 500], gray_value=[0, 77]
+    )
+    n = len(params["half_side"])
+    out = np.empty((n, 200, 400), dtype=np.uint8)
+    render_square_batch(params, out)
+    for i in range(n):
+        state = GrayscaleState(
+            int(params["x_center"][i]),
+            int(params["y_center"][i]),
+            int(params["half_side"][i]),
+            int(params["gray_value"][i]),
+        )
+        renderer = GrayscaleRenderer(400, 200)
+        expected = renderer.render(state)
+        below_label = renderer.text_rect[3]
+        np.testing.assert_array_equal(out[i, below_label:], expected[below_label:])
+
+
+def test_square_batch_draws_on_a_given_background():
+    out = np.empty((1, 20, 30), dtype=np.uint8)
+    params = {"x_center": [10], "y_center": [8], "half_side": [2], "gray_value": [200]}
+    render_square_batch({**params, "background": [9]}, out)
+    assert out[0, 8, 10] == 200 and out[0, 8, 13] == 9 and out[0, 6, 12] == 200
+
+
+def test_circle_batch_temporaries_stay_small_at_4k():
+    params = sweep_grid(x_offset=[1920], y_offset=[1080], radius=[1000] * 8)
+    out = np.empty((8, 2160, 3840), dtype=np.uint8)
+    tracemalloc.start()
+    render_circle_batch(params, out)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    # One frame's worth of int32 distances at most, not an int64 map of the chunk
+    assert peak < 3840 * 2160 * 4
+
+
+def test_write_sweep_streams_chunks(tmp_path):
+    params = sweep_grid(gray_value=np.arange(0, 256, 64), half_side=[2, 5], background=[0])
+    path = str(tmp_path / "sweep.npy")
+    stack = write_sweep(path, "square", params, 32, 24, chunk_bytes=32 * 24 * 3)
+    assert stack.shape == (8, 24, 32)
+    assert stack[7, 12, 16] == 192 and stack[7, 0, 0] == 0
+    assert np.load(tmp_path / "sweep_params.npz")["half_side"].tolist() == [2, 5] * 4
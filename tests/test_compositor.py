@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from circular_slm_pattern import CircleRenderer, CircleState
+from compositor import (
+    CircleLayer,
+    Compositor,
+    Layer,
+    SceneState,
+    SquareLayer,
+    UniformLayer,
+    layer_from_spec,
+)
+
+WIDTH, HEIGHT = 160, 120
+
+
+def test_layer_is_abstract():
+    with pytest.raises(TypeError):
+        Layer()
+
+
+def test_circle_over_gray_matches_circle_pattern():
+    compositor = Compositor(WIDTH, HEIGHT)
+    frame = compositor.render([UniformLayer(180), CircleLayer(70, 50, 20)])
+    expected = CircleRenderer(WIDTH, HEIGHT).render(CircleState(70, 50, 20))
+    np.testing.assert_array_equal(frame, expected)
+
+
+def test_outside_mask_and_phase_addition():
+    compositor = Compositor(WIDTH, HEIGHT)
+    layers = [
+        UniformLayer(200),
+        SquareLayer(80, 60, 10, value=100, blend="add"),
+        CircleLayer(80, 60, 30, value=7, mask="outside"),
+    ]
+    frame = compositor.render(layers)
+    assert frame[60, 80] == (200 + 100) % 256
+    assert frame[60, 100] == 200
+    assert frame[0, 0] == 7
+
+
+def test_moving_one_layer_rasterizes_only_that_layer():
+    compositor = Compositor(WIDTH, HEIGHT)
+    layers = [UniformLayer(180), SquareLayer(40, 40, 5), CircleLayer(100, 60, 15)]
+    compositor.render(layers)
+    assert compositor.rasterized == 3
+    moved = layers[:2] + [layers[2].moved(10, 0)]
+    frame = compositor.render(moved).copy()
+    assert compositor.rasterized == 4
+    np.testing.assert_array_equal(frame, Compositor(WIDTH, HEIGHT).render(moved))
+
+
+def test_layer_from_spec_checks_blend():
+    assert layer_from_spec({"type": "gray", "value": 3}) == UniformLayer(3)
+    with pytest.raises(ValueError):
+        layer_from_spec({"type": "gray", "value": 3, "blend": "xor"})
+
+
+def test_scene_state_checks_the_selection():
+    with pytest.raises(ValueError):
+        SceneState(())
+    with pytest.raises(ValueError):
+        SceneState((UniformLayer(3),), selected=1)
@@ -0,0 +1,215 @@
+import threading
+import time
+
+import pytest
+
+from circular_slm_pattern import CircleRenderer, CircleState, circle_key_bindings
+from control_server import ControlClient, ControlServer, coerce_fields
+from display_control import run_keyboard_loop
+from display_sinks import ESCAPE_KEY
+from send_repeated_slm_pattern import TiledMaskState
+
+WIDTH, HEIGHT = 320, 240
+
+
+class ScriptedSink:
+    # Sink for a loop on a background thread: presses `key` once per batch (if given)
+    # until `stop` is set, then Escape
+
+    def __init__(self, key=None):
+        self.key = key
+        self.stop = threading.Event()
+        self.presented = []
+        self.pressed = False
+
+    def present(self, frame):
+        self.presented.append(frame.copy())
+
+    def wait_key(self, delay_ms):
+        if self.stop.is_set():
+            return ESCAPE_KEY
+        time.sleep(delay_ms / 1e3)
+        # -1 after each press ends the batch, so every press gives its own frame
+        self.pressed = self.key is not None and not self.pressed
+        return ord(self.key) if self.pressed else -1
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def address(tmp_path):
+    return f"unix:{tmp_path / 'control.sock'}"
+
+
+def run_loop(sink, address, render=None, render_thread=False, status=None):
+    # Starts a circle loop with a control server; returns (thread, server, result)
+    server = ControlServer(address).start()
+    result = {}
+
+    def target():
+        try:
+            result["state"] = run_keyboard_loop(
+                sink,
+                CircleState(100, 100),
+                render or CircleRenderer(WIDTH, HEIGHT).render,
+                circle_key_bindings(WIDTH, HEIGHT),
+                render_thread=render_thread,
+                control=server,
+                status=status,
+            )
+        except Exception as error:
+            result["error"] = error
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    return thread, server, result
+
+
+def finish(thread, server, sink):
+    sink.stop.set()
+    thread.join(5)
+    server.stop()
+    assert not thread.is_alive()
+
+
+def test_coerce_fields_checks_types():
+    state = TiledMaskState(0.0, 0.0)
+    assert coerce_fields(state, {"x_offset": 3, "delta_index": 1.0}) == {
+        "x_offset": 3.0,
+        "delta_index": 1,
+    }
+    for bad in ({"delta_index": "big"}, {"delta_index": 1.5}, {"flip_vertical": 1}, {"nope": 1}):
+        with pytest.raises(ValueError):
+            coerce_fields(state, bad)
+
+
+@pytest.mark.parametrize("render_thread", [False, True])
+def test_invalid_set_is_refused_and_the_loop_keeps_running(address, render_thread):
+    sink = ScriptedSink()
+    thread, server, result = run_loop(sink, address, render_thread=render_thread)
+    client = ControlClient(address)
+    try:
+        assert client.set(radius="big")["ok"] is False
+        assert client.set(radius=-4)["ok"] is False
+        assert client.set(colour=3)["ok"] is False
+        reply = client.set(radius=20, x_offset=150)
+        assert reply["ok"] is True
+        assert reply["state"] == {"x_offset": 150, "y_offset": 100, "radius": 20}
+    finally:
+        client.close()
+        finish(thread, server, sink)
+    assert "error" not in result
+    assert result["state"] == CircleState(150, 100, 20)
+
+
+def test_render_failure_of_a_remote_state_is_rejected(address):
+    # A state that validates but cannot be rendered is undone instead of ending the loop
+    renderer = CircleRenderer(WIDTH, HEIGHT)
+
+    def render(state):
+        if state.radius == 77:
+            raise RuntimeError("cannot draw")
+        return renderer.render(state)
+
+    sink = ScriptedSink()
+    thread, server, result = run_loop(sink, address, render)
+    client = ControlClient(address)
+    try:
+        reply = client.set(radius=77)
+        assert reply["ok"] is False and "cannot draw" in reply["error"]
+        assert client.set(radius=30)["ok"] is True
+    finally:
+        client.close()
+        finish(thread, server, sink)
+    assert "error" not in result
+
+
+def test_command_is_acknowledged_when_keys_change_the_state_first(address):
+    # Keys move the circle on every iteration, so the exact state a command produced
+    # is never the one presented; its reply must still arrive
+    sink = ScriptedSink(key="l")
+    thread, server, result = run_loop(sink, address, render_thread=True)
+    client = ControlClient(address, timeout_s=2.0)
+    try:
+        for radius in (10, 20, 30):
+            reply = client.set(radius=radius)
+            assert reply["ok"] is True
+            assert reply["state"]["radius"] == radius
+    finally:
+        client.close()
+        finish(thread, server, sink)
+    assert "error" not in result
+
+
+def test_out_of_range_scene_selection_is_refused(address):
+    from compositor import CircleLayer, UniformLayer, display_scene_with_keyboard_control
+
+    sink = ScriptedSink()
+    server = ControlServer(address).start()
+    result = {}
+
+    def target():
+        try:
+            layers = [UniformLayer(180), CircleLayer(100, 100, 20)]
+            display_scene_with_keyboard_control(0, layers, sink=sink, control=server)
+        except Exception as error:
+            result["error"] = error
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    client = ControlClient(address)
+    try:
+        for selected in (5, -1):
+            reply = client.set(selected=selected)
+            assert reply["ok"] is False and "selected" in reply["error"]
+        assert client.set(selected=1)["ok"] is True
+    finally:
+        client.close()
+        finish(thread, server, sink)
+    assert "error" not in result
+
+
+@pytest.mark.parametrize("render_thread", [False, True])
+def test_failing_status_line_does_not_end_the_loop(address, render_thread, capsys):
+    # Status lines are throttled, so the failing one may be replaced before printing
+    def status(state):
+        if state.radius == 55:
+            raise KeyError("no label")
+        return f"radius {state.radius}"
+
+    sink = ScriptedSink()
+    thread, server, result = run_loop(sink, address, render_thread=render_thread, status=status)
+    client = ControlClient(address)
+    try:
+        assert client.set(radius=55)["ok"] is True  # The frame itself was presented
+        assert client.set(radius=60)["ok"] is True
+    finally:
+        client.close()
+        finish(thread, server, sink)
+    assert "error" not in result
+    assert "radius 60" in capsys.readouterr().out
+
+
+@pytest.mark.parametrize("render_thread", [False, True])
+def test_render_failure_caused_by_keys_is_not_blamed_on_commands(address, render_thread):
+    renderer = CircleRenderer(WIDTH, HEIGHT)
+
+    def render(state):
+        if state.x_offset >= 140:
+            raise RuntimeError("off the edge")
+        return renderer.render(state)
+
+    sink = ScriptedSink(key="d")  # Keeps moving the circle right until it fails
+    thread, server, result = run_loop(sink, address, render, render_thread=render_thread)
+    client = ControlClient(address, timeout_s=0.5)
+    try:
+        while thread.is_alive():
+            client.set(radius=30)
+            thread.join(0.01)
+    except OSError:
+        pass  # The loop ended and took the server down with it
+    finally:
+        client.close()
+        finish(thread, server, sink)
+    assert "off the edge" in str(result["error"].__cause__ or result["error"])
@@ -0,0 +1,56 @@
+from dataclasses import dataclass, replace
+
+import numpy as np
+
+from display_control import key_bindings, run_keyboard_loop, with_stages
+from display_sinks import ESCAPE_KEY, MemorySink
+
+
+@dataclass(frozen=True)
+class Counter:
+    value: int = 0
+
+
+def counting_render(calls):
+    def render(state):
+        calls.append(state)
+        return np.full((2, 3), state.value, dtype=np.uint8)
+
+    return render
+
+
+BINDINGS = key_bindings(
+    {
+        "=+": lambda state: replace(state, value=state.value + 1),
+        "0": lambda state: replace(state, value=0),
+    }
+)
+
+
+def test_key_bindings_expand_strings_and_codes():
+    bindings = key_bindings({"ab": str.upper, ESCAPE_KEY: str.lower})
+    assert set(bindings) == {ord("a"), ord("b"), ESCAPE_KEY}
+
+
+def test_frames_are_rendered_only_on_change():
+    calls = []
+    # "0" at zero and an unbound key leave the state alone; -1 separates the presses
+    keys = [ord("0"), -1, ord("x"), -1, ord("+"), -1, ord("="), -1]
+    sink = MemorySink(keys=keys)
+    last = run_keyboard_loop(sink, Counter(), counting_render(calls), BINDINGS)
+    assert last == Counter(2)
+    assert calls == [Counter(0), Counter(1), Counter(2)]
+    assert sink.presented == 3 and sink.last_frame[0, 0] == 2
+
+
+def test_queued_keys_are_applied_as_one_frame():
+    calls = []
+    keys = [ord("+")] * 5 + [-1]
+    run_keyboard_loop(MemorySink(keys=keys), Counter(), counting_render(calls), BINDINGS)
+    assert calls == [Counter(0), Counter(5)]
+
+
+def test_with_stages_skips_none():
+    render = with_stages(lambda state: state * 2, None, lambda frame: frame + 1)
+    assert render(3) == 7
+    assert with_stages(abs, None) is abs
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+import display_sinks
+from benchmark_patterns import run_benchmarks
+from display_sinks import ESCAPE_KEY, FakeMonitor, FileSink, MemorySink, get_monitors
+
+
+def frames(count, shape=(3, 4)):
+    return [np.full(shape, i, dtype=np.uint8) for i in range(count)]
+
+
+def test_fake_monitors_from_the_environment():
+    # conftest sets SLM_FAKE_MONITORS=320x240,640x360
+    monitors = get_monitors()
+    assert [(m.width, m.height, m.x) for m in monitors] == [(320, 240, 0), (640, 360, 320)]
+
+
+def test_fake_monitors_set_in_code_take_precedence():
+    display_sinks.use_fake_monitors([FakeMonitor(100, 50)])
+    try:
+        assert get_monitors() == [FakeMonitor(100, 50)]
+    finally:
+        display_sinks.use_fake_monitors(None)
+    assert len(get_monitors()) == 2
+
+
+def test_memory_sink_keeps_the_newest_frames_and_scripted_keys():
+    sink = MemorySink(capacity=2, keys=[ord("a"), -1])
+    for frame in frames(5):
+        sink.present(frame)
+    assert sink.presented == 5 and sink.last_frame[0, 0] == 4
+    assert sorted(sink.frames[:, 0, 0]) == [3, 4]
+    assert [sink.wait_key(1) for _ in range(3)] == [ord("a"), -1, ESCAPE_KEY]
+    assert MemorySink().wait_key(0) == -1
+
+
+def test_file_sink_writes_npy_and_raw(tmp_path):
+    for name in ("frames.npy", "frames.raw"):
+        sink = FileSink(str(tmp_path / name))
+        for frame in frames(3):
+            sink.present(frame)
+        with pytest.raises(ValueError):
+            sink.present(np.zeros((4, 3), dtype=np.uint8))
+        sink.close()
+    np.testing.assert_array_equal(np.load(tmp_path / "frames.npy"), np.stack(frames(3)))
+    raw = np.fromfile(tmp_path / "frames.raw", dtype=np.uint8).reshape(3, 3, 4)
+    np.testing.assert_array_equal(raw, np.stack(frames(3)))
+
+
+def test_benchmarks_run_headless(tmp_path):
+    from PIL import Image
+
+    mask_path = str(tmp_path / "mask.png")
+    Image.fromarray(np.arange(48, dtype=np.uint8).reshape(6, 8)).save(mask_path)
+    results = run_benchmarks({"tiny": (64, 48)}, mask_path, frames=3)
+    assert {result["generator"] for result in results} >= {"tiler", "circle", "grayscale"}
+    assert all(result["fps"] > 0 for result in results)
+
+
+def test_benchmarks_write_one_file_per_case(tmp_path):
+    from PIL import Image
+
+    mask_path = str(tmp_path / "mask.png")
+    Image.fromarray(np.arange(48, dtype=np.uint8).reshape(6, 8)).save(mask_path)
+    output = tmp_path / "frames"
+    results = run_benchmarks({"tiny": (64, 48)}, mask_path, frames=3, output=str(output))
+    for result in results:
+        stack = np.load(output / f"{result['generator']}_tiny.npy")
+        assert stack.shape == (3, 48, 64)
+    assert len(list(output.iterdir())) == len(results)
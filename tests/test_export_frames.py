@@ -0,0 +1,90 @@
+import glob
+
+import numpy as np
+import pytest
+
+from circular_slm_pattern import CircleState
+from export_frames import export_format, export_frames
+from frame_sequence import render_pattern
+from session_journal import JournalWriter
+
+WIDTH, HEIGHT = 48, 32
+
+SEQUENCE = [{"type": "gray", "value": 10 * i} for i in range(5)] + [
+    {"type": "circle", "x_offset": 5 * i, "y_offset": 16, "radius": 8} for i in range(6)
+]
+
+
+@pytest.fixture(scope="module")
+def expected():
+    # Fresh renderers per frame: a shared canvas would be overwritten by the next one
+    return np.stack([render_pattern(spec, WIDTH, HEIGHT) for spec in SEQUENCE])
+
+
+def export(output):
+    return export_frames(
+        SEQUENCE, str(output), WIDTH, HEIGHT, workers=2, chunk_frames=3, verbose=False
+    )
+
+
+def test_export_format(tmp_path):
+    assert export_format("frames.npy") == "npy"
+    assert export_format("frames.MKV") == "video"
+    assert export_format("frames.raw") == "raw"
+    assert export_format(str(tmp_path)) == "npy-chunks"
+
+
+def test_npy_export(tmp_path, expected):
+    summary = export(tmp_path / "frames.npy")
+    assert summary["frames"] == len(SEQUENCE)
+    np.testing.assert_array_equal(np.load(tmp_path / "frames.npy"), expected)
+
+
+def test_raw_export(tmp_path, expected):
+    export(tmp_path / "frames.raw")
+    raw = np.fromfile(tmp_path / "frames.raw", dtype=np.uint8)
+    np.testing.assert_array_equal(raw.reshape(expected.shape), expected)
+
+
+def test_chunked_export(tmp_path, expected):
+    export(tmp_path / "chunks")
+    paths = sorted(glob.glob(str(tmp_path / "chunks" / "frames_*.npy")))
+    assert len(paths) == 4  # 11 frames in chunks of 3
+    np.testing.assert_array_equal(np.concatenate([np.load(p) for p in paths]), expected)
+
+
+def test_journal_export_uses_the_recorded_size(tmp_path):
+    path = str(tmp_path / "circle.slmjournal")
+    states = [CircleState(10 + 3 * i, 12, 6) for i in range(4)]
+    context = {"pattern": "circle", "width": WIDTH, "height": HEIGHT}
+    with JournalWriter(path, CircleState, context) as writer:
+        for state in states:
+            writer.record(state)
+    export_frames(path, str(tmp_path / "session.npy"), workers=1, verbose=False)
+    frames = np.load(tmp_path / "session.npy")
+    expected = [
+        render_pattern({"type": "circle", **vars(state)}, WIDTH, HEIGHT) for state in states
+    ]
+    np.testing.assert_array_equal(frames, np.stack(expected))
+
+
+def test_sequence_export_needs_a_size(tmp_path):
+    with pytest.raises(ValueError):
+        export_frames(SEQUENCE, str(tmp_path / "frames.npy"), verbose=False)
+
+
+def test_video_export_is_lossless(tmp_path, expected):
+    import cv2
+
+    try:
+        export(tmp_path / "frames.mkv")
+    except RuntimeError:
+        pytest.skip("this OpenCV build cannot write FFV1 video")
+    capture = cv2.VideoCapture(str(tmp_path / "frames.mkv"))
+    frames = []
+    while True:
+        ok, frame = capture.read()
+        if not ok:
+            break
+        frames.append(frame if frame.ndim == 2 else frame[..., 0])
+    np.testing.assert_array_equal(np.stack(frames), expected)
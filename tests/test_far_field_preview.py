@@ -0,0 +1,50 @@
+import time
+
+import numpy as np
+import pytest
+
+from display_sinks import MemorySink
+from far_field_preview import FarFieldCalculator, FarFieldPreview
+
+SIZE = 32
+
+
+def brightest(image):
+    return np.unravel_index(np.argmax(image), image.shape)
+
+
+def test_flat_phase_puts_all_light_in_the_zero_order():
+    image = FarFieldCalculator(SIZE)(np.full((SIZE, SIZE), 77, dtype=np.uint8))
+    assert image[SIZE // 2, SIZE // 2] == 255
+    assert np.count_nonzero(image) == 1  # Everything else is below the dynamic range
+
+
+def test_blazed_grating_steers_to_its_order():
+    columns = np.arange(SIZE * 2)
+    grating = np.tile((columns * 256 // 8) % 256, (SIZE * 2, 1)).astype(np.uint8)
+    # A period of 8 pixels, averaged 2 x 2, is a period of 4 in the computed field
+    image = FarFieldCalculator(SIZE, downsample=2)(grating)
+    assert brightest(image) == (SIZE // 2, SIZE // 2 + SIZE // 4)
+
+
+def test_preview_region_must_fit():
+    with pytest.raises(ValueError):
+        FarFieldPreview((40, 40), size=SIZE, downsample=2)
+
+
+def test_preview_computes_observed_frames_in_its_process():
+    frame = np.zeros((100, 120), dtype=np.uint8)
+    preview = FarFieldPreview(frame.shape, size=SIZE, downsample=1, sink_factory=MemorySink)
+    observed = 0
+    try:
+        # The preview computes whenever it is free; keep observing while it starts up
+        for _ in range(60):
+            assert preview.observe(frame) is frame
+            observed += 1
+            time.sleep(0.05)
+    finally:
+        report = preview.close()
+    assert report["observed"] == observed
+    assert report["computed"] >= 1
+    assert report["computed"] + report["skipped"] <= observed
+    assert report["last_frame"][SIZE // 2, SIZE // 2] == 255
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from benchmark_patterns import generator_cases
+from frame_sequence import render_pattern
+from phase_slm_pattern import PhasePatternGenerator, PhaseState, render_phase
+
+WIDTH, HEIGHT = 80, 60
+
+
+@pytest.fixture(scope="module")
+def mask_path(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("masks") / "mask.png")
+    rgb = np.random.default_rng(0).integers(0, 256, (8, 10, 3), dtype=np.uint8)
+    Image.fromarray(rgb).save(path)  # Colour input is converted to gray on load
+    return path
+
+
+def check(frame):
+    assert frame.shape == (HEIGHT, WIDTH) and frame.dtype == np.uint8
+
+
+def test_every_generator_renders_single_channel_frames(mask_path):
+    for name, render, states in generator_cases(WIDTH, HEIGHT, mask_path, frames=3):
+        for state in states:
+            check(render(state))
+
+
+@pytest.mark.parametrize(
+    "spec",
+    [
+        {"type": "gray", "value": 3},
+        {"type": "circle", "x_offset": 10, "y_offset": 10, "radius": 5},
+        {"type": "composite", "layers": [{"type": "gray", "value": 3}]},
+    ],
+)
+def test_sequence_entries_are_single_channel(spec):
+    check(render_pattern(spec, WIDTH, HEIGHT))
+
+
+def test_phase_patterns_are_single_channel():
+    state = PhaseState(grating_period_x=9, focal_length=1)
+    check(render_phase(state, PhasePatternGenerator(WIDTH, HEIGHT)))
@@ -0,0 +1,62 @@
+import time
+
+import pytest
+
+from frame_sequence import FrameBank, FrameStream, build_frame_bank, play_sequence, wait_until
+
+
+def test_wait_until_reaches_the_deadline():
+    for delay_s in (0.0005, 0.01):
+        deadline = time.perf_counter() + delay_s
+        wait_until(deadline)
+        assert 0 <= time.perf_counter() - deadline < 0.005
+
+
+def gray_sequence(n):
+    return [{"type": "gray", "value": value} for value in range(n)]
+
+
+def test_short_sequences_are_pre_rendered():
+    bank = build_frame_bank(gray_sequence(5), 8, 6)
+    assert isinstance(bank, FrameBank) and bank.capacity == 5
+    assert [bank[i][0, 0] for i in range(5)] == list(range(5))
+
+
+def test_long_sequences_stream_through_a_capped_ring():
+    stream = build_frame_bank(gray_sequence(10), 8, 6, max_bytes=3 * 8 * 6)
+    assert isinstance(stream, FrameStream)
+    assert stream.bank.capacity == 3 and len(stream.bank) == 3  # Filled up front
+    values = [stream[i % len(stream)][0, 0] for i in range(25)]
+    assert values == [i % 10 for i in range(25)]
+    with pytest.raises(IndexError):
+        stream[0]
+    stream.close()
+
+
+def test_stream_reports_render_errors():
+    stream = FrameStream(gray_sequence(3) + [{"type": "nope"}], 8, 6, capacity=2)
+    for i in range(3):
+        stream[i]
+    with pytest.raises(RuntimeError):
+        stream[3]
+    stream.close()
+
+
+class RecordingSink:
+    def __init__(self):
+        self.frames = []
+
+    def present(self, frame):
+        self.frames.append(frame[0, 0])
+
+    def wait_key(self, delay):
+        return -1
+
+
+def test_play_sequence_repeats_a_stream():
+    sink = RecordingSink()
+    stream = FrameStream(gray_sequence(4), 8, 6, capacity=2)
+    summary = play_sequence(sink, stream, fps=1000, repeat=3)
+    stream.close()
+    assert sink.frames == list(range(4)) * 3
+    assert summary["frames"] == 12
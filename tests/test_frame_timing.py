@@ -0,0 +1,51 @@
+import csv
+import io
+
+import numpy as np
+import pytest
+
+from frame_timing import FrameTimer, StatusPrinter
+
+
+def test_ring_keeps_the_newest_frames_in_order():
+    timer = FrameTimer(capacity=4)
+    for i in range(6):
+        timer.record(i * 0.1, render=i * 1e-3)
+    assert len(timer) == 4 and timer.count == 6
+    np.testing.assert_allclose(timer.ordered()[:, 0], [0.2, 0.3, 0.4, 0.5])
+
+
+def test_summary_in_milliseconds():
+    timer = FrameTimer()
+    for i in range(11):
+        timer.record(i * 0.02, render=0.004, present=0.001 * (i % 2), input_wait=0.01)
+    summary = timer.summary()
+    assert summary["frames"] == 11
+    assert summary["fps"] == pytest.approx(50)
+    assert summary["render"]["p50"] == pytest.approx(4)
+    assert summary["present"]["max"] == pytest.approx(1)
+    assert "11 frames, 50.0 frames/s" in timer.format_summary()
+    assert FrameTimer().format_summary() == "No frames recorded."
+
+
+def test_csv_numbers_frames_from_the_session_start(tmp_path):
+    timer = FrameTimer(capacity=2)
+    for i in range(3):
+        timer.record(i, render=0.002)
+    path = tmp_path / "timing.csv"
+    timer.dump_csv(str(path))
+    with open(path) as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == ["frame", "timestamp_s", "render_ms", "present_ms", "input_wait_ms"]
+    assert [row[0] for row in rows[1:]] == ["1", "2"]
+    assert rows[1][2] == "2.000"
+
+
+def test_status_lines_are_throttled_and_flushed():
+    stream = io.StringIO()
+    printer = StatusPrinter(max_rate_hz=0.001, stream=stream)
+    for i in range(5):
+        printer.update(f"line {i}")
+    assert stream.getvalue() == "line 0\n"  # The others arrived within the interval
+    printer.flush(force=True)
+    assert stream.getvalue() == "line 0\nline 4\n"
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from geometry import GeometryStage
+from phase_lut import PhaseLUT
+from repeat_pattern import PatternTiler
+from send_repeated_slm_pattern import TiledMaskState, render_tiled_mask
+
+
+def orient(frame, flip_horizontal, flip_vertical, quarter_turns):
+    # Reference: strided flips, then counter-clockwise quarter turns
+    if flip_horizontal:
+        frame = frame[:, ::-1]
+    if flip_vertical:
+        frame = frame[::-1]
+    return np.rot90(frame, quarter_turns)
+
+
+# Odd turns of a non-square frame go through the remap instead
+@pytest.mark.parametrize(
+    "shape, quarter_turns", [((6, 8), 0), ((6, 8), 2), ((7, 7), 1), ((7, 7), 3)]
+)
+@pytest.mark.parametrize("flip_horizontal", [False, True])
+@pytest.mark.parametrize("flip_vertical", [False, True])
+def test_flips_and_turns_match_orient(shape, flip_horizontal, flip_vertical, quarter_turns):
+    frame = np.arange(np.prod(shape), dtype=np.uint8).reshape(shape)
+    stage = GeometryStage(flip_horizontal, flip_vertical, quarter_turns)
+    out = stage.apply(frame)
+    expected = orient(frame, flip_horizontal, flip_vertical, quarter_turns)
+    np.testing.assert_array_equal(out, expected)
+    # The LUT reads a contiguous frame, never a negative-stride view
+    assert out.flags.c_contiguous
+
+
+def test_lut_applies_geometry_before_regions():
+    frame = np.arange(12, dtype=np.uint8).reshape(3, 4)
+    lut = PhaseLUT(np.arange(256), [(0, 0, 1, 1, np.full(256, 99))], GeometryStage(True))
+    out = lut.apply(frame)
+    assert out[0, 0] == 99
+    np.testing.assert_array_equal(out[:, 1:], frame[:, ::-1][:, 1:])
+
+
+@pytest.mark.parametrize("cell_width", [8, 9])
+def test_tiled_mask_flip_mirrors_about_the_offset(tmp_path, cell_width):
+    from PIL import Image
+
+    rng = np.random.default_rng(0)
+    path = str(tmp_path / "mask.png")
+    Image.fromarray(rng.integers(0, 256, (6, cell_width), dtype=np.uint8)).save(path)
+    tiler = PatternTiler(path, 64, 48)
+    state = TiledMaskState(30, 20, delta_index=1)
+    plain = render_tiled_mask(state, tiler).copy()
+
+    flipped = render_tiled_mask(TiledMaskState(30, 20, 1, flip_horizontal=True), tiler)
+    columns = np.arange(64)
+    mirror = 2 * 30 - columns
+    inside = (mirror >= 0) & (mirror < 64)
+    np.testing.assert_array_equal(flipped[:, columns[inside]], plain[:, mirror[inside]])
+
+    flipped = render_tiled_mask(TiledMaskState(30, 20, 1, flip_vertical=True), tiler)
+    rows = np.arange(48)
+    mirror = 2 * 20 - rows
+    inside = (mirror >= 0) & (mirror < 48)
+    np.testing.assert_array_equal(flipped[rows[inside]], plain[mirror[inside]])
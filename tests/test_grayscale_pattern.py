@@ -0,0 +1,23 @@
+from dataclasses import replace
+
+import numpy as np
+import pytest
+
+from grayscale_slm_pattern import GrayscaleRenderer, GrayscaleState, render_grayscale
+
+WIDTH, HEIGHT = 320, 240
+
+
+def test_incremental_frames_match_fresh_renders():
+    # The square passes over the label many times; the label must not build up
+    renderer = GrayscaleRenderer(WIDTH, HEIGHT)
+    state = GrayscaleState(160, 120, half_side=20, gray_value=100)
+    walk = [replace(state, x_center=x, y_center=y) for x in range(0, 200, 7) for y in (20, 40)]
+    walk += [replace(walk[-1], gray_value=200), replace(walk[-1], gray_value=200, x_center=30)]
+    for step in walk:
+        np.testing.assert_array_equal(renderer.render(step), render_grayscale(step, WIDTH, HEIGHT))
+
+
+def test_gray_value_is_range_checked():
+    with pytest.raises(ValueError):
+        GrayscaleState(0, 0, gray_value=256)
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from hologram import METRICS, HologramEngine, design_masks, fft2, gray_to_phase, phase_to_gray
+
+
+@pytest.mark.parametrize("dtype", [np.complex64, np.complex128])
+def test_fft2_is_unitary_and_in_place(dtype):
+    rng = np.random.default_rng(0)
+    original = (rng.normal(size=(2, 12, 10)) + 1j * rng.normal(size=(2, 12, 10))).astype(dtype)
+    field = original.copy()
+    assert fft2(field) is field
+    np.testing.assert_allclose(field, np.fft.fft2(original, norm="ortho"), atol=1e-4)
+    fft2(field, inverse=True)
+    np.testing.assert_allclose(field, original, atol=1e-4)
+
+
+@pytest.mark.parametrize("inverse", [False, True])
+def test_threaded_fft2_matches_numpy(inverse):
+    rng = np.random.default_rng(1)
+    shape = (2, 256, 160)  # Large enough to be split across threads
+    original = (rng.normal(size=shape) + 1j * rng.normal(size=shape)).astype(np.complex128)
+    reference = (np.fft.ifft2 if inverse else np.fft.fft2)(original, norm="ortho")
+    field = original.copy()
+    assert fft2(field, inverse=inverse, workers=3) is field
+    np.testing.assert_allclose(field, reference, atol=1e-9)
+
+
+def test_final_metrics_describe_the_returned_masks():
+    target = np.zeros((16, 16), dtype=np.float32)
+    target[4, 4] = target[4, 11] = target[11, 7] = 1
+    masks, metrics = design_masks(target, iterations=5, seed=0)
+    assert metrics["efficiency"].shape == (5, 1)
+
+    engine = HologramEngine(target.shape)
+    engine.run(target, iterations=1, seed=0)
+    final = engine.evaluate(gray_to_phase(masks)[None])
+    for name in METRICS:
+        assert metrics[name][-1, 0] == pytest.approx(final[name][0], rel=1e-5)
+    # Most of the light ends up in the spots
+    assert metrics["efficiency"][-1, 0] > 0.7
+
+
+def test_masks_round_like_the_phase_generator():
+    from phase_slm_pattern import PhasePatternGenerator
+
+    # A vortex evaluated by the generator and as radians must give the same levels
+    generator = PhasePatternGenerator(40, 30)
+    expected = generator.clear().add_vortex(1).to_uint8()
+    y, x = np.mgrid[:30, :40].astype(np.float32) - np.float32([[[15]], [[20]]])
+    phase = np.arctan2(y, x)
+    gray = phase_to_gray(phase)
+    error = (gray.astype(int) - expected + 128) % 256 - 128
+    assert np.count_nonzero(error) <= 0.01 * gray.size and np.abs(error).max() <= 1
+    levels = np.float32([0.49, 0.51, -0.51, 255.6])
+    assert phase_to_gray(levels * np.float32(2 * np.pi / 256)).tolist() == [0, 1, 255, 0]
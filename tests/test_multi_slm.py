@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from display_sinks import MemorySink
+from multi_slm import MultiScreenPresenter, flip_skew_ms, play_sequences_on_screens
+
+
+def memory_sink(screen, index):
+    # Module level, so spawned presenter processes can unpickle it
+    return MemorySink()
+
+
+def test_paired_frames_reach_every_screen():
+    presenter = MultiScreenPresenter([0, 1], memory_sink, slots=2)
+    try:
+        assert presenter.shapes == [(240, 320), (360, 640)]
+        for value in range(5):
+            frames = [np.full(shape, value, dtype=np.uint8) for shape in presenter.shapes]
+            presenter.present(frames)
+            frames[0].fill(99)  # Frames are copied; the caller may reuse them
+        assert presenter.wait_key(1) == -1
+    finally:
+        reports = presenter.close()
+    for report, shape in zip(reports, [(240, 320), (360, 640)]):
+        assert report["presented"] == 5
+        np.testing.assert_array_equal(report["last_frame"], np.full(shape, 4, np.uint8))
+    assert flip_skew_ms(reports) >= 0
+
+
+def test_present_checks_the_frame_count():
+    presenter = MultiScreenPresenter([0, 1], memory_sink)
+    try:
+        with pytest.raises(ValueError):
+            presenter.present([np.zeros((240, 320), np.uint8)])
+    finally:
+        presenter.close()
+
+
+def test_sequences_play_in_lockstep():
+    sequences = [[{"type": "gray", "value": v} for v in (10, 20, 30)] for _ in range(2)]
+    summary, reports = play_sequences_on_screens(
+        [0, 1], sequences, fps=200, repeat=2, sink_factory=memory_sink
+    )
+    assert summary["frames"] == 6
+    assert [report["presented"] for report in reports] == [6, 6]
+    assert all((report["last_frame"] == 30).all() for report in reports)
+
+
+def test_sequences_must_have_the_same_length():
+    with pytest.raises(ValueError):
+        play_sequences_on_screens([0, 1], [[{"type": "gray", "value": 1}], []])
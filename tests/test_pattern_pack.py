@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from frame_sequence import render_pattern
+from pattern_pack import build_pack
+from repeat_pattern import PatternTiler
+from send_repeated_slm_pattern import TiledMaskState, load_tilers, render_tiled_mask
+
+WIDTH, HEIGHT = 64, 48
+
+
+@pytest.fixture
+def masks(tmp_path):
+    rng = np.random.default_rng(0)
+    paths = []
+    for i, shape in enumerate([(6, 8), (9, 7), (12, 12)]):
+        path = tmp_path / f"mask{i}.png"
+        Image.fromarray(rng.integers(0, 256, shape, dtype=np.uint8)).save(path)
+        paths.append(str(path))
+    return paths
+
+
+@pytest.fixture
+def pack_path(tmp_path, masks):
+    path = str(tmp_path / "masks.slmpack")
+    build_pack(path, masks, workers=1)
+    return path
+
+
+def test_pack_tilers_share_one_buffer(pack_path, masks):
+    names, tilers = load_tilers(pack_path, WIDTH, HEIGHT)
+    assert names == ["mask0", "mask1", "mask2"]
+    assert all(tiler.buffer is tilers[0].buffer for tiler in tilers)
+    for index, path in enumerate(masks):
+        state = TiledMaskState(30.5, 20, mask_index=index)
+        expected = render_tiled_mask(state, PatternTiler(path, WIDTH, HEIGHT))
+        np.testing.assert_array_equal(render_tiled_mask(state, tilers[index]), expected)
+
+
+def test_sequence_masks_share_one_buffer(pack_path, masks):
+    renderers = {}
+    for name, path in zip(["mask0", "mask1"], masks):
+        spec = {"type": "mask", "pack": pack_path, "name": name, "x_offset": 20, "scale": 1}
+        frame = render_pattern(spec, WIDTH, HEIGHT, renderers)
+        assert frame is renderers["mask_buffer"]
+        expected = PatternTiler(path, WIDTH, HEIGHT).render(20, HEIGHT // 2)
+        np.testing.assert_array_equal(frame, expected)
+
+
+def test_buffer_shape_is_checked(masks):
+    with pytest.raises(ValueError):
+        PatternTiler(masks[0], WIDTH, HEIGHT, buffer=np.empty((HEIGHT, WIDTH + 1), np.uint8))
+
+
+def test_default_pack_serves_the_default_state_pre_tiled(tmp_path, masks):
+    path = str(tmp_path / "tiled.slmpack")
+    build_pack(path, masks[:1], resolutions=[(WIDTH, HEIGHT)], workers=1)
+    _, (tiler,) = load_tilers(path, WIDTH, HEIGHT)
+    state = TiledMaskState(WIDTH // 2, HEIGHT // 2)
+    assert render_tiled_mask(state, tiler) is tiler.prerendered[1]
+    expected = render_tiled_mask(state, PatternTiler(masks[0], WIDTH, HEIGHT))
+    np.testing.assert_array_equal(tiler.prerendered[1], expected)
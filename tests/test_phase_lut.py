@@ -0,0 +1,50 @@
+import json
+
+import numpy as np
+import pytest
+
+from phase_lut import PhaseLUT, load_lut
+
+FRAME = np.arange(48, dtype=np.uint8).reshape(6, 8) * 5
+INVERT = 255 - np.arange(256)
+
+
+def test_global_and_region_tables():
+    lut = PhaseLUT(INVERT, [(2, 1, 5, 4, np.zeros(256)), (4, 3, 8, 6, np.full(256, 7))])
+    out = lut.apply(FRAME)
+    expected = 255 - FRAME
+    expected[1:4, 2:5] = 0
+    expected[3:6, 4:8] = 7  # Later regions win where they overlap
+    np.testing.assert_array_equal(out, expected)
+    assert lut.apply(FRAME) is out  # The output buffer is reused
+
+
+def test_tables_are_rounded_clipped_and_checked():
+    lut = PhaseLUT(np.linspace(-10.4, 300, 256))
+    assert lut.lut[0] == 0 and lut.lut[-1] == 255
+    with pytest.raises(ValueError):
+        PhaseLUT(np.arange(255))
+
+
+@pytest.mark.parametrize("extension", [".npy", ".csv", ".txt", ".json"])
+def test_calibration_files(tmp_path, extension):
+    path = tmp_path / f"calibration{extension}"
+    if extension == ".npy":
+        np.save(path, INVERT)
+    elif extension == ".csv":
+        path.write_text(",".join(map(str, INVERT)))
+    elif extension == ".txt":
+        path.write_text("\n".join(map(str, INVERT)))
+    else:
+        region = {"rect": [0, 0, 2, 2], "lut": [9] * 256}
+        calibration = {"lut": INVERT.tolist(), "regions": [region]}
+        path.write_text(json.dumps(calibration))
+    out = load_lut(str(path)).apply(FRAME)
+    np.testing.assert_array_equal(out[2:], 255 - FRAME[2:])
+    if extension == ".json":
+        assert (out[:2, :2] == 9).all()
+
+
+def test_unsupported_calibration_file(tmp_path):
+    with pytest.raises(ValueError):
+        load_lut(str(tmp_path / "calibration.yaml"))
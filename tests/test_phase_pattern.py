@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from phase_slm_pattern import GRAY_LEVELS, PhasePatternGenerator, PhaseState, render_phase
+
+WIDTH, HEIGHT = 96, 64
+
+# Coordinates relative to the default centre, in float64
+Y, X = np.mgrid[:HEIGHT, :WIDTH] - np.array([HEIGHT / 2, WIDTH / 2])[:, None, None]
+
+
+def level_error(frame, phase):
+    # Wrapped difference in levels from `phase` (in waves) rounded to the nearest level
+    expected = np.rint(phase * GRAY_LEVELS)
+    return (frame.astype(int) - expected + GRAY_LEVELS // 2) % GRAY_LEVELS - GRAY_LEVELS // 2
+
+
+@pytest.mark.parametrize("period_x, period_y", [(0, 0), (7.3, 0), (0, 11.9), (7.3, -11.9)])
+def test_separable_grating_is_within_a_level(period_x, period_y):
+    state = PhaseState(grating_period_x=period_x, grating_period_y=period_y)
+    frame = render_phase(state, PhasePatternGenerator(WIDTH, HEIGHT))
+    phase = (X / period_x if period_x else 0) + (Y / period_y if period_y else 0)
+    error = level_error(frame, phase)
+    assert np.abs(error).max() <= 1
+    # The column phase is resolved to 1/16 level, which moves only a few pixels
+    assert np.count_nonzero(error) <= 0.05 * frame.size
+
+
+def test_horizontal_grating_is_exact():
+    frame = render_phase(PhaseState(grating_period_x=7.3), PhasePatternGenerator(WIDTH, HEIGHT))
+    assert not level_error(frame, X / 7.3).any()
+
+
+def test_dense_terms_round_to_nearest_level():
+    generator = PhasePatternGenerator(WIDTH, HEIGHT)
+    generator.clear(0.25).add_blazed_grating(9.1, 13.7).add_vortex(2)
+    generator.add_zernike({(2, 0): 0.4, (2, 2): 0.0, (3, 1): -0.3}, aperture_radius=30)
+    frame = generator.to_uint8()
+
+    rho, theta = np.hypot(X, Y) / 30, np.arctan2(Y, X)
+    phase = 0.25 + X / 9.1 + Y / 13.7 + theta / np.pi
+    phase += 0.4 * (2 * rho**2 - 1) - 0.3 * (3 * rho**3 - 2 * rho) * np.cos(theta)
+    error = level_error(frame, phase)
+    # float32 accumulation only moves pixels that sit near a half level
+    assert np.abs(error).max() <= 1
+    assert np.count_nonzero(error) <= 0.01 * frame.size
+
+
+def test_zero_terms_leave_the_frame_separable():
+    generator = PhasePatternGenerator(WIDTH, HEIGHT)
+    generator.clear().add_blazed_grating(7.3).add_vortex(0).add_zernike({(2, 0): 0}, 30)
+    assert not generator.expanded
+    plain = PhasePatternGenerator(WIDTH, HEIGHT).clear().add_blazed_grating(7.3)
+    np.testing.assert_array_equal(generator.to_uint8(), plain.to_uint8())
+
+
+def test_strong_lens_falls_back_to_wrapping_first():
+    generator = PhasePatternGenerator(WIDTH, HEIGHT)
+    frame = generator.clear().add_fresnel_lens(1e-7).to_uint8()
+    # Past the rounding trick's range the float32 phase is wrapped before the cast
+    assert generator.bound >= 2**22
+    expected = np.mod(np.rint(generator.phase.astype(np.float64)), GRAY_LEVELS)
+    np.testing.assert_array_equal(frame, expected)
@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from repeat_pattern import PatternTiler, repeat_image, shift_cell, tile_into
+
+WIDTH, HEIGHT = 50, 30
+
+
+@pytest.fixture
+def cell():
+    return np.random.default_rng(0).integers(0, 256, (6, 9), dtype=np.uint8)
+
+
+@pytest.fixture
+def mask_path(tmp_path, cell):
+    path = str(tmp_path / "mask.png")
+    Image.fromarray(cell).save(path)
+    return path
+
+
+def periodic(cell, row_start, col_start, shape=(HEIGHT, WIDTH)):
+    rows = (row_start + np.arange(shape[0]))[:, None] % cell.shape[0]
+    cols = (col_start + np.arange(shape[1]))[None, :] % cell.shape[1]
+    return cell[rows, cols]
+
+
+@pytest.mark.parametrize("start", [(0, 0), (4, -7), (-13, 22)])
+def test_tile_into_repeats_the_cell(cell, start):
+    out = np.empty((HEIGHT, WIDTH), dtype=np.uint8)
+    assert tile_into(cell, out, *start) is out
+    np.testing.assert_array_equal(out, periodic(cell, *start))
+
+
+def test_render_centres_a_cell_on_the_offset(mask_path, cell):
+    tiler = PatternTiler(mask_path, WIDTH, HEIGHT)
+    frame = tiler.render(x_offset=17, y_offset=11)
+    assert frame is tiler.buffer
+    np.testing.assert_array_equal(frame, periodic(cell, 6 // 2 - 11, 9 // 2 - 17))
+    assert frame[11, 17] == cell[3, 4]
+
+
+def test_render_reuses_decoded_and_resized_cells(mask_path, cell):
+    tiler = PatternTiler(mask_path, WIDTH, HEIGHT, cache_size=2)
+    tiler.render(scale=2)
+    resized = tiler.unit_cell(2)
+    assert resized.shape == (12, 18)
+    tiler.render(5, 5, scale=2)
+    assert tiler.unit_cell(2) is resized
+    assert tiler.unit_cell(1) is tiler.mask  # Scale 1 is the decoded mask itself
+
+
+def test_repeat_image_matches_the_tiler(mask_path):
+    expected = PatternTiler(mask_path, WIDTH, HEIGHT).render(20, 10)
+    np.testing.assert_array_equal(repeat_image(mask_path, WIDTH, HEIGHT, None, 20, 10), expected)
+
+
+@pytest.mark.parametrize("method", ["fourier", "linear", "cubic"])
+def test_whole_pixel_shifts_are_rolls(cell, method):
+    # The cell is periodic, so content leaving one edge comes back on the other
+    shifted = shift_cell(cell, 2, -1, method)
+    np.testing.assert_array_equal(shifted, np.roll(cell, (-1, 2), axis=(0, 1)))
+
+
+def test_half_pixel_shift_interpolates_neighbours():
+    ramp = np.tile(np.arange(0, 240, 30, dtype=np.uint8), (4, 1))
+    shifted = shift_cell(ramp, 0.5, 0, "linear")
+    # Away from the wrap-around, each pixel is the mean of its two neighbours
+    np.testing.assert_array_equal(shifted[:, 1:], ramp[:, :-1] + 15)
+
+
+def test_fractional_offset_tiles_the_shifted_cell(mask_path, cell):
+    tiler = PatternTiler(mask_path, WIDTH, HEIGHT)
+    frame = tiler.render(x_offset=17.25, y_offset=11.5).copy()
+    shifted = shift_cell(cell, 0.25, 0.5)
+    np.testing.assert_array_equal(frame, periodic(shifted, 6 // 2 - 11, 9 // 2 - 17))
+    # The same fraction at another offset reuses the cached shifted cell
+    cached = tiler.unit_cell(1, 0.25, 0.5)
+    moved = tiler.render(x_offset=20.25, y_offset=11.5)
+    np.testing.assert_array_equal(moved, periodic(shifted, 6 // 2 - 11, 9 // 2 - 20))
+    assert tiler.unit_cell(1, 0.25, 0.5) is cached
+
+
+def test_unknown_subpixel_method(cell):
+    with pytest.raises(ValueError):
+        shift_cell(cell, 0.5, 0, "nearest")
+
+
+@pytest.mark.parametrize("method", ["fourier", "linear", "cubic"])
+@pytest.mark.parametrize("dx, dy", [(0.25, 0), (0, 0.5), (0.7, 0.3)])
+def test_phase_ramps_shift_across_the_wrap(method, dx, dy):
+    # A blazed grating wraps from 255 to 0; it must shift as a phase, not an intensity
+    rows, cols = np.mgrid[:16, :32]
+    levels_per_px = (256 / 32, 256 / 16)
+    ramp = (cols * levels_per_px[0] + rows * levels_per_px[1]) % 256
+    shifted = shift_cell(ramp.astype(np.uint8), dx, dy, method).astype(int)
+    expected = ramp - dx * levels_per_px[0] - dy * levels_per_px[1]
+    error = (shifted - expected + 128) % 256 - 128
+    assert np.abs(error).max() <= 1
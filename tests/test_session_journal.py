@@ -0,0 +1,64 @@
+from dataclasses import dataclass
+
+import numpy as np
+import pytest
+
+from circular_slm_pattern import CircleState, display_image_with_keyboard_control
+from display_sinks import MemorySink
+from session_journal import JournalWriter, SessionJournal, replay_session
+
+
+@dataclass(frozen=True)
+class LabelState:
+    # Module level, so the journal can import it back by name
+    count: int
+    gain: float
+    enabled: bool
+    label: str
+
+
+def test_states_round_trip_with_strings_and_times(tmp_path):
+    path = str(tmp_path / "session.slmjournal")
+    states = [LabelState(i, i / 3, i % 2 == 0, ["a", "b", "ü"][i % 3]) for i in range(7)]
+    with JournalWriter(path, LabelState, {"pattern": "none"}) as writer:
+        for i, state in enumerate(states):
+            writer.record(state, timestamp_ns=writer.start_ns + i * 1_000_000)
+    journal = SessionJournal(path)
+    assert journal.state_type is LabelState
+    assert journal.context == {"pattern": "none"}
+    assert journal.states == states
+    np.testing.assert_allclose(journal.times, np.arange(7) * 1e-3)
+
+
+def test_truncated_journal_reads_complete_records(tmp_path):
+    path = tmp_path / "session.slmjournal"
+    with JournalWriter(str(path), LabelState) as writer:
+        for i in range(3):
+            writer.record(LabelState(i, 0.0, False, "x"))
+    path.write_bytes(path.read_bytes()[:-5])
+    assert len(SessionJournal(str(path))) == 2
+
+
+def test_not_a_journal(tmp_path):
+    path = tmp_path / "other.bin"
+    path.write_bytes(b"NOTAJRNL" + bytes(8))
+    with pytest.raises(ValueError):
+        SessionJournal(str(path))
+
+
+def test_replay_reproduces_a_recorded_session(tmp_path):
+    path = str(tmp_path / "circle.slmjournal")
+    # -1 between presses, so each press is its own frame
+    keys = [ord("d"), -1, ord("s"), -1, ord("="), -1]
+    live = MemorySink(capacity=4, keys=keys)
+    display_image_with_keyboard_control(
+        0, sink=live, state=CircleState(100, 80, 20), journal_path=path
+    )
+    journal = SessionJournal(path)
+    assert journal.states[-1] == CircleState(110, 90, 25)
+    assert journal.context["width"] == 320 and journal.context["height"] == 240
+
+    replayed = MemorySink(capacity=4)
+    summary = replay_session(path, replayed)
+    assert summary["frames"] == live.presented == 4
+    np.testing.assert_array_equal(replayed.frames, live.frames)
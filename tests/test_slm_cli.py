@@ -0,0 +1,38 @@
+import json
+
+import pytest
+
+import slm
+from benchmark_patterns import STARTUP_BUDGET_MS, cli_startup
+
+
+def write_config(tmp_path, config):
+    path = tmp_path / "lab.json"
+    path.write_text(json.dumps(config))
+    return str(path)
+
+
+def test_subcommand_section_overrides_shared_keys(tmp_path):
+    config = write_config(tmp_path, {"screen": 1, "x_offset": 700, "circle": {"x_offset": 812}})
+    args = slm.parse_args(["--config", config, "circle"])
+    assert (args.screen, args.x_offset) == (1, 812)
+    args = slm.parse_args(["--config", config, "double-slit"])
+    assert (args.screen, args.x_offset) == (1, 700)
+
+
+def test_command_line_overrides_config(tmp_path):
+    config = write_config(tmp_path, {"tile": {"image": "mask.png", "x_offset": 800}})
+    args = slm.parse_args(["tile", "--config", config, "--x-offset", "810"])
+    assert (args.image, args.x_offset) == ("mask.png", 810)
+
+
+def test_unknown_config_options_are_reported(tmp_path):
+    config = write_config(tmp_path, {"circle": {"colour": 3}})
+    with pytest.raises(SystemExit):
+        slm.parse_args(["--config", config, "circle"])
+
+
+def test_startup_is_within_budget_and_light():
+    startup = cli_startup(runs=5)
+    assert startup["heavy_imports"] == []
+    assert startup["median_ms"] <= STARTUP_BUDGET_MS